@@ -36,6 +36,10 @@ class AttributeInterceptor(object):
         if object_dict.get('id') is not None:
             self.objects[object_dict['id']] = object_dict
 
+    def createObjects(self, layer, records):
+        for object_dict, inst in records:
+            self.createObject(layer, object_dict, inst)
+
 data = None
 def loadMapFile(path, engine, callback=None):
     global data
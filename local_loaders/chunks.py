@@ -0,0 +1,156 @@
+#!/usr/bin/python
+
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Spatial chunks of a map. The XMLMapLoader can sort the plain scenery
+   instances of a map into square chunks instead of creating them. Blocking
+   scenery is never put into a chunk, so walls and obstacles are still
+   there for the pathfinding of NPCs far from the focus points. Only the
+   chunks around the focus points (the main camera and the PC) are then
+   instantiated, a few instances per frame, and chunks that fell out of
+   range are released again.
+
+   There should be NO references to FIFE here, creating and deleting the
+   instances is left to the functions passed in."""
+
+import math
+import time
+
+class MapChunks(object):
+    """The instance records of a map sorted by chunk, and the instances of
+       the chunks that are currently loaded. Every layer has chunks of its
+       own, in its own coordinates, so a chunk key is (layer id, x, y)."""
+    def __init__(self, size, create, delete, locate):
+        """@type size: float
+           @param size: Edge length of a chunk in layer coordinates
+           @type create: function
+           @param create: create(layer, record) makes and returns an instance
+           @type delete: function
+           @param delete: delete(layer, instance) removes an instance
+           @type locate: function
+           @param locate: locate(layer, x, y) converts a map position into
+                          the (x, y) layer coordinates of a layer"""
+        self.size = float(size)
+        self.create = create
+        self.delete = delete
+        self.locate = locate
+        # layer id -> layer
+        self.layers = {}
+        # chunk key -> list of records
+        self.chunks = {}
+        # chunk key -> list of instances created so far
+        self.loaded = {}
+        # chunk key -> index of the next record of a partly loaded chunk
+        self.progress = {}
+        # keys of the chunks still to be (completely) loaded, nearest first
+        self.pending = []
+        self.focus = None
+
+    def chunkKey(self, layer_id, x, y):
+        """@return: The key of the chunk containing the given position of
+                    a layer"""
+        return (layer_id, int(math.floor(x / self.size)),
+                int(math.floor(y / self.size)))
+
+    def add(self, layer, x, y, record):
+        """Stores an instance record in the chunk of its position.
+           @type x: float
+           @param x: Layer coordinate of the instance
+           @type y: float
+           @param y: Layer coordinate of the instance
+           @return: None"""
+        layer_id = layer.getId()
+        self.layers[layer_id] = layer
+        self.chunks.setdefault(self.chunkKey(layer_id, x, y), []).append(record)
+
+    def __len__(self):
+        return len(self.chunks)
+
+    def _distance(self, key, centres):
+        return min([max(abs(key[1] - cx), abs(key[2] - cy))
+                    for layer_id, cx, cy in centres if layer_id == key[0]])
+
+    def update(self, points, radius):
+        """Plans the chunk loads for the given focus points. Chunks up to
+           radius chunks away are queued for loading, chunks more than one
+           chunk further away are released at once. The distance is
+           measured on the layer of the chunk.
+           @type points: list
+           @param points: (x, y) positions in map coordinates
+           @type radius: integer
+           @param radius: Load distance, counted in chunks
+           @return: None"""
+        centres = []
+        for layer_id, layer in self.layers.items():
+            for x, y in points:
+                x, y = self.locate(layer, x, y)
+                centres.append(self.chunkKey(layer_id, x, y))
+        focus = (tuple(centres), radius)
+        if not points or focus == self.focus:
+            return
+        self.focus = focus
+
+        for key in self.loaded.keys():
+            if self._distance(key, centres) > radius + 1:
+                self.release(key)
+
+        wanted = {}
+        for layer_id, cx, cy in centres:
+            for kx in range(cx - radius, cx + radius + 1):
+                for ky in range(cy - radius, cy + radius + 1):
+                    key = (layer_id, kx, ky)
+                    if key in self.chunks and (key not in self.loaded or
+                                               key in self.progress):
+                        wanted[key] = self._distance(key, centres)
+        self.pending = sorted(wanted.keys(), key=wanted.get)
+
+    def release(self, key):
+        """Deletes the instances of a loaded chunk.
+           @return: None"""
+        layer = self.layers[key[0]]
+        for instance in self.loaded.pop(key, ()):
+            self.delete(layer, instance)
+        self.progress.pop(key, None)
+        if key in self.pending:
+            self.pending.remove(key)
+
+    def step(self, budget=None):
+        """Creates instances of the pending chunks, nearest chunk first.
+           @type budget: float
+           @param budget: Seconds to spend, None to load everything pending
+           @return: The number of instances created"""
+        if budget is not None:
+            deadline = time.time() + budget
+        created = 0
+        while self.pending:
+            key = self.pending[0]
+            layer = self.layers[key[0]]
+            records = self.chunks[key]
+            instances = self.loaded.setdefault(key, [])
+            index = self.progress.get(key, 0)
+            while index < len(records):
+                if budget is not None and created and time.time() > deadline:
+                    self.progress[key] = index
+                    return created
+                instances.append(self.create(layer, records[index]))
+                index += 1
+                created += 1
+            self.progress.pop(key, None)
+            self.pending.pop(0)
+        return created
+
+    def flush(self):
+        """Loads all pending chunks at once.
+           @return: The number of instances created"""
+        return self.step(None)
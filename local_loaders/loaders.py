@@ -17,15 +17,131 @@
 # It is part of the local code base now so we customize what happens as 
 # we read map files
 import fife
+import os
+import time
+try:
+    from hashlib import md5
+except ImportError:
+    from md5 import new as md5
+try:
+    import xml.etree.cElementTree as ET
+except:
+    import xml.etree.ElementTree as ET
 
 from xmlmap import XMLMapLoader
+from prefetch import map_prefetcher
 from serializers import WrongFileType, NameClash
 
 from serializers.xmlobject import XMLObjectLoader
 
 fileExtensions = ('xml',)
 
-def loadMapFile(path, engine, data, callback=None):
+class ImportRegistry(object):
+    """Keeps track of the object files that were already imported into the
+       FIFE model, so maps sharing imports do not open and parse them again.
+       Files are keyed by their normalized path; a file whose size or mtime
+       changed is only loaded again if its content hash changed as well.
+       The registry must be cleared whenever the model's objects are
+       deleted, as World.clearMaps does."""
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        """Forgets all imported files and resets the counters.
+           @return: None"""
+        # normalized path -> ((mtime, size), content digest)
+        self.files = {}
+        # the same for files found missing by isImported, so add does not
+        # have to read them again
+        self.pending = {}
+        self.digests = set()
+        self.hits = 0
+        self.misses = 0
+
+    def normalize(self, path):
+        """@return: The key used for the given import path"""
+        return os.path.normcase(os.path.normpath(path))
+
+    def _signature(self, path):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        return stat.st_mtime, stat.st_size
+
+    def _digest(self, path):
+        try:
+            f = open(path, 'rb')
+        except IOError:
+            return None
+        try:
+            return md5(f.read()).digest()
+        finally:
+            f.close()
+
+    def isImported(self, path):
+        """Checks whether the given file is already in the model. Counts a
+           hit or a miss.
+           @type path: string
+           @param path: Path of the object file
+           @rtype: boolean"""
+        key = self.normalize(path)
+        current = self._signature(path)
+        if key in self.files:
+            signature, digest = self.files[key]
+            if current == signature:
+                self.hits += 1
+                return True
+            # touched, but maybe not changed
+            known = digest
+            digest = self._digest(path)
+            if known is not None and digest == known:
+                self.files[key] = (current, digest)
+                self.hits += 1
+                return True
+        else:
+            # the same definitions may have been imported from another path
+            digest = self._digest(path)
+            if digest is not None and digest in self.digests:
+                self.files[key] = (current, digest)
+                self.hits += 1
+                return True
+        self.pending[key] = (current, digest)
+        self.misses += 1
+        return False
+
+    def add(self, path):
+        """Records that the given file is in the model now. The signature
+           and digest isImported found for it are used if there are any.
+           @return: None"""
+        key = self.normalize(path)
+        try:
+            signature, digest = self.pending.pop(key)
+        except KeyError:
+            signature, digest = self._signature(path), self._digest(path)
+        self.files[key] = (signature, digest)
+        if digest is not None:
+            self.digests.add(digest)
+
+# there is only one FIFE model, so one registry for the whole process
+import_registry = ImportRegistry()
+
+class PreparsedObjectLoader(XMLObjectLoader):
+    """XMLObjectLoader that registers an object file which was already
+       parsed, so only the model objects are created here."""
+    def loadParsed(self, path, root):
+        """@type path: string
+           @param path: Path of the object file
+           @type root: Element
+           @param root: The parsed root element of the file
+           @return: None"""
+        self.source = path
+        self.node = root
+        return self.parse_object(self.node)
+
+def loadMapFile(path, engine, data, callback=None, stream=False, cache=False,
+                import_workers=0, profile_file=None, chunk_size=0,
+                camera_prefix=''):
     """     load map file and get (an optional) callback if major stuff is done:
     - map creation
     - parsed impor0ts
@@ -38,19 +154,93 @@ def loadMapFile(path, engine, data, callback=None):
         path = filename for map
         engine = FIFE engine
         data = Engine object for PARPG data
+        stream = create instances while the file is read (iterparse)
+        cache = use (and refresh) the compiled map cache of the file
+        import_workers = threads used to pre-parse the imported files
+        profile_file = JSON-lines file the load profile is appended to
+        chunk_size = sort plain instances into chunks of this size
+        camera_prefix = put in front of the camera ids of the map
         
     @return    map    : map object
     """
-    map_loader = XMLMapLoader(engine, data, callback)
+    hits, misses = import_registry.hits, import_registry.misses
+    map_loader = XMLMapLoader(engine, data, callback, stream, cache,
+                              import_workers, chunk_size, camera_prefix)
     map = map_loader.loadResource(fife.ResourceLocation(path))
-    print "--- Loading map took: ", map_loader.time_to_load, " seconds."
+    _reportLoad(map_loader, profile_file, hits, misses)
     return map
 
-def loadImportFile(path, engine):
-    object_loader = XMLObjectLoader(engine.getImagePool(), engine.getAnimationPool(), engine.getModel(), engine.getVFS())
+def _reportLoad(map_loader, profile_file, hits, misses):
+    print "--- Loading map took: ", map_loader.time_to_load, " seconds."
+    print "--- Imports: ", import_registry.hits - hits, " already loaded, ", \
+          import_registry.misses - misses, " parsed."
+    if profile_file:
+        try:
+            map_loader.profile.writeJSONLines(profile_file)
+        except IOError, e:
+            print 'Could not write the load profile: ' + str(e)
+
+class MapLoad(object):
+    """A map load spread over several frames. The map file and its imports
+       are read and parsed on the map prefetcher's worker thread; once that
+       is done each call of step builds the next part of the map until its
+       time budget is used up. In stream mode the file is not parsed ahead,
+       the steps read it as they build the map. The callback is called as
+       in loadMapFile.
+       The times in the load profile are wall-clock times, so they include
+       the frames drawn in between."""
+    def __init__(self, path, engine, data, callback=None, stream=False,
+                 cache=False, import_workers=0, profile_file=None,
+                 chunk_size=0, camera_prefix=''):
+        """Starts reading the map, see loadMapFile for the arguments."""
+        self.path = path
+        self.profile_file = profile_file
+        self.map_loader = XMLMapLoader(engine, data, callback, stream, cache,
+                                       import_workers, chunk_size,
+                                       camera_prefix)
+        self.steps = None
+        self.done = False
+        self.map = None
+        self.hits = import_registry.hits
+        self.misses = import_registry.misses
+        if not stream:
+            map_prefetcher.prefetch(path, import_workers, cache)
+
+    def step(self, budget):
+        """Continues the load for about the given time.
+           @type budget: float
+           @param budget: Seconds the step may take
+           @return: True once the map is loaded"""
+        if self.done:
+            return True
+        if self.steps is None:
+            # nothing to build before the worker thread is done
+            if map_prefetcher.isLoading(self.path):
+                return False
+            self.steps = self.map_loader.loadSteps(fife.ResourceLocation(self.path))
+        deadline = time.time() + budget
+        for step in self.steps:
+            if time.time() > deadline:
+                return False
+        self.map = self.map_loader.map
+        self.done = True
+        _reportLoad(self.map_loader, self.profile_file, self.hits, self.misses)
+        return True
+
+def loadImportFile(path, engine, root=None):
+    """Imports an object file into the model, unless it is already there.
+       If root is given, it is the parsed root element of the file and the
+       file is not read again."""
+    if import_registry.isImported(path):
+        return None
     res = None
     try:
-        res = object_loader.loadResource(fife.ResourceLocation(path))
+        if root is None:
+            object_loader = XMLObjectLoader(engine.getImagePool(), engine.getAnimationPool(), engine.getModel(), engine.getVFS())
+            res = object_loader.loadResource(fife.ResourceLocation(path))
+        else:
+            object_loader = PreparsedObjectLoader(engine.getImagePool(), engine.getAnimationPool(), engine.getModel(), engine.getVFS())
+            res = object_loader.loadParsed(path, root)
         print 'imported object file ' + path
     except WrongFileType:
         pass
@@ -58,4 +248,38 @@ def loadImportFile(path, engine):
     except NameClash:
         pass
 #        print 'ignored already loaded file ' + path
+    # non-object files are remembered too, they would be ignored again
+    import_registry.add(path)
     return res
+
+def _parseFile(path):
+    """Reads and parses a file on a worker thread.
+       @return: The root element, or None if the file can't be read"""
+    try:
+        return ET.parse(path).getroot()
+    except Exception:
+        # the main thread reports the error through the normal loader
+        return None
+
+def preparseImportFiles(paths, workers):
+    """Reads and parses the given object files concurrently. Files the
+       import registry already knows are left out. Nothing touches the FIFE
+       model or the VFS here, both belong to the main thread.
+       @type paths: list
+       @param paths: Paths of the object files
+       @type workers: integer
+       @param workers: Number of worker threads
+       @return: Dictionary of path -> parsed root element"""
+    paths = [p for p in set(paths)
+             if import_registry.normalize(p) not in import_registry.files
+             and os.path.isfile(p)]
+    if not paths:
+        return {}
+    from multiprocessing.pool import ThreadPool
+    pool = ThreadPool(min(workers, len(paths)))
+    try:
+        roots = pool.map(_parseFile, paths)
+    finally:
+        pool.close()
+        pool.join()
+    return dict([(p, r) for p, r in zip(paths, roots) if r is not None])
@@ -0,0 +1,113 @@
+#!/usr/bin/python
+
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Timing breakdown of a single map load, filled in by the XMLMapLoader."""
+
+import time
+try:
+    import json
+except ImportError:
+    import simplejson as json
+
+class LoadProfile(object):
+    """Collects the time spent in each phase of a map load together with
+       the instance counts per layer."""
+    def __init__(self, source):
+        """@type source: string
+           @param source: Filename of the map being loaded"""
+        self.source = source
+        self.timestamp = time.time()
+        self.mode = 'xml'
+        self.total = 0.0
+        self.read = 0.0
+        self.parse = 0.0
+        # (file, seconds) in import order
+        self.imports = []
+        # dictionaries with id, time, instances, skipped in layer order
+        self.layers = []
+        self.objects = 0
+        self.object_time = 0.0
+        self.cameras = 0.0
+        self._layer = None
+
+    def addImport(self, file, seconds):
+        """Records the time one <import> took.
+           @return: None"""
+        self.imports.append((file, seconds))
+
+    def startLayer(self, id):
+        """Starts the instance creation phase of a layer.
+           @return: None"""
+        self._layer = {'id': id, 'time': time.time(), 'instances': 0,
+                       'skipped': 0}
+        self.layers.append(self._layer)
+
+    def endLayer(self):
+        """Ends the phase begun by startLayer.
+           @return: None"""
+        if self._layer is not None:
+            self._layer['time'] = time.time() - self._layer['time']
+            self._layer = None
+
+    def addInstance(self):
+        """Counts an instance created on the current layer.
+           @return: None"""
+        self._layer['instances'] += 1
+
+    def addSkipped(self):
+        """Counts an instance omitted because its object is missing.
+           @return: None"""
+        self._layer['skipped'] += 1
+
+    def addObjects(self, count, seconds):
+        """Records the creation of a batch of PARPG game objects.
+           @return: None"""
+        self.objects += count
+        self.object_time += seconds
+
+    def buildTime(self):
+        """@return: The seconds spent in the imports, layers and cameras"""
+        return (sum([t for f, t in self.imports]) +
+                sum([l['time'] for l in self.layers]) + self.cameras)
+
+    def toDict(self):
+        """@rtype: dict
+           @return: The report as plain python data"""
+        return {
+            'map': self.source,
+            'timestamp': self.timestamp,
+            'mode': self.mode,
+            'total': self.total,
+            'read': self.read,
+            'parse': self.parse,
+            'imports': [{'file': f, 'time': t} for f, t in self.imports],
+            'import_time': sum([t for f, t in self.imports]),
+            'layers': [dict(layer) for layer in self.layers],
+            'instances': sum([l['instances'] for l in self.layers]),
+            'skipped': sum([l['skipped'] for l in self.layers]),
+            'objects': {'count': self.objects, 'time': self.object_time},
+            'cameras': self.cameras,
+        }
+
+    def writeJSONLines(self, filename):
+        """Appends the report as one JSON line to the given file.
+           @type filename: string
+           @param filename: Name of the log file
+           @return: None"""
+        f = open(filename, 'a')
+        try:
+            f.write(json.dumps(self.toDict(), sort_keys=True) + '\n')
+        finally:
+            f.close()
@@ -0,0 +1,500 @@
+#!/usr/bin/python
+
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Compiled map cache. A map XML file is compiled into a binary sidecar
+   (<map file>.cache) holding a string table and fixed-size records for the
+   imports, layers, instances and cameras. The XMLMapLoader memory-maps the
+   sidecar and reads the records in place, so neither the XML parse nor the
+   string to number conversions have to be repeated on later loads.
+
+   There should be NO references to FIFE here, the compiler only needs the
+   XML file."""
+
+import os
+import mmap
+import struct
+try:
+    from hashlib import md5
+except ImportError:
+    from md5 import new as md5
+try:
+    import xml.etree.cElementTree as ET
+except:
+    import xml.etree.ElementTree as ET
+
+MAGIC = 'PARPGMAP'
+VERSION = 2
+
+# string index used for missing attributes
+NONE = 0xFFFFFFFF
+# integer used for missing rotation and stack position values
+MISSING_INT = -0x80000000
+
+# tags accepted for a single map instance
+INSTANCE_TAGS = ('i', 'inst', 'instance')
+
+MAP_ATTRIBUTES = ('id', 'format')
+IMPORT_ATTRIBUTES = ('file', 'dir')
+LAYER_ATTRIBUTES = ('id', 'grid_type', 'x_scale', 'y_scale', 'rotation',
+                    'x_offset', 'y_offset', 'pathing')
+CAMERA_ATTRIBUTES = ('id', 'zoom', 'tilt', 'rotation', 'ref_layer_id',
+                     'ref_cell_width', 'ref_cell_height', 'viewport')
+# PARPG specific instance attributes, stored only for instances with an
+# object_type
+OBJECT_ATTRIBUTES = ('object_type', 'is_open', 'locked', 'name', 'text',
+                     'target_map_name', 'target_map', 'target_x', 'target_y')
+
+# magic, version, xml mtime, xml size, xml md5, string count, then the
+# offset and count of the import, layer, instance, object and camera tables
+_HEADER = struct.Struct('<8sIdQ16sI' + 'II' * 5)
+# the xml mtime and size, rewritten when only the mtime changed
+_SIGNATURE = struct.Struct('<dQ')
+_SIGNATURE_OFFSET = struct.calcsize('<8sI')
+_STRING = struct.Struct('<II')
+_MAP = struct.Struct('<' + 'I' * len(MAP_ATTRIBUTES))
+_IMPORT = struct.Struct('<' + 'I' * len(IMPORT_ATTRIBUTES))
+_LAYER = struct.Struct('<' + 'I' * len(LAYER_ATTRIBUTES) + 'II')
+# object id, namespace, x, y, z, rotation, stack position, id, object record
+_INSTANCE = struct.Struct('<IIdddiiII')
+_OBJECT = struct.Struct('<' + 'I' * len(OBJECT_ATTRIBUTES))
+_CAMERA = struct.Struct('<' + 'I' * len(CAMERA_ATTRIBUTES))
+
+NAN = float('nan')
+
+# bytes read at once when a map file is hashed
+BLOCK_SIZE = 65536
+
+def cachePath(path):
+    """Returns the filename of the compiled cache for the given map file."""
+    return path + '.cache'
+
+def fileSignature(path):
+    """Returns the (mtime, size) pair used to validate a cache."""
+    stat = os.stat(path)
+    return stat.st_mtime, stat.st_size
+
+def fileHash(path):
+    """Returns the md5 digest of the given file."""
+    f = open(path, 'rb')
+    try:
+        digest = md5()
+        data = f.read(BLOCK_SIZE)
+        while data:
+            digest.update(data)
+            data = f.read(BLOCK_SIZE)
+        return digest.digest()
+    finally:
+        f.close()
+
+class HashingReader(object):
+    """Wraps a file that is read from start to end, and computes the md5
+       digest of the data on the way, so a map that is parsed does not have
+       to be read again to compile its cache."""
+    def __init__(self, f):
+        self.file = f
+        self.md5 = md5()
+
+    def read(self, size=-1):
+        data = self.file.read(size)
+        self.md5.update(data)
+        return data
+
+    def digest(self):
+        """@return: The md5 digest of the data read so far"""
+        return self.md5.digest()
+
+class _StringTable(object):
+    """Interns the strings of a map while it is compiled."""
+    def __init__(self):
+        self.strings = []
+        self.index = {}
+
+    def add(self, string):
+        if string is None:
+            return NONE
+        if string not in self.index:
+            self.index[string] = len(self.strings)
+            self.strings.append(string)
+        return self.index[string]
+
+def instanceElements(layer):
+    """Returns the instance elements of a layer in document order, which
+       is the order the XMLMapLoader creates them in: an instance without x
+       continues from the x of the one before it, whatever its tag.
+       @type layer: Element
+       @param layer: A <layer> element"""
+    instelt = layer.find('instances')
+    if instelt is None:
+        return []
+    return [inst for inst in instelt if inst.tag in INSTANCE_TAGS]
+
+def _float(value, default):
+    if value:
+        return float(value)
+    return default
+
+def _int(value):
+    if value:
+        return int(value)
+    return MISSING_INT
+
+class MapCompiler(object):
+    """Builds the tables of a map cache from the elements of a map file.
+       The elements are added in document order, so a map can be compiled
+       while it is streamed: nothing is kept of an element once it has been
+       added."""
+    def __init__(self):
+        self.strings = _StringTable()
+        self.map_record = None
+        self.imports = []
+        self.layers = []
+        self.instances = []
+        self.objects = []
+        self.cameras = []
+        self.layer_record = None
+
+    def startMap(self, map_elt):
+        """Adds the <map> element, only its attributes are used.
+           @return: None"""
+        self.map_record = _MAP.pack(*[self.strings.add(map_elt.get(a))
+                                      for a in MAP_ATTRIBUTES])
+
+    def addImport(self, elt):
+        """Adds an <import> element.
+           @return: None"""
+        self.imports.append(_IMPORT.pack(*[self.strings.add(elt.get(a))
+                                           for a in IMPORT_ATTRIBUTES]))
+
+    def startLayer(self, elt):
+        """Starts a <layer>; the instances added until endLayer belong to it.
+           @return: None"""
+        self.layer_record = [self.strings.add(elt.get(a))
+                             for a in LAYER_ATTRIBUTES]
+        self.layer_record.append(len(self.instances))
+
+    def addInstance(self, inst):
+        """Adds an instance element of the current layer.
+           @return: None"""
+        strings = self.strings
+        object_id = inst.get('object') or inst.get('obj') or inst.get('o')
+        nspace = inst.get('namespace') or inst.get('ns')
+        rotation = inst.get('r') or inst.get('rotation')
+        object_index = NONE
+        if inst.get('object_type'):
+            object_index = len(self.objects)
+            self.objects.append(_OBJECT.pack(*[strings.add(inst.get(a))
+                                               for a in OBJECT_ATTRIBUTES]))
+        self.instances.append(_INSTANCE.pack(strings.add(object_id),
+                                             strings.add(nspace),
+                                             _float(inst.get('x'), NAN),
+                                             _float(inst.get('y'), NAN),
+                                             _float(inst.get('z'), 0.0),
+                                             _int(rotation),
+                                             _int(inst.get('stackpos')),
+                                             strings.add(inst.get('id') or None),
+                                             object_index))
+
+    def endLayer(self):
+        """Finishes the current layer.
+           @return: None"""
+        record = self.layer_record
+        record.append(len(self.instances) - record[-1])
+        self.layers.append(_LAYER.pack(*record))
+        self.layer_record = None
+
+    def addCamera(self, elt):
+        """Adds a <camera> element.
+           @return: None"""
+        self.cameras.append(_CAMERA.pack(*[self.strings.add(elt.get(a))
+                                           for a in CAMERA_ATTRIBUTES]))
+
+    def write(self, path, digest=None):
+        """Writes the cache of a map file.
+           @type path: string
+           @param path: Filename of the map XML file
+           @type digest: string
+           @param digest: md5 digest of the map file, computed if not given
+           @return: The filename of the written cache"""
+        # string table: (offset, length) pairs followed by the utf-8 data
+        data = []
+        entries = []
+        offset = 0
+        for string in self.strings.strings:
+            if isinstance(string, unicode):
+                string = string.encode('utf-8')
+            entries.append(_STRING.pack(offset, len(string)))
+            data.append(string)
+            offset += len(string)
+
+        body = [self.map_record]
+        tables = []
+        position = _HEADER.size + len(self.map_record)
+        for records in (self.imports, self.layers, self.instances,
+                        self.objects, self.cameras):
+            tables.extend((position, len(records)))
+            body.extend(records)
+            position += sum([len(r) for r in records])
+        body.extend(entries)
+        body.extend(data)
+
+        mtime, size = fileSignature(path)
+        if digest is None:
+            digest = fileHash(path)
+        header = _HEADER.pack(MAGIC, VERSION, mtime, size, digest,
+                              len(self.strings.strings), *tables)
+
+        # write to a temporary file first so a reader never sees a partial
+        # cache
+        filename = cachePath(path)
+        tmp_name = filename + '.tmp'
+        f = open(tmp_name, 'wb')
+        try:
+            f.write(header)
+            f.write(''.join(body))
+        finally:
+            f.close()
+        if os.path.exists(filename):
+            os.remove(filename)
+        os.rename(tmp_name, filename)
+        return filename
+
+def compileMap(path, root=None):
+    """Compiles the given map file into its binary cache.
+       @type path: string
+       @param path: Filename of the map XML file
+       @type root: Element
+       @param root: The already parsed <map> element, if there is one
+       @return: The filename of the written cache"""
+    if root is None:
+        root = ET.parse(path).getroot()
+    compiler = MapCompiler()
+    compiler.startMap(root)
+    for elt in root.findall('import'):
+        compiler.addImport(elt)
+    for layer in root.findall('layer'):
+        compiler.startLayer(layer)
+        for inst in instanceElements(layer):
+            compiler.addInstance(inst)
+        compiler.endLayer()
+    for elt in root.findall('camera'):
+        compiler.addCamera(elt)
+    return compiler.write(path)
+
+class MapCache(object):
+    """Read-only view of a compiled map cache. The file is memory-mapped
+       and records are unpacked in place when they are requested."""
+    def __init__(self, filename, data=None):
+        """@type filename: string
+           @param filename: Name of the cache file
+           @type data: string
+           @param data: The contents of the cache, if they were read already
+                        (e.g. through the FIFE VFS); the file is mapped
+                        otherwise
+           @raise ValueError: The file is not a map cache of this version, or
+                              it is cut short"""
+        self.filename = filename
+        self.file = None
+        if data is not None:
+            self.data = data
+        else:
+            self.file = open(filename, 'rb')
+            try:
+                self.data = mmap.mmap(self.file.fileno(), 0,
+                                      access=mmap.ACCESS_READ)
+            except:
+                self.file.close()
+                raise
+        try:
+            self._readHeader()
+        except (ValueError, struct.error):
+            self.close()
+            raise ValueError('%s is not a complete version %d map cache' %
+                             (filename, VERSION))
+        self._strings = {}
+
+    def _readHeader(self):
+        header = _HEADER.unpack_from(self.data, 0)
+        if header[0] != MAGIC or header[1] != VERSION:
+            raise ValueError('wrong map cache version')
+        self.mtime, self.size, self.digest = header[2:5]
+        self.num_strings = header[5]
+        tables = header[6:]
+        (self._imports, self._layers, self._instances, self._objects,
+         self._cameras) = [(tables[i], tables[i + 1])
+                           for i in range(0, len(tables), 2)]
+        cameras_end = self._cameras[0] + self._cameras[1] * _CAMERA.size
+        self._string_entries = cameras_end
+        self._string_data = cameras_end + self.num_strings * _STRING.size
+        # a cut short file is noticed here rather than halfway through
+        # building a map
+        end = self._string_data
+        if self.num_strings:
+            offset, length = _STRING.unpack_from(self.data,
+                self._string_entries + (self.num_strings - 1) * _STRING.size)
+            end += offset + length
+        if end > len(self.data):
+            raise ValueError('map cache cut short')
+
+    def close(self):
+        """Releases the mapping and the file."""
+        if self.file is not None:
+            self.data.close()
+            self.file.close()
+
+    def matches(self, path):
+        """Checks whether the cache was compiled from the current contents of
+           the given map file. The file is only hashed if its modification
+           time changed. If the contents are still the same, the new time
+           is stored in the cache, so the next check does not hash again.
+           @rtype: boolean"""
+        mtime, size = fileSignature(path)
+        if size != self.size:
+            return False
+        if mtime == self.mtime:
+            return True
+        if fileHash(path) != self.digest:
+            return False
+        self.mtime = mtime
+        try:
+            f = open(self.filename, 'r+b')
+            try:
+                f.seek(_SIGNATURE_OFFSET)
+                f.write(_SIGNATURE.pack(mtime, size))
+            finally:
+                f.close()
+        except IOError:
+            # a read-only cache is still good, just checked more slowly
+            pass
+        return True
+
+    def string(self, index):
+        """Returns the interned string with the given index, or None."""
+        if index == NONE:
+            return None
+        try:
+            return self._strings[index]
+        except KeyError:
+            offset, length = _STRING.unpack_from(self.data,
+                self._string_entries + index * _STRING.size)
+            start = self._string_data + offset
+            string = self.data[start:start + length]
+            try:
+                string.decode('ascii')
+            except UnicodeDecodeError:
+                string = string.decode('utf-8')
+            self._strings[index] = string
+            return string
+
+    def _attributes(self, names, indices):
+        attributes = {}
+        for name, index in zip(names, indices):
+            if index != NONE:
+                attributes[name] = self.string(index)
+        return attributes
+
+    def _records(self, table, record, names):
+        offset, count = table
+        for i in xrange(count):
+            indices = record.unpack_from(self.data, offset + i * record.size)
+            yield self._attributes(names, indices)
+
+    def mapAttributes(self):
+        """@return: The attributes of the <map> element as a dictionary"""
+        return self._attributes(MAP_ATTRIBUTES,
+                                _MAP.unpack_from(self.data, _HEADER.size))
+
+    def imports(self):
+        """@return: Iterator over the attribute dictionaries of the imports"""
+        return self._records(self._imports, _IMPORT, IMPORT_ATTRIBUTES)
+
+    def cameras(self):
+        """@return: Iterator over the attribute dictionaries of the cameras"""
+        return self._records(self._cameras, _CAMERA, CAMERA_ATTRIBUTES)
+
+    def layers(self):
+        """@return: Iterator over (attributes, first instance, instance
+                    count) tuples, one per layer"""
+        offset, count = self._layers
+        num_attributes = len(LAYER_ATTRIBUTES)
+        for i in xrange(count):
+            record = _LAYER.unpack_from(self.data, offset + i * _LAYER.size)
+            yield (self._attributes(LAYER_ATTRIBUTES, record[:num_attributes]),
+                   record[num_attributes], record[num_attributes + 1])
+
+    def instances(self, first, count):
+        """Iterates over a range of the instance table. Missing values are
+           None, except for a missing id which is ''. x and y keep the
+           values they have in the file, so a missing one is None as well.
+           @return: Iterator over (object id, namespace, x, y, z, rotation,
+                    stack position, id, object attributes) tuples. The
+                    object attributes are a dictionary for instances with
+                    an object_type and None otherwise"""
+        offset = self._instances[0] + first * _INSTANCE.size
+        string = self.string
+        for i in xrange(count):
+            (object_id, nspace, x, y, z, rotation, stackpos, inst_id,
+             obj) = _INSTANCE.unpack_from(self.data, offset + i * _INSTANCE.size)
+            if x != x:
+                x = None
+            if y != y:
+                y = None
+            if rotation == MISSING_INT:
+                rotation = None
+            if stackpos == MISSING_INT:
+                stackpos = None
+            attributes = None
+            if obj != NONE:
+                attributes = self._attributes(OBJECT_ATTRIBUTES,
+                    _OBJECT.unpack_from(self.data,
+                                        self._objects[0] + obj * _OBJECT.size))
+            yield (string(object_id), string(nspace), x, y, z, rotation,
+                   stackpos, string(inst_id) or '', attributes)
+
+def _readVFS(vfs, filename):
+    """Returns the contents of a file read through the FIFE VFS."""
+    f = vfs.open(filename)
+    f.thisown = 1
+    return f.read()
+
+def openMapCache(path, vfs=None):
+    """Opens the compiled cache of the given map file if it exists and is
+       up to date. Caches that are damaged or cut short count as missing.
+       @type path: string
+       @param path: Filename of the map XML file
+       @type vfs: fife.VFS
+       @param vfs: Used for maps that are not plain files, e.g. maps in an
+                   archive. Their cache is read into memory and checked
+                   against the md5 digest of the map.
+       @return: A MapCache or None"""
+    filename = cachePath(path)
+    if os.path.exists(filename) and os.path.exists(path):
+        try:
+            cache = MapCache(filename)
+        except (IOError, ValueError, struct.error, mmap.error):
+            return None
+        try:
+            if cache.matches(path):
+                return cache
+        except OSError:
+            pass
+        cache.close()
+    elif vfs is not None and vfs.exists(filename):
+        try:
+            cache = MapCache(filename, _readVFS(vfs, filename))
+        except ValueError:
+            return None
+        if md5(_readVFS(vfs, path)).digest() == cache.digest:
+            return cache
+    return None
@@ -0,0 +1,143 @@
+#!/usr/bin/python
+
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Background prefetching of maps. While the PC walks towards a door the
+   target map file and the object files it imports are read and parsed on a
+   background thread. The XMLMapLoader takes the staged result when the map
+   is loaded, so only the FIFE model work is left for the main thread."""
+
+import os
+import threading
+try:
+    import xml.etree.cElementTree as ET
+except:
+    import xml.etree.ElementTree as ET
+
+import mapcache
+from serializers import reverse_root_subfile
+
+class StagedMap(object):
+    """The parsed data of a prefetched map"""
+    def __init__(self, path):
+        self.path = path
+        # the parsed <map> element, None if the map cache is used instead
+        self.root = None
+        # object file path -> parsed root element
+        self.imports = {}
+
+class MapPrefetcher(object):
+    """Parses maps on background threads and keeps the results until the
+       loader asks for them."""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.threads = {}
+        self.staged = {}
+
+    def prefetch(self, path, import_workers=0, cache=False):
+        """Starts prefetching the given map file, unless that already
+           happened.
+           @type path: string
+           @param path: Filename of the map
+           @type import_workers: integer
+           @param import_workers: Threads used to parse the imported files
+           @type cache: boolean
+           @param cache: Whether the map's compiled cache is used, as the
+                         MapCache setting says
+           @return: None"""
+        self.lock.acquire()
+        try:
+            if path in self.staged or path in self.threads:
+                return
+            thread = threading.Thread(target=self._run,
+                                      args=(path, import_workers, cache))
+            thread.setDaemon(True)
+            self.threads[path] = thread
+        finally:
+            self.lock.release()
+        thread.start()
+
+    def _run(self, path, import_workers, cache):
+        staged = None
+        try:
+            staged = self._stage(path, import_workers, cache)
+        except Exception, e:
+            # the map is simply loaded the normal way
+            print 'Prefetching ' + path + ' failed: ' + str(e)
+        self.lock.acquire()
+        try:
+            if path in self.threads:
+                del self.threads[path]
+                if staged is not None:
+                    self.staged[path] = staged
+        finally:
+            self.lock.release()
+
+    def _stage(self, path, import_workers, use_cache):
+        import loaders
+        staged = StagedMap(path)
+        cache = None
+        if use_cache:
+            cache = mapcache.openMapCache(path)
+        if cache is not None:
+            try:
+                items = list(cache.imports())
+            finally:
+                cache.close()
+        else:
+            staged.root = ET.parse(path).getroot()
+            items = staged.root.findall('import')
+        files = []
+        for item in items:
+            file = item.get('file')
+            if file and not item.get('dir'):
+                files.append(reverse_root_subfile(path, file))
+        staged.imports = loaders.preparseImportFiles(files,
+                                                     max(import_workers, 1))
+        return staged
+
+    def isLoading(self, path):
+        """@return: Whether a prefetch of the given map is still running"""
+        self.lock.acquire()
+        try:
+            return path in self.threads
+        finally:
+            self.lock.release()
+
+    def take(self, path):
+        """Returns the staged data of the given map and forgets it. A
+           prefetch of the map that is still running is not waited for, the
+           map is then simply loaded without it.
+           @type path: string
+           @param path: Filename of the map
+           @return: A StagedMap or None"""
+        self.lock.acquire()
+        try:
+            return self.staged.pop(path, None)
+        finally:
+            self.lock.release()
+
+    def retain(self, paths):
+        """Drops the staged maps that are not in the given list, e.g.
+           because they are no longer next to the current map.
+           @return: None"""
+        self.lock.acquire()
+        try:
+            for path in self.staged.keys():
+                if path not in paths:
+                    del self.staged[path]
+        finally:
+            self.lock.release()
+
+map_prefetcher = MapPrefetcher()
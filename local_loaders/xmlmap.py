@@ -18,19 +18,81 @@
 # as we read map files
 
 import fife 
+import os
 try:
     import xml.etree.cElementTree as ET
 except:
     import xml.etree.ElementTree as ET
 
+import chunks
 import loaders
+import loadprofile
+import mapcache
+import prefetch
 from serializers import *
 import time
 
 FORMAT = '1.0'
 
+# tags accepted for a single map instance
+INSTANCE_TAGS = mapcache.INSTANCE_TAGS
+# instances created per step of a stepwise load
+INSTANCE_STEP = 100
+# alternative names of the instance attributes, in order of preference
+OBJECT_KEYS = ('object', 'obj', 'o')
+NAMESPACE_KEYS = ('namespace', 'ns')
+ROTATION_KEYS = ('r', 'rotation')
+
+def _firstKey(shape, keys):
+    """Returns the first of the given attribute names that occurs in the
+       attribute names of an element."""
+    for key in keys:
+        if key in shape:
+            return key
+    return keys[0]
+
+def objectInfo(object):
+    """Looks up what every instance of an object shares.
+       @return: (object, default rotation, has a default action, blocks)"""
+    angles = object.get2dGfxVisual().getStaticImageAngles()
+    if angles:
+        rotation = angles[0]
+    else:
+        rotation = 0
+    return (object, rotation, bool(object.getAction('default')),
+            bool(object.isBlocking()))
+
+def placeInstance(layer, object, x, y, z, rotation, stackpos, id,
+                  default_action):
+    """Creates a FIFE instance of an object on a layer and starts its
+       default action, if it has one.
+       @return: The instance"""
+    inst = layer.createInstance(object, fife.ExactModelCoordinate(x,y,z), str(id))
+    inst.setRotation(rotation)
+
+    fife.InstanceVisual.create(inst)
+    if stackpos is not None:
+        inst.get2dGfxVisual().setStackPosition(stackpos)
+
+    if default_action:
+        target = fife.Location(layer)
+        inst.act('default', target, True)
+    return inst
+
+def _createChunkInstance(layer, record):
+    return placeInstance(layer, *record)
+
+def _deleteChunkInstance(layer, instance):
+    layer.deleteInstance(instance)
+
+def _locateChunkFocus(layer, x, y):
+    coords = layer.getCellGrid().toExactLayerCoordinates(
+        fife.ExactModelCoordinate(x, y))
+    return coords.x, coords.y
+
 class XMLMapLoader(fife.ResourceLoader):
-    def __init__(self, engine, data, callback):
+    def __init__(self, engine, data, callback, stream=False, cache=False,
+                 import_workers=0, chunk_size=0, camera_prefix=''):
         """ The XMLMapLoader parses the xml map using several section. 
         Each section fires a callback (if given) which can e. g. be
         used to show a progress bar.
@@ -38,10 +100,41 @@ class XMLMapLoader(fife.ResourceLoader):
         The callback sends two values, a string and a float (which shows
         the overall process): callback(string, float)
         
+        In stream mode the file is read with iterparse: instances are
+        created as their elements arrive and are then dropped from the
+        tree, so the whole document is never held in memory at once.
+
+        With cache set the loader uses the compiled map cache next to the
+        map file when it is up to date, and writes a new one after the XML
+        had to be read.
+
+        With more than one import worker all object files imported by the
+        map are read and parsed on a thread pool first; the main thread then
+        only creates the model objects. (Not in stream mode, where imports
+        are handled as they are read.) Maps staged by the map prefetcher
+        are taken from there instead of being read again.
+
+        With a chunk size the plain instances (no object_type and no id)
+        of objects that do not block are not created but sorted into
+        chunks of that size; the map's
+        chunks attribute then holds the chunks.MapChunks that creates them
+        on demand. It is None otherwise.
+
+        The camera prefix is put in front of the ids of the map's cameras,
+        so the cameras of several loaded maps can exist side by side.
+
+        Every load fills in a LoadProfile with the time spent in each phase;
+        it is kept as the loadProfile attribute of the loaded map.
+
         Inputs:
             engine = FIFE engine
             data = Engine object for PARPG data
             callback = function callback
+            stream = use the streaming (iterparse) loader
+            cache = read and write compiled map caches
+            import_workers = size of the import pre-parsing thread pool
+            chunk_size = edge length of the instance chunks, 0 for none
+            camera_prefix = prefix of the camera ids
         """
         fife.ResourceLoader.__init__(self)
         self.thisown = 0
@@ -57,6 +150,18 @@ class XMLMapLoader(fife.ResourceLoader):
         self.map = None
         self.source = None
         self.time_to_load = 0
+        self.stream = stream
+        self.cache = cache
+        self.import_workers = import_workers
+        self.preparsed = {}
+        self.profile = None
+        self.chunk_size = chunk_size
+        self.chunks = None
+        self.camera_prefix = camera_prefix
+        self.objects = {}
+        self.shapes = {}
+        # (attributes, instance) of the PARPG objects of the current layer
+        self.object_records = []
 
         self.nspace = None
 
@@ -64,20 +169,210 @@ class XMLMapLoader(fife.ResourceLoader):
         raise SyntaxError(''.join(['File: ', self.source, ' . ', msg]))
 
     def loadResource(self, location):
+        for step in self.loadSteps(location):
+            pass
+        return self.map
+
+    def loadSteps(self, location):
+        """Generator version of loadResource: the map is built in small
+           steps, with a yield after each one, so the caller can spread the
+           load over several frames. The loaded map is self.map afterwards.
+           @type location: fife.ResourceLocation
+           @param location: The map file"""
         start_time = time.time()
         self.source = location.getFilename()
-        f = self.vfs.open(self.source)
-        f.thisown = 1
-        tree = ET.parse(f)
-        root = tree.getroot()
-            
-        map = self.parseMap(root)
+        self.profile = loadprofile.LoadProfile(self.source)
+        # (object id, namespace) -> objectInfo() result, None if missing
+        self.objects = {}
+        # attribute names of an instance element -> names used for the
+        # object, namespace and rotation
+        self.shapes = {}
+        if self.chunk_size > 0:
+            self.chunks = chunks.MapChunks(self.chunk_size, _createChunkInstance,
+                                           _deleteChunkInstance,
+                                           _locateChunkFocus)
+        # use what a background prefetch already parsed
+        staged = prefetch.map_prefetcher.take(self.source)
+        if staged is not None:
+            self.preparsed = staged.imports
+        if self.cache:
+            phase_time = time.time()
+            cache = mapcache.openMapCache(self.source, self.vfs)
+            if cache is not None:
+                self.profile.mode = 'cache'
+                self.profile.read = time.time() - phase_time
+                try:
+                    for step in self.loadCachedMap(cache):
+                        yield step
+                finally:
+                    cache.close()
+                self.finishLoad(start_time)
+                return
+
+        root = None
+        compiler = None
+        if staged is not None and staged.root is not None:
+            self.profile.mode = 'prefetch'
+            root = staged.root
+            for step in self.parseMap(root):
+                yield step
+        else:
+            phase_time = time.time()
+            f = self.vfs.open(self.source)
+            f.thisown = 1
+            self.profile.read = time.time() - phase_time
+            phase_time = time.time()
+            if self.stream:
+                self.profile.mode = 'stream'
+                reader = f
+                if self.cache:
+                    # the cache is compiled from the streamed elements and
+                    # the data hashed as it is read
+                    reader = mapcache.HashingReader(f)
+                    compiler = mapcache.MapCompiler()
+                for step in self.streamMap(f, reader, compiler):
+                    yield step
+                # reading and building are interleaved, so the parse time
+                # is what is left after the other phases
+                self.profile.parse = max(time.time() - phase_time -
+                                         self.profile.buildTime(), 0.0)
+            else:
+                tree = ET.parse(f)
+                root = tree.getroot()
+                self.profile.parse = time.time() - phase_time
+                yield None
+                for step in self.parseMap(root):
+                    yield step
+
+        # maps read from an archive get no cache written next to them
+        if self.cache and self.map is not None and os.path.exists(self.source):
+            try:
+                if compiler is not None:
+                    compiler.write(self.source, reader.digest())
+                else:
+                    mapcache.compileMap(self.source, root)
+            except (IOError, OSError), e:
+                print 'Could not write the map cache for ' + self.source + ': ' + str(e)
+        self.finishLoad(start_time)
+
+    def finishLoad(self, start_time):
+        """Records the total load time and hands the profile to the map.
+           @return: None"""
         self.time_to_load = time.time() - start_time
-        return map
+        self.profile.total = self.time_to_load
+        if self.map is not None:
+            self.map.loadProfile = self.profile
+            self.map.chunks = self.chunks
 
     def parseMap(self, map_elt):
+        """Builds the map from the parsed <map> element. This is a
+           generator that yields after every step, see loadSteps."""
         if not map_elt:
             self._err('No <map> element found at top level of map file definition.')
+
+        if not self.createMap(map_elt):
+            return
+
+        for step in self.parseImports(map_elt, self.map):
+            yield step
+
+        for step in self.parseLayers(map_elt, self.map):
+            yield step
+
+        for step in self.parseCameras(map_elt, self.map):
+            yield step
+
+    def streamMap(self, f, reader=None, compiler=None):
+        """Builds the map while iterparse walks the file. Imports, layers
+           and cameras are handled in document order; every instance is
+           created on its end tag and then cleared away together with the
+           elements already processed. A generator that yields after each
+           import, layer and camera and every INSTANCE_STEP instances, like
+           parseMap.
+           @type f: fife.RawData
+           @param f: The opened map file
+           @type reader: file-like
+           @param reader: What the file is read through, f if not given
+           @type compiler: mapcache.MapCompiler
+           @param compiler: Gets every element before it is cleared away,
+                            None to compile no cache"""
+        context = iter(ET.iterparse(reader or f, events=('start', 'end')))
+        event, root = context.next()
+        if root.tag != 'map':
+            self._err('No <map> element found at top level of map file definition.')
+        if not self.createMap(root):
+            return
+        if compiler is not None:
+            compiler.startMap(root)
+
+        parsed_imports = {}
+        layer_obj = None
+        instances_elt = None
+        num_instances = 0
+        last_pos = 0
+        # only direct children of <map> (depth 1) are imports, layers
+        # and cameras
+        depth = 0
+
+        for event, elt in context:
+            if event == 'start':
+                depth += 1
+                if depth == 1 and elt.tag == 'layer':
+                    layer_obj = self.parseLayer(elt, self.map)
+                    if layer_obj is not None:
+                        self.profile.startLayer(elt.get('id'))
+                    if compiler is not None:
+                        compiler.startLayer(elt)
+                elif depth == 2 and elt.tag == 'instances':
+                    instances_elt = elt
+                continue
+
+            depth -= 1
+            if depth == 2 and elt.tag in INSTANCE_TAGS:
+                if instances_elt is not None and compiler is not None:
+                    compiler.addInstance(elt)
+                if instances_elt is not None and layer_obj is not None:
+                    self.parseInstance(elt, layer_obj)
+                    num_instances += 1
+                    # processed instances are dropped right away
+                    instances_elt.clear()
+                    if self.callback is not None:
+                        pos = f.getCurrentIndex()
+                        if pos != last_pos:
+                            last_pos = pos
+                            self.callback('loaded instances: ' + str(num_instances),
+                                          float(pos) / f.getDataLength())
+                    if num_instances % INSTANCE_STEP == 0:
+                        yield None
+            elif depth == 1 and elt.tag == 'instances':
+                instances_elt = None
+            elif depth == 0:
+                if elt.tag == 'import':
+                    self.parseImport(elt, self.map, parsed_imports)
+                    if compiler is not None:
+                        compiler.addImport(elt)
+                    yield None
+                elif elt.tag == 'layer':
+                    if compiler is not None:
+                        compiler.endLayer()
+                    if layer_obj is not None:
+                        self.createObjects(layer_obj)
+                    self.profile.endLayer()
+                    if layer_obj is not None and self.callback is not None:
+                        self.callback('loaded layer :' + str(elt.get('id')),
+                                      float(f.getCurrentIndex()) / f.getDataLength())
+                    layer_obj = None
+                    yield None
+                elif elt.tag == 'camera':
+                    self.parseCamera(elt, self.map)
+                    if compiler is not None:
+                        compiler.addCamera(elt)
+                    yield None
+                root.clear()
+
+    def createMap(self, map_elt):
+        """Creates the FIFE map declared by the <map> element.
+           @return: The map or None if it already exists"""
         id,format = map_elt.get('id'),map_elt.get('format')
 
         if not format == FORMAT: self._err(''.join(['This file has format ', format, ' but this loader has format ', FORMAT]))
@@ -98,250 +393,400 @@ class XMLMapLoader(fife.ResourceLoader):
         if self.callback is not None:
             self.callback('created map', float(0.25) )
 
-        self.parseImports(map_elt, self.map)
-        
-        self.parseLayers(map_elt, self.map)    
-        
-        self.parseCameras(map_elt, self.map)
-
         return self.map
 
     def parseImports(self, map_elt, map):
+        """Imports the object files of the map. A generator that yields after
+           every step, see loadSteps."""
         parsedImports = {}
 
-        if self.callback:        
-            tmplist = map_elt.findall('import')
-            i = float(0)
+        tmplist = map_elt.findall('import')
+        self.preparseImports(tmplist)
+        i = float(0)
         
-        for item in map_elt.findall('import'):
-            file = item.get('file')
-            if file:
-                file = reverse_root_subfile(self.source, file)
-            dir = item.get('dir')
-            if dir:
-                dir = reverse_root_subfile(self.source, dir)
-
-            # Don't parse duplicate imports
-            if (dir,file) in parsedImports:
-                print "Duplicate import:" ,(dir,file)
-                continue
-            parsedImports[(dir,file)] = 1
-
-            if file and dir:
-                loaders.loadImportFile('/'.join(dir, file), self.engine)
-            elif file:
-                loaders.loadImportFile(file, self.engine)
-            elif dir:
-                loaders.loadImportDirRec(dir, self.engine)
-                map.importDirs.append(dir)
-            else:
-                print 'Empty import statement?'
+        for item in tmplist:
+            self.parseImport(item, map, parsedImports)
                 
             if self.callback:
                 i += 1                
                 self.callback('loaded imports', float( i / float(len(tmplist)) * 0.25 + 0.25 ) )
+            yield None
+
+        self.preparsed = {}
+
+    def preparseImports(self, items):
+        """Parses the object files of the given import elements on the
+           import thread pool, if there is one. The results are picked up
+           by parseImport.
+           @return: None"""
+        if self.import_workers < 2:
+            return
+        files = []
+        for item in items:
+            file = item.get('file')
+            if file and not item.get('dir'):
+                file = reverse_root_subfile(self.source, file)
+                # files staged by a prefetch are parsed already
+                if file not in self.preparsed:
+                    files.append(file)
+        self.preparsed.update(loaders.preparseImportFiles(files, self.import_workers))
+
+    def parseImport(self, item, map, parsedImports):
+        file = item.get('file')
+        if file:
+            file = reverse_root_subfile(self.source, file)
+        dir = item.get('dir')
+        if dir:
+            dir = reverse_root_subfile(self.source, dir)
+
+        # Don't parse duplicate imports
+        if (dir,file) in parsedImports:
+            print "Duplicate import:" ,(dir,file)
+            return
+        parsedImports[(dir,file)] = 1
 
+        start_time = time.time()
+        if file and dir:
+            loaders.loadImportFile('/'.join(dir, file), self.engine)
+        elif file:
+            root = self.preparsed.pop(file, None)
+            if root is not None:
+                loaders.loadImportFile(file, self.engine, root)
+            else:
+                loaders.loadImportFile(file, self.engine)
+        elif dir:
+            loaders.loadImportDirRec(dir, self.engine)
+            map.importDirs.append(dir)
+        else:
+            print 'Empty import statement?'
+        self.profile.addImport(file or dir, time.time() - start_time)
 
     def parseLayers(self, map_elt, map):
+        """Creates the layers and their instances. A generator that yields after
+           every step, see loadSteps."""
         if self.callback is not None:        
             tmplist = map_elt.findall('layer')
             i = float(0)
 
         for layer in map_elt.findall('layer'):
-            id = layer.get('id')
-            grid_type = layer.get('grid_type')
-            x_scale = layer.get('x_scale')
-            y_scale = layer.get('y_scale')
-            rotation = layer.get('rotation')
-            x_offset = layer.get('x_offset')
-            y_offset = layer.get('y_offset')
-            pathing = layer.get('pathing')
-
-            if not x_scale: x_scale = 1.0
-            if not y_scale: y_scale = 1.0
-            if not rotation: rotation = 0.0
-            if not x_offset: x_offset = 0.0
-            if not y_offset: y_offset = 0.0
-            if not pathing: pathing = "cell_edges_only"
-
-            if not id: self._err('<layer> declared with no id attribute.')
-            if not grid_type: self._err(''.join(['Layer ', str(id), ' has no grid_type attribute.']))
-
-            allow_diagonals = pathing == "cell_edges_and_diagonals"
-            cellgrid = self.model.getCellGrid(grid_type)
-            if not cellgrid: self._err('<layer> declared with invalid cellgrid type. (%s)' % grid_type)
-
-            cellgrid.setRotation(float(rotation))
-            cellgrid.setXScale(float(x_scale))
-            cellgrid.setYScale(float(y_scale))
-            cellgrid.setXShift(float(x_offset))
-            cellgrid.setYShift(float(y_offset))
-
-            layer_obj = None
-            try:
-                layer_obj = map.createLayer(str(id), cellgrid)
-            except fife.Exception, e:
-                print e.getMessage()
-                print 'The layer ' + str(id) + ' already exists! Ignoring this layer.'
+            layer_obj = self.parseLayer(layer, map)
+            if layer_obj is None:
                 continue
 
-            strgy = fife.CELL_EDGES_ONLY
-            if pathing == "cell_edges_and_diagonals":
-                strgy = fife.CELL_EDGES_AND_DIAGONALS
-            if pathing == "freeform":
-                strgy = fife.FREEFORM
-            layer_obj.setPathingStrategy(strgy)
-
-            self.parseInstances(layer, layer_obj)
+            self.profile.startLayer(layer.get('id'))
+            for done in self.parseInstances(layer, layer_obj):
+                if self.callback is not None:
+                    self.callback('loading layer :' + str(layer.get('id')), float( (i + done) / float(len(tmplist)) * 0.25 + 0.5 ) )
+                yield None
+            self.createObjects(layer_obj)
+            self.profile.endLayer()
 
             if self.callback is not None:
                 i += 1
-                self.callback('loaded layer :' + str(id), float( i / float(len(tmplist)) * 0.25 + 0.5 ) )
+                self.callback('loaded layer :' + str(layer.get('id')), float( i / float(len(tmplist)) * 0.25 + 0.5 ) )
+            yield None
 
         # cleanup
         if self.callback is not None:
             del tmplist
             del i
 
-    def parseInstances(self, layerelt, layer):
-        instelt = layerelt.find('instances')
-
-        instances = instelt.findall('i')
-        instances.extend(instelt.findall('inst'))
-        instances.extend(instelt.findall('instance'))
-        for instance in instances:
-
-            objectID = instance.get('object')
-            if not objectID:
-                objectID = instance.get('obj')
-            if not objectID:
-                objectID = instance.get('o')
-
-            if not objectID: self._err('<instance> does not specify an object attribute.')
-
-            nspace = instance.get('namespace')
-            if not nspace:
-                nspace = instance.get('ns')
-            if not nspace:
-                nspace = self.nspace
+    def parseLayer(self, layer, map):
+        """Creates the FIFE layer declared by a <layer> element. Only the
+           element's attributes are used, its instances are not touched.
+           @return: The layer or None if it already exists"""
+        id = layer.get('id')
+        grid_type = layer.get('grid_type')
+        x_scale = layer.get('x_scale')
+        y_scale = layer.get('y_scale')
+        rotation = layer.get('rotation')
+        x_offset = layer.get('x_offset')
+        y_offset = layer.get('y_offset')
+        pathing = layer.get('pathing')
+
+        if not x_scale: x_scale = 1.0
+        if not y_scale: y_scale = 1.0
+        if not rotation: rotation = 0.0
+        if not x_offset: x_offset = 0.0
+        if not y_offset: y_offset = 0.0
+        if not pathing: pathing = "cell_edges_only"
+
+        if not id: self._err('<layer> declared with no id attribute.')
+        if not grid_type: self._err(''.join(['Layer ', str(id), ' has no grid_type attribute.']))
+
+        allow_diagonals = pathing == "cell_edges_and_diagonals"
+        cellgrid = self.model.getCellGrid(grid_type)
+        if not cellgrid: self._err('<layer> declared with invalid cellgrid type. (%s)' % grid_type)
+
+        cellgrid.setRotation(float(rotation))
+        cellgrid.setXScale(float(x_scale))
+        cellgrid.setYScale(float(y_scale))
+        cellgrid.setXShift(float(x_offset))
+        cellgrid.setYShift(float(y_offset))
+
+        layer_obj = None
+        try:
+            layer_obj = map.createLayer(str(id), cellgrid)
+        except fife.Exception, e:
+            print e.getMessage()
+            print 'The layer ' + str(id) + ' already exists! Ignoring this layer.'
+            return None
 
-            if not nspace: self._err('<instance> %s does not specify an object namespace, and no default is available.' % str(objectID))
+        strgy = fife.CELL_EDGES_ONLY
+        if pathing == "cell_edges_and_diagonals":
+            strgy = fife.CELL_EDGES_AND_DIAGONALS
+        if pathing == "freeform":
+            strgy = fife.FREEFORM
+        layer_obj.setPathingStrategy(strgy)
 
-            self.nspace = nspace
+        return layer_obj
 
+    def parseInstances(self, layerelt, layer):
+        """Creates the instances of a layer in document order, like stream
+           mode does. A generator that yields the fraction of the instances
+           done every INSTANCE_STEP instances."""
+        instances = mapcache.instanceElements(layerelt)
+        for start in range(0, len(instances), INSTANCE_STEP):
+            for instance in instances[start:start + INSTANCE_STEP]:
+                self.parseInstance(instance, layer)
+            yield float(min(start + INSTANCE_STEP, len(instances))) / len(instances)
+
+    def parseInstance(self, instance, layer):
+        """Creates the FIFE instance (and the PARPG object, if any) for a
+           single instance element.
+           @return: None"""
+        shape = tuple(instance.keys())
+        try:
+            object_key, nspace_key, rotation_key = self.shapes[shape]
+        except KeyError:
+            object_key, nspace_key, rotation_key = self.shapes[shape] = \
+                (_firstKey(shape, OBJECT_KEYS), _firstKey(shape, NAMESPACE_KEYS),
+                 _firstKey(shape, ROTATION_KEYS))
+
+        objectID = instance.get(object_key)
+        nspace = instance.get(nspace_key)
+
+        x = instance.get('x')
+        y = instance.get('y')
+        z = instance.get('z')
+        stackpos = instance.get('stackpos')
+        id = instance.get('id')
+
+        if x:
+            x = float(x)
+        else:
+            x = None
+
+        if y:
+            y = float(y)
+        else:
+            y = None
+
+        if z:
+            z = float(z)
+        else:
+            z = 0.0
+
+        if not id:
+            id = ''
+        else:
+            id = str(id)
+
+        rotation = instance.get(rotation_key)
+        if rotation:
+            rotation = int(rotation)
+        else:
+            rotation = None
+
+        if stackpos:
+            stackpos = int(stackpos)
+        else:
+            stackpos = None
+
+        attributes = None
+        if instance.get('object_type'):
+            attributes = instance
+
+        self.createInstance(layer, objectID, nspace, x, y, z, rotation,
+                            stackpos, id, attributes)
+
+    def createInstance(self, layer, objectID, nspace, x, y, z, rotation,
+                       stackpos, id, attributes):
+        """Creates a FIFE instance from already converted values. A missing
+           namespace falls back to the previous one, a missing x or y to
+           the previous instance's position and a missing rotation to the
+           object's first static image angle. What is looked up per object
+           is cached for the whole load. Plain instances of objects that
+           do not block only go into their chunk when the map is chunked.
+           @type attributes: dict-like
+           @param attributes: The PARPG specific attributes (object_type,
+                              name, ...) or None for plain instances. The
+                              PARPG object is created by createObjects
+                              once the layer is done.
+           @return: None"""
+        if not objectID: self._err('<instance> does not specify an object attribute.')
+
+        if not nspace:
+            nspace = self.nspace
+
+        if not nspace: self._err('<instance> %s does not specify an object namespace, and no default is available.' % str(objectID))
+
+        self.nspace = nspace
+
+        key = (objectID, nspace)
+        try:
+            info = self.objects[key]
+        except KeyError:
             object = self.model.getObject(str(objectID), str(nspace))
-            if not object:
+            if object:
+                info = objectInfo(object)
+            else:
                 print ''.join(['Object with id=', str(objectID), ' ns=', str(nspace), ' could not be found. Omitting...'])
+                info = None
+            self.objects[key] = info
+        if info is None:
+            self.profile.addSkipped()
+            return
+        object, default_rotation, default_action, blocking = info
+        if rotation is None:
+            rotation = default_rotation
+
+        if x is not None:
+            self.x = x
+        else:
+            self.x = self.x + 1
+            x = self.x
+
+        if y is not None:
+            self.y = y
+        else:
+            y = self.y
+
+        # blocking scenery stays loaded, pathfinding needs it everywhere
+        if self.chunks is not None and attributes is None and not id and \
+                not blocking:
+            self.chunks.add(layer, x, y, (object, x, y, z, rotation, stackpos,
+                                          id, default_action))
+            self.profile.addInstance()
+            return
+
+        inst = placeInstance(layer, object, x, y, z, rotation, stackpos, id,
+                             default_action)
+
+        #Check for PARPG specific object attributes
+        if attributes is not None:
+            inst_dict = {}
+            inst_dict["type"] = attributes.get('object_type')
+            inst_dict["id"] = id
+            inst_dict["xpos"] = x
+            inst_dict["ypos"] = y
+            inst_dict["gfx"] = objectID
+            inst_dict["is_open"] = attributes.get('is_open')
+            inst_dict["locked"] = attributes.get('locked')
+            inst_dict["name"] = attributes.get('name')
+            inst_dict["text"] = attributes.get('text')
+            inst_dict["target_map_name"] = attributes.get('target_map_name')
+            inst_dict["target_map"] = attributes.get('target_map')
+            inst_dict["target_pos"] = (attributes.get('target_x'), attributes.get('target_y'))
+            self.object_records.append((inst_dict, inst))
+        self.profile.addInstance()
+
+    def createObjects(self, layer):
+        """Hands the PARPG objects collected while the instances of a layer
+           were created to the engine, as one batch.
+           @return: None"""
+        if not self.object_records:
+            return
+        records = self.object_records
+        self.object_records = []
+        start_time = time.time()
+        self.data.createObjects(layer, records)
+        self.profile.addObjects(len(records), time.time() - start_time)
+
+    def loadCachedMap(self, cache):
+        """Builds the map from a compiled map cache instead of the XML.
+           Records are read straight out of the mapped file.
+           This is a generator that yields after every step, see
+           loadSteps.
+           @type cache: mapcache.MapCache
+           @param cache: The up to date cache of the map file"""
+        if not self.createMap(cache.mapAttributes()):
+            return
+
+        parsed_imports = {}
+        imports = list(cache.imports())
+        self.preparseImports(imports)
+        for item in imports:
+            self.parseImport(item, self.map, parsed_imports)
+            yield None
+        self.preparsed = {}
+
+        layers = list(cache.layers())
+        for i, (attributes, first, count) in enumerate(layers):
+            layer_obj = self.parseLayer(attributes, self.map)
+            if layer_obj is None:
                 continue
+            self.profile.startLayer(attributes.get('id'))
+            for start in range(first, first + count, INSTANCE_STEP):
+                for values in cache.instances(start, min(INSTANCE_STEP, first + count - start)):
+                    self.createInstance(layer_obj, *values)
+                yield None
+            self.createObjects(layer_obj)
+            self.profile.endLayer()
+            if self.callback is not None:
+                self.callback('loaded layer :' + str(attributes.get('id')), float( (i + 1) / float(len(layers)) * 0.5 + 0.25 ) )
+            yield None
 
-            x = instance.get('x')
-            y = instance.get('y')
-            z = instance.get('z')
-            stackpos = instance.get('stackpos')
-            id = instance.get('id')
-
-            if x:
-                x = float(x)
-                self.x = x
-            else:
-                self.x = self.x + 1
-                x = self.x
-
-            if y:
-                y = float(y)
-                self.y = y
-            else:
-                y = self.y
-
-            if z:
-                z = float(z)
-            else:
-                z = 0.0
-
-            if not id:
-                id = ''
-            else:
-                id = str(id)
-
-            inst = layer.createInstance(object, fife.ExactModelCoordinate(x,y,z), str(id))
-
-            rotation = instance.get('r')
-            if not rotation:
-                rotation = instance.get('rotation')
-            if not rotation:
-                angles = object.get2dGfxVisual().getStaticImageAngles()
-                if angles:
-                    rotation = angles[0]
-                else:
-                    rotation = 0
-            else:
-                rotation = int(rotation)
-            inst.setRotation(rotation)
-
-            fife.InstanceVisual.create(inst)
-            if (stackpos):
-                inst.get2dGfxVisual().setStackPosition(int(stackpos))
+        for camera in cache.cameras():
+            self.parseCamera(camera, self.map)
 
-            if (object.getAction('default')):
-                target = fife.Location(layer)
-                inst.act('default', target, True)
-                
-            #Check for PARPG specific object attributes
-            object_type = instance.get('object_type')
-            if ( object_type ):
-                inst_dict = {}
-                inst_dict["type"] = object_type
-                inst_dict["id"] = id
-                inst_dict["xpos"] = x
-                inst_dict["ypos"] = y
-                inst_dict["gfx"] = objectID
-                inst_dict["is_open"] = instance.get('is_open')
-                inst_dict["locked"] = instance.get('locked')
-                inst_dict["name"] = instance.get('name')
-                inst_dict["text"] = instance.get('text')
-                inst_dict["target_map_name"] = instance.get('target_map_name')
-                inst_dict["target_map"] = instance.get('target_map')
-                inst_dict["target_pos"] = (instance.get('target_x'), instance.get('target_y'))
-                self.data.createObject( layer, inst_dict, inst )
-                
     def parseCameras(self, map_elt, map):
+        """Creates the cameras of the map. A generator that yields after
+           every step, see loadSteps."""
         if self.callback:        
             tmplist = map_elt.findall('camera')
             i = float(0)
 
         for camera in map_elt.findall('camera'):
-            id = camera.get('id')
-            zoom = camera.get('zoom')
-            tilt = camera.get('tilt')
-            rotation = camera.get('rotation')
-            ref_layer_id = camera.get('ref_layer_id')
-            ref_cell_width = camera.get('ref_cell_width')
-            ref_cell_height = camera.get('ref_cell_height')
-            viewport = camera.get('viewport')
-
-            if not zoom: zoom = 1
-            if not tilt: tilt = 0
-            if not rotation: rotation = 0
-
-            if not id: self._err('Camera declared without an id.')
-            if not ref_layer_id: self._err(''.join(['Camera ', str(id), ' declared with no reference layer.']))
-            if not (ref_cell_width and ref_cell_height): self._err(''.join(['Camera ', str(id), ' declared without reference cell dimensions.']))
-
-            try:
-                if viewport:
-                    cam = self.engine.getView().addCamera(str(id), map.getLayer(str(ref_layer_id)),fife.Rect(*[int(c) for c in viewport.split(',')]),fife.ExactModelCoordinate(0,0,0))
-                else:
-                    screen = self.engine.getRenderBackend()
-                    cam = self.engine.getView().addCamera(str(id), map.getLayer(str(ref_layer_id)),fife.Rect(0,0,screen.getScreenWidth(),screen.getScreenHeight()),fife.ExactModelCoordinate(0,0,0))
-
-                cam.setCellImageDimensions(int(ref_cell_width), int(ref_cell_height))
-                cam.setRotation(float(rotation))
-                cam.setTilt(float(tilt))
-                cam.setZoom(float(zoom))
-            except fife.Exception, e:
-                print e.getMessage()
+            self.parseCamera(camera, map)
                 
             if self.callback:
                 i += 1
-                self.callback('loaded camera: ' +  str(id), float( i / len(tmplist) * 0.25 + 0.75 ) )    
+                self.callback('loaded camera: ' +  str(camera.get('id')), float( i / len(tmplist) * 0.25 + 0.75 ) )
+            yield None
+
+    def parseCamera(self, camera, map):
+        id = camera.get('id')
+        zoom = camera.get('zoom')
+        tilt = camera.get('tilt')
+        rotation = camera.get('rotation')
+        ref_layer_id = camera.get('ref_layer_id')
+        ref_cell_width = camera.get('ref_cell_width')
+        ref_cell_height = camera.get('ref_cell_height')
+        viewport = camera.get('viewport')
+        start_time = time.time()
+
+        if not zoom: zoom = 1
+        if not tilt: tilt = 0
+        if not rotation: rotation = 0
+
+        if not id: self._err('Camera declared without an id.')
+        cam_id = self.camera_prefix + str(id)
+        if not ref_layer_id: self._err(''.join(['Camera ', str(id), ' declared with no reference layer.']))
+        if not (ref_cell_width and ref_cell_height): self._err(''.join(['Camera ', str(id), ' declared without reference cell dimensions.']))
+
+        try:
+            if viewport:
+                cam = self.engine.getView().addCamera(cam_id, map.getLayer(str(ref_layer_id)),fife.Rect(*[int(c) for c in viewport.split(',')]),fife.ExactModelCoordinate(0,0,0))
+            else:
+                screen = self.engine.getRenderBackend()
+                cam = self.engine.getView().addCamera(cam_id, map.getLayer(str(ref_layer_id)),fife.Rect(0,0,screen.getScreenWidth(),screen.getScreenHeight()),fife.ExactModelCoordinate(0,0,0))
+
+            cam.setCellImageDimensions(int(ref_cell_width), int(ref_cell_height))
+            cam.setRotation(float(rotation))
+            cam.setTilt(float(tilt))
+            cam.setZoom(float(zoom))
+        except fife.Exception, e:
+            print e.getMessage()
+        self.profile.cameras += time.time() - start_time
             
@@ -28,6 +28,7 @@ from scripts import world
 from scripts import engine
 from scripts import console
 from scripts.engine import Engine
+from scripts.autosave import Autosave
 from scripts.common import eventlistenerbase
 from basicapplication import ApplicationBase
 from settings import Setting
@@ -98,6 +99,15 @@ class PARPG(ApplicationBase):
         self.world = world.World(self.engine)
         self.model = engine.Engine(self.world)
         self.world.data = self.model
+        self.model.autosave = Autosave("saves", \
+                                int(TDS.readSetting("AutosaveSlots") or 1), \
+                                float(TDS.readSetting("AutosaveInterval") or 0))
+        self.model.commands.budget = \
+                            float(TDS.readSetting("CommandTime") or 0) / 1000
+        self.model.clock.step = \
+                            1.0 / float(TDS.readSetting("GameTickRate") or 30)
+        self.model.clock.max_steps = \
+                            int(TDS.readSetting("MaxCatchUpTicks") or 1)
         self.listener = ApplicationListener(self.engine,self.world,self.model)
         self.world.quitFunction = self.listener.quitGame
         self.model.loadMap("main-map", str(TDS.readSetting("MapFile")))
@@ -153,6 +163,10 @@ class PARPG(ApplicationBase):
            @return: None"""
         if self.listener.quit:
             self.breakRequested = True
+            # let a running autosave finish its file
+            error = self.model.autosave.wait()
+            if error is not None:
+                sys.stderr.write("Error: Autosave failed: %s\n" % error)
         else:
             self.model.pump()
             self.world.pump()
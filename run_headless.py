@@ -0,0 +1,71 @@
+#!/usr/bin/python
+
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import sys, os, shutil, time
+
+if not os.path.exists('settings.xml'):
+    shutil.copyfile('settings-dist.xml', 'settings.xml')
+
+from scripts.engine import Engine
+from scripts.headless import HeadlessWorld
+from settings import Setting
+
+TDS = Setting()
+
+"""Runs PARPG without a window: loads a map and fast-forwards the game
+   logic as quickly as it can, then prints how long that took. Used for
+   load tests and to profile the game logic on its own.
+   Usage: run_headless.py [seconds of game time] [map file] [save file]"""
+
+def createEngine():
+    """Creates an engine with a headless view, configured like run.py.
+       @return: The engine"""
+    world = HeadlessWorld()
+    model = Engine(world)
+    world.data = model
+    model.commands.budget = float(TDS.readSetting("CommandTime") or 0) / 1000
+    model.clock.step = 1.0 / float(TDS.readSetting("GameTickRate") or 30)
+    model.clock.max_steps = int(TDS.readSetting("MaxCatchUpTicks") or 1)
+    # the instances act on the game clock instead of the FIFE model
+    model.clock.addTickHandler(world.tick)
+    return model
+
+def main():
+    """Application code starts from here"""
+    seconds = 60.0
+    map_file = str(TDS.readSetting("MapFile"))
+    if len(sys.argv) > 1:
+        seconds = float(sys.argv[1])
+    if len(sys.argv) > 2:
+        map_file = sys.argv[2]
+    model = createEngine()
+    start_time = time.time()
+    model.loadMap("main-map", map_file)
+    load_time = time.time() - start_time
+    start_time = time.time()
+    for i in xrange(int(seconds / model.clock.step)):
+        model.pump(model.clock.step)
+    run_time = time.time() - start_time
+    print 'Loaded %s in %.3f s' % (map_file, load_time)
+    print 'Ran %d ticks (%.1f s of game time) in %.3f s, %.0f ticks/s' % \
+          (model.clock.ticks, model.clock.time, run_time,
+           model.clock.ticks / max(run_time, 1e-6))
+    if len(sys.argv) > 3:
+        path, filename = os.path.split(sys.argv[3])
+        model.save(path or '.', filename)
+        print 'Saved the game to ' + sys.argv[3]
+
+if __name__ == '__main__':
+    main()
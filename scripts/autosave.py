@@ -0,0 +1,217 @@
+#!/usr/bin/python
+
+#   This file is part of PARPG.
+
+#   PARPG is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+
+#   PARPG is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+
+#   You should have received a copy of the GNU General Public License
+#   along with PARPG.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Periodic saves in the background. On the frame thread the game state
+   is copied, structurally: the objects and the lists, dicts and sets they
+   hold are copied, nothing is pickled. Objects that did not change since
+   the last autosave keep their copy. A worker thread pickles, compresses
+   and writes the copy. The autosaves go round a fixed number of slot
+   files."""
+
+import os
+import threading
+import time
+import savegame
+from gamestate import GameState
+from objects.base import GameObject
+
+def _copyValue(value, memo, refs):
+    """Copies an attribute value of a game object, see snapshotObject.
+       @return: The copy"""
+    if isinstance(value, GameObject):
+        refs.append(value)
+        return snapshotObject(value, memo, refs)
+    if isinstance(value, list):
+        return [_copyValue(item, memo, refs) for item in value]
+    if isinstance(value, tuple):
+        return tuple([_copyValue(item, memo, refs) for item in value])
+    if isinstance(value, dict):
+        return dict([(_copyValue(key, memo, refs),
+                      _copyValue(item, memo, refs))
+                     for key, item in value.items()])
+    if isinstance(value, (set, frozenset)):
+        return value.__class__([_copyValue(item, memo, refs)
+                                for item in value])
+    return value
+
+def snapshotObject(obj, memo, refs=None):
+    """Copies a game object for saving. The lists, tuples, dicts and sets
+       it holds are copied, and so are the game objects it refers to, e.g.
+       the items in a container. References between the copied objects
+       point at the copies. Other values are shared.
+       @type obj: GameObject
+       @param obj: The object
+       @type memo: dict
+       @param memo: id of each object copied so far -> its copy
+       @type refs: list
+       @param refs: Collects the game objects the object refers to
+       @rtype: GameObject
+       @return: The copy"""
+    snapshot = memo.get(id(obj))
+    if snapshot is not None:
+        return snapshot
+    if refs is None:
+        refs = []
+    snapshot = memo[id(obj)] = obj.__class__.__new__(obj.__class__)
+    state = obj.__getstate__()
+    for key, value in state.items():
+        state[key] = _copyValue(value, memo, refs)
+    snapshot.__setstate__(state)
+    return snapshot
+
+def snapshotState(game_state, reuse=None):
+    """Copies the saved parts of a game state, see snapshotObject.
+       @type game_state: GameState
+       @param game_state: The state
+       @type reuse: dict
+       @param reuse: (map id, object id) -> (object, copy) of earlier
+                     copies. The copy of an object that is not in the
+                     dirty set of its map is taken from here, the copies
+                     of objects that refer to no other game objects are
+                     added to it.
+       @rtype: GameState
+       @return: The copy"""
+    if reuse is None:
+        reuse = {}
+    memo = {}
+    snapshot = GameState()
+    snapshot.current_map_name = game_state.current_map_name
+    snapshot.current_map_file = game_state.current_map_file
+    snapshot.play_time = game_state.play_time
+    # the earlier copies go into the memo first, so that the objects
+    # copied anew refer to them as well
+    changed = []
+    for map_id, objects in game_state.objects.items():
+        dirty_set = game_state.dirty.get(map_id)
+        copies = snapshot.objects[map_id] = {}
+        for obj_id, obj in objects.items():
+            earlier = reuse.get((map_id, obj_id))
+            if earlier is not None and earlier[0] is obj and \
+                    dirty_set is not None and obj_id not in dirty_set:
+                copies[obj_id] = memo[id(obj)] = earlier[1]
+            else:
+                changed.append((map_id, obj_id, obj))
+    snapshot.PC = snapshotObject(game_state.PC, memo)
+    for map_id, obj_id, obj in changed:
+        refs = []
+        copy = snapshot.objects[map_id][obj_id] = \
+                                    snapshotObject(obj, memo, refs)
+        if refs:
+            reuse.pop((map_id, obj_id), None)
+        else:
+            reuse[(map_id, obj_id)] = (obj, copy)
+    # packed maps are strings, nothing changes them
+    snapshot.saved_maps = dict(game_state.saved_maps)
+    return snapshot
+
+class Autosave(object):
+    """Saves the game every few minutes without holding up the frames."""
+    def __init__(self, path, slots=3, interval=300):
+        """@type path: string
+           @param path: Directory of the autosaves
+           @type slots: integer
+           @param slots: Number of autosave files kept
+           @type interval: float
+           @param interval: Seconds between autosaves, 0 turns them off"""
+        self.path = path
+        self.slots = max(slots, 1)
+        self.interval = interval
+        self.last_save = time.time()
+        self.thread = None
+        # copies of the objects that did not change since, see
+        # snapshotState; they belong to reuse_state and its last full save
+        self.reuse = {}
+        self.reuse_state = None
+        # what the last autosave failed with, until it is reported
+        self.error = None
+        # continue after the newest autosave of an earlier game
+        times = [(self.slotTime(slot), slot) for slot in range(self.slots)]
+        self.slot = (max(times)[1] + 1) % self.slots
+
+    def slotFile(self, slot):
+        """@return: The file name of an autosave slot"""
+        return os.path.join(self.path, 'autosave%d.dat' % slot)
+
+    def slotTime(self, slot):
+        """@return: Modification time of a slot file, 0 if it is empty"""
+        try:
+            return os.path.getmtime(self.slotFile(slot))
+        except OSError:
+            return 0
+
+    def isSaving(self):
+        """@return: True while an autosave is being written"""
+        return self.thread is not None and self.thread.isAlive()
+
+    def isDue(self):
+        """@return: True if it is time for the next autosave"""
+        return (self.interval > 0 and not self.isSaving() and
+                time.time() - self.last_save >= self.interval)
+
+    def save(self, game_state):
+        """Copies the game state and writes the copy to the next slot on a
+           worker thread.
+           @type game_state: GameState
+           @param game_state: The state to save
+           @rtype: string
+           @return: The file being written"""
+        # a full save empties the dirty sets, what changed before it is
+        # no longer told apart from what did not
+        if self.reuse_state != (game_state, game_state.base_save):
+            self.reuse = {}
+            self.reuse_state = (game_state, game_state.base_save)
+        snapshot = snapshotState(game_state, self.reuse)
+        filename = self.slotFile(self.slot)
+        self.slot = (self.slot + 1) % self.slots
+        self.last_save = time.time()
+        self.error = None
+        self.thread = threading.Thread(target=self.write,
+                                       args=(filename, snapshot))
+        self.thread.setDaemon(True)
+        self.thread.start()
+        return filename
+
+    def write(self, filename, snapshot):
+        """Pickles, compresses and writes a snapshot, runs on the worker
+           thread. A failure is kept for poll and wait to report on the
+           frame thread.
+           @return: None"""
+        try:
+            if not os.path.isdir(self.path):
+                os.makedirs(self.path)
+            savegame.writeSaveFile(filename, snapshot)
+        except Exception, error:
+            self.error = error
+
+    def poll(self):
+        """Reports a failed autosave once, after it finished.
+           @rtype: Exception
+           @return: What the last autosave failed with, None if it
+                    succeeded, is still being written or was reported"""
+        if self.isSaving():
+            return None
+        error = self.error
+        self.error = None
+        return error
+
+    def wait(self):
+        """Waits for the autosave being written, if any.
+           @rtype: Exception
+           @return: What it failed with, see poll"""
+        if self.thread is not None:
+            self.thread.join()
+        return self.poll()
@@ -0,0 +1,108 @@
+#!/usr/bin/python
+
+#   This file is part of PARPG.
+
+#   PARPG is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+
+#   PARPG is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+
+#   You should have received a copy of the GNU General Public License
+#   along with PARPG.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Deferred work of the engine. Commands are run by priority, lowest
+   value first, and in submission order within a priority. Each frame runs
+   commands until its time budget is spent, the rest waits for the next
+   frame."""
+
+import heapq
+import time
+
+PRIORITY_HIGH, PRIORITY_NORMAL, PRIORITY_LOW = range(3)
+
+class CommandQueue(object):
+    """A priority queue of commands drained within a time budget."""
+    def __init__(self, budget=0.005):
+        """@type budget: float
+           @param budget: Seconds drain spends by default"""
+        self.budget = budget
+        # (priority, sequence number, name, callback, args)
+        self.heap = []
+        self.sequence = 0
+        # while held, drain runs nothing (e.g. during a map load)
+        self.held = False
+        # counters
+        self.queued = 0
+        self.executed = 0
+        self.deferred = 0
+        self.over_budget_frames = 0
+        # command name -> [runs, total seconds, longest run in seconds]
+        self.costs = {}
+
+    def __len__(self):
+        return len(self.heap)
+
+    def submit(self, callback, args=(), priority=PRIORITY_NORMAL, name=None):
+        """Queues a command.
+           @type callback: function
+           @param callback: The command, called as callback(*args)
+           @type args: tuple
+           @param args: Arguments of the callback
+           @type priority: integer
+           @param priority: PRIORITY_HIGH, PRIORITY_NORMAL or PRIORITY_LOW
+           @type name: string
+           @param name: Name the costs are counted under, by default the
+                        name of the callback
+           @return: None"""
+        if name is None:
+            name = callback.__name__
+        heapq.heappush(self.heap,
+                       (priority, self.sequence, name, callback, args))
+        self.sequence += 1
+        self.queued += 1
+
+    def drain(self, budget=None):
+        """Runs queued commands until the budget is spent. At least one
+           command is run, so the queue always makes progress.
+           @type budget: float
+           @param budget: Seconds to spend, None for the default budget
+           @return: The number of commands run"""
+        if budget is None:
+            budget = self.budget
+        start = time.time()
+        count = 0
+        while self.heap and not self.held:
+            now = time.time()
+            if count and now - start >= budget:
+                self.deferred += len(self.heap)
+                break
+            priority, sequence, name, callback, args = \
+                                                heapq.heappop(self.heap)
+            callback(*args)
+            self.addCost(name, time.time() - now)
+            count += 1
+        self.executed += count
+        if count and time.time() - start > budget:
+            self.over_budget_frames += 1
+        return count
+
+    def addCost(self, name, seconds):
+        """Counts a run of a command.
+           @return: None"""
+        cost = self.costs.setdefault(name, [0, 0.0, 0.0])
+        cost[0] += 1
+        cost[1] += seconds
+        cost[2] = max(cost[2], seconds)
+
+    def stats(self):
+        """@return: Dictionary of the counters"""
+        return {'queued': self.queued,
+                'executed': self.executed,
+                'deferred': self.deferred,
+                'over_budget_frames': self.over_budget_frames,
+                'pending': len(self.heap)}
@@ -30,6 +30,7 @@ class Console:
         python_help = "Run some python code"
         quit_help = "Terminate application"
         save_help = "save directory file"
+        commands_help = "Show the counters of the command queue"
 
         self.commands = [
             {"cmd":"exit"  ,"callback":self.handleQuit  ,"help": exit_help},
@@ -40,6 +41,8 @@ class Console:
             {"cmd":"python","callback":self.handlePython,"help": python_help},
             {"cmd":"quit"  ,"callback":self.handleQuit  ,"help": quit_help},
             {"cmd":"save"  ,"callback":self.handleSave  ,"help": save_help},
+            {"cmd":"commands","callback":self.handleCommands,
+             "help": commands_help},
         ]
         self.app_listener=app_listener
 
@@ -159,6 +162,26 @@ class Console:
         return result 
 
 
+    def handleCommands(self, command):
+        """
+        Implements the commands console command, shows how the command
+        queue of the engine kept up and what its commands cost
+        @type command: string
+        @param command: The command to run
+        @return: The resultstring"""
+
+        queue = self.app_listener.model.commands
+        stats = queue.stats()
+        res = "%(executed)d run, %(deferred)d deferred, " \
+              "%(over_budget_frames)d frames over budget, " \
+              "%(pending)d pending\n" % stats
+        costs = queue.costs.items()
+        costs.sort(key=lambda (name, cost): -cost[1])
+        for name, (runs, total, longest) in costs:
+            res += "%10s: %d runs, %.1f ms, longest %.1f ms\n" % \
+                   (name, runs, total * 1000, longest * 1000)
+        return res
+
     def handleConsoleCommand(self, command):
         """
         Implements the console logic 
@@ -16,8 +16,11 @@
 #   along with PARPG.  If not, see <http://www.gnu.org/licenses/>.
 
 # there should be NO references to FIFE here!
-import pickle
 import sys
+import time
+import savegame
+from commandqueue import CommandQueue, PRIORITY_HIGH
+from gameclock import GameClock
 from gamestate import GameState
 from objects import *
 from objects.action import *
@@ -37,47 +40,66 @@ class Engine:
            @return: None"""
         # a World object (the fife stuff, essentially)
         self.view = view
-        self.map_change = False
         self.game_state = GameState()
         self.pc_run = 1
         self.target_position = None
-        self.target_map_name = None
-        self.target_map_file = None
+        # deferred work, drained by pump; the budget is set in run.py
+        self.commands = CommandQueue()
+        # a map change is being loaded over several frames
+        self.map_loading = False
+        # which maps the doors lead to:
+        # map name -> {target map name: target map file}
+        self.map_graph = {}
+        # ID -> game object of the objects on the current map, the objects
+        # hover and click handling looks for (see objectActive)
+        self.active_objects = {}
+        # periodic background saves, set in run.py
+        self.autosave = None
+        # time of the last pump
+        self.pump_time = None
+        # fixed rate game logic, the rate is set in run.py
+        self.clock = GameClock()
+        self.clock.addTickHandler(self.countPlayTime)
+        self.clock.addTickHandler(self.checkAutosave)
     def reset(self):
         """Clears the data on a map reload so we don't have objects/npcs from
            other maps hanging around.
            @return: None"""
 
-    def save(self, path, filename):
+    def save(self, path, filename, delta=False):
         """Writes the saver to a file.
            @type filename: string
            @param filename: the name of the file to write to
+           @type delta: boolean
+           @param delta: Only write what changed since the last full save,
+                         if there is one
            @return: None"""
         fname = '/'.join([path,filename])
+        self.updatePCPosition()
+        base = None
+        if delta:
+            base = savegame.deltaBase(self.game_state, fname)
+        # the actors leave their behaviours out when pickled
         try:
-            f = open(fname, 'w')
-        except(IOError):
+            info = savegame.writeSaveFile(fname, self.game_state, base=base)
+        except(IOError, OSError):
             sys.stderr.write("Error: Can't find save game: " + fname + "\n")
             return
-        
-        # can't pickle SwigPyObjects
-        behaviours = {}
-        behaviours[self.game_state.PC.ID] = self.game_state.PC.behaviour;
-        self.game_state.PC.behaviour = None;
-        
-        npcs = [npc for npc in self.game_state.objects.values() \
-                if npc.trueAttr("NPC")]
-        for npc in npcs:
-            behaviours[npc.ID] = npc.behaviour;
-            npc.behaviour = None;
-        
-        pickle.dump(self.game_state, f)
-        f.close()
-        
-        # restore behaviours
-        for npc in npcs:
-            npc.behaviour = behaviours[npc.ID];
-        self.game_state.PC.behaviour = behaviours[self.game_state.PC.ID]
+        if base is None:
+            self.game_state.markSaved(fname, info.timestamp)
+
+    def quickSave(self):
+        """Saves the changes since the last full save to the quick save.
+           @return: None"""
+        self.save("saves", "quicksave.dat", delta=True)
+
+    def updatePCPosition(self):
+        """Copies the position of the PC agent to the PC object, for the
+           save info.
+           @return: None"""
+        pc = self.game_state.PC
+        if pc is not None and pc.behaviour is not None:
+            pc.coords = (pc.behaviour.getX(), pc.behaviour.getY())
 
     def load(self, path, filename):
         """Loads a saver from a file.
@@ -88,13 +110,21 @@ class Engine:
            @return: None"""
         fname = '/'.join([path, filename])
         try:
-            f = open(fname, 'r')
+            f = open(fname, 'rb')
         except(IOError):
             sys.stderr.write("Error: Can't find save game file\n")
             return
-        self.game_state = pickle.load(f)
-        f.close()
-        if self.game_state.current_map:
+        try:
+            game_state = savegame.loadGame(f, fname)
+        except(IOError, ValueError):
+            sys.stderr.write("Error: Can't read save game file\n")
+            return
+        finally:
+            f.close()
+        self.game_state = game_state
+        # the loaded maps show the old game state
+        self.view.clearMaps()
+        if self.game_state.current_map_name:
             self.loadMap(self.game_state.current_map_name, \
                          self.game_state.current_map_file) 
 
@@ -108,17 +138,32 @@ class Engine:
            @param instance: FIFE instance corresponding to the object
            @return: None
         """
+        self.createObjects(layer, [(attributes, instance)])
+
+    def createObjects(self, layer, records):
+        """Create the objects of a layer in one go and add them to the
+           current map.
+           @type layer: fife.Layer
+           @param layer: FIFE layer the objects exist in
+           @type records: list
+           @param records: (attributes, instance) pairs, see createObject
+           @return: None
+        """
         # create the extra data
         extra = {}
         extra['agent_layer'] = layer
         extra['engine'] = self
         
-        obj = createObject(attributes, extra)
+        objs = createObjects([attributes for attributes, instance in records],
+                             extra)
+        map_objects = self.game_state.objects.setdefault(
+                                    self.game_state.current_map_name, {})
         
-        if obj.trueAttr("PC"):
-            self.addPC(layer, obj, instance)
-        else:
-            self.addObject(layer, obj, instance)
+        for obj, (attributes, instance) in zip(objs, records):
+            if obj.trueAttr("PC"):
+                self.addPC(layer, obj, instance)
+            else:
+                self.addObject(layer, obj, instance, map_objects)
 
         
 
@@ -134,6 +179,9 @@ class Engine:
         """
         # If this map has already a PC
         self.view.active_map.addObject(pc.ID, instance)          
+        self.view.active_map.pc = pc
+        # the PC is not among the objects the mouse interacts with
+        self.active_objects.pop(pc.ID, None)
         
         # For now we copy the PC, in the future we will need to copy
         # PC specifics between the different PC's
@@ -141,7 +189,7 @@ class Engine:
             
         self.game_state.PC.setup()
 
-    def addObject(self, layer, obj, instance):
+    def addObject(self, layer, obj, instance, map_objects=None):
         """Adds an object to the map.
            @type layer: fife.Layer
            @param layer: FIFE layer object exists in
@@ -149,23 +197,33 @@ class Engine:
            @param obj: corresponding object class
            @type instance: fife.Instance
            @param instance: FIFE instance of object
+           @type map_objects: dict
+           @param map_objects: The game state objects of the current map,
+                               if the caller already looked them up
            @return: None
         """
+        if map_objects is None:
+            map_objects = self.game_state.objects.setdefault(
+                                    self.game_state.current_map_name, {})
 
-        ref = self.game_state.getObjectById(obj.ID, \
-                                            self.game_state.current_map_name) 
+        ref = map_objects.get(obj.ID)
         if ref is None:
             # no, add it to the game state
-            self.game_state.objects[self.game_state.current_map_name][obj.ID] = obj
+            self.game_state.addObject(obj, self.game_state.current_map_name)
+            self.active_objects[obj.ID] = obj
         else:
             # yes, use the current game state data
             obj.X = ref.X
             obj.Y = ref.Y
             obj.gfx = ref.gfx  
+            self.active_objects[obj.ID] = ref
             
         # add it to the view
         self.view.active_map.addObject(obj.ID, instance)          
 
+        if obj.trueAttr("door"):
+            self.addDoor(obj)
+
         if obj.trueAttr("NPC"):
             # create the agent
             obj.setup()
@@ -173,6 +231,37 @@ class Engine:
             # create the PC agent
             obj.start()
 
+    def addDoor(self, door):
+        """Adds the connection made by a door on the current map to the
+           map graph.
+           @type door: Door
+           @param door: The door object
+           @return: None"""
+        targets = self.map_graph.setdefault(self.game_state.current_map_name,
+                                            {})
+        targets[door.target_map_name] = door.target_map
+
+    def getNeighbourMaps(self, map_name):
+        """Returns the maps the doors of the given map lead to.
+           @type map_name: String
+           @param map_name: Name of the map
+           @rtype: dict
+           @return: Target map names mapped to their map files"""
+        return self.map_graph.get(map_name, {})
+
+    def prefetchMap(self, map_name, map_file):
+        """Starts loading a map the PC is heading to in the background, if a
+           door of the current map leads there.
+           @type map_name: String
+           @param map_name: Id of the map
+           @type map_file: String
+           @param map_file: Filename of the map
+           @return: None"""
+        if map_name == self.game_state.current_map_name:
+            return
+        if map_name in self.getNeighbourMaps(self.game_state.current_map_name):
+            self.view.prefetchMap(map_name, map_file)
+
     def objectActive(self, ident):
         """Given the objects ID, pass back the object if it is active,
            False if it doesn't exist or not displayed
@@ -180,12 +269,7 @@ class Engine:
            @param ident: ID of object
            @rtype: boolean
            @return: Status of result (True/False)"""
-        for i in self.game_state.getObjectsFromMap(self.game_state.current_map_name):
-            if (i.ID == ident):
-                # we found a match
-                return i
-        # no match
-        return False
+        return self.active_objects.get(ident, False)
 
     def getItemActions(self, obj_id):
         """Given the objects ID, return the text strings and callbacks.
@@ -250,9 +334,43 @@ class Engine:
            @return: None"""
         self.game_state.current_map_file = map_file
         self.game_state.current_map_name = map_name
+        self.game_state.restoreMap(map_name)
+        self.active_objects = {}
         self.view.loadMap(map_name, str(map_file))
+        self.mapLoaded(map_name)
+
+    def startMapLoad(self, map_name, map_file):
+        """Starts loading a new map over the next frames; pump finishes
+           the load.
+           @type map_name: string
+           @param map_name: Name of the map to load
+           @type map_file: string
+           @param map_file: Filename of map file to load
+           @return: None"""
+        self.game_state.current_map_file = map_file
+        self.game_state.current_map_name = map_name
+        self.game_state.restoreMap(map_name)
+        self.active_objects = {}
+        self.view.startMapLoad(map_name, str(map_file))
+        self.map_loading = True
+        # the commands wait for the new map
+        self.commands.held = True
+
+    def mapLoaded(self, map_name):
+        """Makes a freshly loaded map the current one and puts the PC on it.
+           @type map_name: string
+           @param map_name: Name of the loaded map
+           @return: None"""
         self.view.setActiveMap(map_name)
         self.reset()
+        # a map that stayed loaded added no objects, take them from the
+        # game state
+        self.active_objects = dict(self.game_state.objects.get(map_name, {}))
+        # a map that stayed loaded brings back its own PC
+        if self.view.active_map.pc is not None:
+            self.game_state.PC = self.view.active_map.pc
+        # prefetched maps that are no longer next door are of no use
+        self.view.retainPrefetchedMaps(self.getNeighbourMaps(map_name).values())
 
         # create the PC agent
         self.view.active_map.addPC(self.game_state.PC.behaviour.agent)
@@ -269,7 +387,7 @@ class Engine:
             self.game_state.PC.walk(position)
 
     def changeMap(self, map_name, map_file, target_position):
-        """Registers for a map change on the next pump().
+        """Queues a map change for the next pump().
            @type name_name: String
            @param map_name: Id of the map to teleport to
            @type map_file: String
@@ -277,23 +395,75 @@ class Engine:
            @type target_position: Tuple
            @param target_position: Position of PC on target map.
            @return None"""
-        # set the parameters for the map change if moving to a new map
+        # issue the map change if moving to a new map
         if map_name != self.game_state.current_map_name:
-            self.target_map_name = map_name
-            self.target_map_file = map_file
-            self.target_position = target_position
-            # issue the map change
-            self.map_change = True
+            self.commands.submit(self.moveToMap, \
+                                 (map_name, map_file, target_position), \
+                                 PRIORITY_HIGH)
         else:
             #set the player position on the current map
             self.view.teleport(target_position)
 
-    def handleCommands(self):
-        if self.map_change:
-            self.loadMap(self.target_map_name, self.target_map_file)
-            self.view.teleport(self.target_position)
-            self.map_change = False
+    def moveToMap(self, map_name, map_file, target_position):
+        """Loads a map and puts the PC on it, the map change command.
+           @type name_name: String
+           @param map_name: Id of the map to teleport to
+           @type map_file: String
+           @param map_file: Filename of the map to teleport to
+           @type target_position: Tuple
+           @param target_position: Position of PC on target map.
+           @return None"""
+        self.target_position = target_position
+        if self.view.asyncMapLoads():
+            self.startMapLoad(map_name, map_file)
+        else:
+            self.loadMap(map_name, map_file)
+            self.view.teleport(target_position)
 
-    def pump(self):
-        """Main loop in the engine."""
-        self.handleCommands()
+    def countPlayTime(self, step):
+        """Tick handler adding up the play time.
+           @type step: float
+           @param step: Length of the tick in seconds
+           @return: None"""
+        self.game_state.play_time += step
+
+    def checkAutosave(self, step):
+        """Tick handler starting the autosaves and reporting the failed
+           ones.
+           @type step: float
+           @param step: Length of the tick in seconds
+           @return: None"""
+        if self.autosave is None:
+            return
+        error = self.autosave.poll()
+        if error is not None:
+            sys.stderr.write("Error: Autosave failed: %s\n" % error)
+        if self.autosave is not None and self.autosave.isDue() and \
+                self.game_state.PC is not None:
+            self.updatePCPosition()
+            self.autosave.save(self.game_state)
+
+    def pump(self, elapsed=None):
+        """Main loop in the engine.
+           @type elapsed: float
+           @param elapsed: Seconds of game time since the last pump, None
+                           to measure the wall clock. Headless runs pass
+                           the tick length to fast-forward.
+           @return: None"""
+        now = time.time()
+        if elapsed is None:
+            elapsed = 0.0
+            if self.pump_time is not None:
+                elapsed = now - self.pump_time
+        self.pump_time = now
+        if self.map_loading:
+            if not self.view.stepMapLoad():
+                return
+            self.map_loading = False
+            self.commands.held = False
+            self.mapLoaded(self.game_state.current_map_name)
+            self.view.teleport(self.target_position)
+        self.commands.drain()
+        self.clock.advance(elapsed)
+        if self.view.active_map:
+            self.view.active_map.streamChunks()
@@ -16,6 +16,8 @@
 import pychan
 import pychan.widgets as widgets
 import sys
+import time
+import savegame
 
 def u2s(string):
     return string.encode(sys.getfilesystemencoding())
@@ -28,7 +30,8 @@ class FileBrowser(object):
     select_dir is set, file_selected's filename parameter should be optional.
     The save_file option provides a box for supplying a new filename that
     doesn't exist yet. The select_dir option allows directories to be
-    selected as well as files.
+    selected as well as files. Save files are listed with the infos from
+    their headers and can be sorted by date, name or map.
     """
     def __init__(self, engine, file_selected, save_file=False, \
                  select_dir=False, extensions=('.dat',), \
@@ -46,6 +49,9 @@ class FileBrowser(object):
         self.path = './saves/'
         self.dir_list = []
         self.file_list = []
+        # see SaveIndex.listSaves
+        self.sort_key = 'timestamp'
+        self.sort_reverse = True
 
     def showBrowser(self):
         """ Shows the file dialog browser """
@@ -56,7 +62,10 @@ class FileBrowser(object):
         self._widget.mapEvents({
             'dirList'       : self._setDirectory,
             'selectButton'  : self._selectFile,
-            'closeButton'   : self._widget.hide
+            'closeButton'   : self._widget.hide,
+            'sortDate'      : lambda: self._sortFiles('timestamp'),
+            'sortName'      : lambda: self._sortFiles('name'),
+            'sortMap'       : lambda: self._sortFiles('map_name')
         })
         self._setDirectory()
         if self.save_file:
@@ -76,7 +85,10 @@ class FileBrowser(object):
             else:
                 lst.append(new_dir)
             self.path = '/'.join(lst)
+        self._listDirectory()
             
+    def _listDirectory(self):
+        """ Shows the directories and files in the current path. """
         def decodeList(list):
             fs_encoding = sys.getfilesystemencoding()
             if fs_encoding is None: fs_encoding = "ascii"
@@ -100,14 +112,42 @@ class FileBrowser(object):
                                     listDirectories(self.path))
         file_list = filter(lambda f: f.split('.')[-1] in self.extensions, \
                            self.engine.getVFS().listFiles(self.path))
+        saves = savegame.save_index.listSaves(self.path, file_list, \
+                                              self.sort_key, self.sort_reverse)
                 
         self.dir_list = decodeList(dir_list)
-        self.file_list = decodeList(file_list)
+        self.file_list = decodeList([name for name, info in saves])
+        entries = [self._describeFile(self.file_list[i], saves[i][1]) \
+                   for i in range(len(saves))]
         self._widget.distributeInitialData({
             'dirList'  : self.dir_list,
-            'fileList' : self.file_list
+            'fileList' : entries
         })
 
+    def _describeFile(self, name, info):
+        """ Returns the list entry of a save file.
+            @type name: unicode
+            @param name: The file name
+            @type info: SaveInfo
+            @param info: The info of the save, None if it is not a save
+            @return: The text of the entry """
+        if info is None or not info.timestamp:
+            return name
+        played = int(info.play_time)
+        return u"%s - %s - %s - %d:%02d" % \
+            (name, info.map_name, \
+             time.strftime("%Y-%m-%d %H:%M", time.localtime(info.timestamp)), \
+             played // 3600, played // 60 % 60)
+
+    def _sortFiles(self, sort_key):
+        """ Sort button callback, a second click reverses the order. """
+        if sort_key == self.sort_key:
+            self.sort_reverse = not self.sort_reverse
+        else:
+            self.sort_key = sort_key
+            self.sort_reverse = sort_key == 'timestamp'
+        self._listDirectory()
+
     def _selectFile(self):
         """ File selection callback. """
         self._widget.hide()
@@ -0,0 +1,84 @@
+#!/usr/bin/python
+
+#   This file is part of PARPG.
+
+#   PARPG is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+
+#   PARPG is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+
+#   You should have received a copy of the GNU General Public License
+#   along with PARPG.  If not, see <http://www.gnu.org/licenses/>.
+
+"""The game clock. Game logic advances in ticks of a fixed length, however
+   long the frames are: the time of the frames is added up and every full
+   tick length in it runs one tick. After a very slow frame only a limited
+   number of ticks are run, the game slows down instead of falling further
+   behind."""
+
+class GameClock(object):
+    """Runs the tick handlers at a fixed rate."""
+    def __init__(self, step=1.0 / 30, max_steps=5):
+        """@type step: float
+           @param step: Length of a tick in seconds
+           @type max_steps: integer
+           @param max_steps: Most ticks run for one frame"""
+        self.step = step
+        self.max_steps = max_steps
+        self.handlers = []
+        # frame time not yet used up by ticks
+        self.accumulator = 0.0
+        self.ticks = 0
+        # game time in seconds
+        self.time = 0.0
+        # frame time that was dropped to keep up
+        self.dropped = 0.0
+
+    def addTickHandler(self, handler):
+        """Registers a function to be run every tick.
+           @type handler: function
+           @param handler: Called as handler(step), step is the tick length
+           @return: None"""
+        self.handlers.append(handler)
+
+    def removeTickHandler(self, handler):
+        """Unregisters a tick handler.
+           @return: None"""
+        self.handlers.remove(handler)
+
+    def advance(self, elapsed):
+        """Runs the ticks that are due after a frame.
+           @type elapsed: float
+           @param elapsed: Seconds since the last frame
+           @return: The number of ticks run"""
+        self.accumulator += elapsed
+        steps = 0
+        while self.accumulator >= self.step:
+            if steps == self.max_steps:
+                # don't spiral, drop what can't be caught up
+                self.dropped += self.accumulator - \
+                                self.accumulator % self.step
+                self.accumulator %= self.step
+                break
+            self.tick()
+            self.accumulator -= self.step
+            steps += 1
+        return steps
+
+    def tick(self):
+        """Runs one tick.
+           @return: None"""
+        self.ticks += 1
+        self.time += self.step
+        for handler in list(self.handlers):
+            handler(self.step)
+
+    def alpha(self):
+        """@return: How far the game is into the next tick, 0.0 to 1.0,
+                    for interpolating between ticks"""
+        return self.accumulator / self.step
@@ -16,6 +16,11 @@
 #   along with PARPG.  If not, see <http://www.gnu.org/licenses/>.
 
 from objects import base
+from spatialhash import SpatialHash
+import savegame
+
+# edge length of the cells of the spatial indices
+INDEX_CELL_SIZE = 4.0
 
 class GameState(object):
     """This class holds the current state of the game."""
@@ -23,8 +28,122 @@ class GameState(object):
         """initialize attributes"""
         self.PC = None
         self.objects = {}
+        # map id -> SpatialHash of the objects on the map
+        self.indices = {}
+        # map id -> packed objects of a map read from a save game and not
+        # entered since, see savegame
+        self.saved_maps = {}
         self.current_map_file = None
         self.current_map_name = None
+        # seconds played, counted by Engine.countPlayTime
+        self.play_time = 0.0
+        # map id -> IDs of the objects changed since the last full save
+        self.dirty = {}
+        # (file name, save time) of the last full save, which delta saves
+        # are made against
+        self.base_save = None
+
+    def __setstate__(self, state):
+        """Restores a pickled game state; the spatial indices of states
+           saved without them are built on first use."""
+        state.setdefault('indices', {})
+        state.setdefault('saved_maps', {})
+        state.setdefault('play_time', 0.0)
+        state.setdefault('dirty', {})
+        state.setdefault('base_save', None)
+        self.__dict__.update(state)
+
+    def addObject(self, obj, map_id):
+        """Adds an object to a map and its spatial index. The object counts
+           as changed until the next full save.
+           @type obj: GameObject
+           @param obj: The object
+           @type map_id: String
+           @param map_id: The map name.
+           @return: None"""
+        self.objects.setdefault(map_id, {})[obj.ID] = obj
+        self.getSpatialIndex(map_id).insert(obj)
+        obj.dirty_set = self.dirty.setdefault(map_id, set())
+        obj.markDirty()
+
+    def trackMap(self, map_id):
+        """Tracks the changes of the objects on a map in its dirty set.
+           @type map_id: String
+           @param map_id: The map name.
+           @return: None"""
+        dirty_set = self.dirty.setdefault(map_id, set())
+        for obj in self.objects.get(map_id, {}).values():
+            obj.dirty_set = dirty_set
+
+    def applyChanges(self, map_id, changed):
+        """Replaces objects of a map by the changed ones of a delta save.
+           @type map_id: String
+           @param map_id: The map name.
+           @type changed: dict
+           @param changed: The changed objects by ID
+           @return: None"""
+        self.restoreMap(map_id)
+        self.objects.setdefault(map_id, {}).update(changed)
+        self.indices.pop(map_id, None)
+        self.getSpatialIndex(map_id)
+        self.trackMap(map_id)
+        self.dirty[map_id].update(changed.keys())
+
+    def markSaved(self, filename, timestamp):
+        """Makes a full save the base of the following delta saves, nothing
+           has changed since.
+           @type filename: String
+           @param filename: Name of the save file
+           @type timestamp: float
+           @param timestamp: Save time in the save info
+           @return: None"""
+        # the objects keep their sets, empty them in place
+        for dirty_set in self.dirty.values():
+            dirty_set.clear()
+        self.base_save = (filename, timestamp)
+
+    def restoreMap(self, map_id):
+        """Unpacks the objects of a map read from a save game, if that
+           wasn't done yet.
+           @type map_id: String
+           @param map_id: The map name.
+           @return: None"""
+        raw = self.saved_maps.pop(map_id, None)
+        if raw is None:
+            return
+        self.objects[map_id] = savegame.unpackChunk(raw)
+        # older saves hold a copy of the index, build it again
+        self.indices.pop(map_id, None)
+        self.getSpatialIndex(map_id)
+        self.trackMap(map_id)
+
+    def getSpatialIndex(self, map_id):
+        """Gets the spatial index of the objects on a map.
+           @type map_id: String
+           @param map_id: The map name.
+           @rtype: SpatialHash
+           @returns: The index."""
+        index = self.indices.get(map_id)
+        if index is None:
+            index = self.indices[map_id] = SpatialHash(INDEX_CELL_SIZE)
+            for obj in self.objects.get(map_id, {}).values():
+                index.insert(obj)
+        return index
+
+    def getObjectsAt(self, x, y, map_id):
+        """Gets the objects in the index cell containing a position.
+           @returns: The list of objects."""
+        return self.getSpatialIndex(map_id).objectsInCell(x, y)
+
+    def getObjectsInRadius(self, x, y, radius, map_id):
+        """Gets the objects at most radius away from a position.
+           @returns: The list of objects."""
+        return self.getSpatialIndex(map_id).objectsInRadius(x, y, radius)
+
+    def getObjectsInRect(self, x1, y1, x2, y2, map_id):
+        """Gets the objects inside a rectangle, borders included.
+           @returns: The list of objects."""
+        return self.getSpatialIndex(map_id).objectsInRect(x1, y1, x2, y2)
         
     def getObjectsFromMap(self, map_id):
         """Gets all objects that are currently on the given map.
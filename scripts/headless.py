@@ -0,0 +1,493 @@
+#!/usr/bin/python
+
+#   This file is part of PARPG.
+
+#   PARPG is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+
+#   PARPG is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+
+#   You should have received a copy of the GNU General Public License
+#   along with PARPG.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Runs the game logic without a renderer. The first half of this file are
+   in-memory stand-ins for the parts of FIFE the actors use (layers,
+   instances, locations and action listeners); the actors fall back to them
+   when FIFE can't be imported. The second half is HeadlessWorld, a view
+   the Engine can load maps into: only the instances with an object_type
+   are created, and their actions are run by the game clock instead of the
+   FIFE model. Headless layers have no scale, offset or rotation, so map
+   and layer coordinates are the same."""
+
+import math
+from local_loaders import mapcache
+
+try:
+    import xml.etree.cElementTree as ET
+except ImportError:
+    import xml.etree.ElementTree as ET
+
+# seconds a non repeating act takes
+ACTION_TIME = 1.0
+
+class ExactModelCoordinate(object):
+    def __init__(self, x=0.0, y=0.0, z=0.0):
+        self.x = x
+        self.y = y
+        self.z = z
+
+    def __repr__(self):
+        return '%s(%r, %r, %r)' % (self.__class__.__name__,
+                                   self.x, self.y, self.z)
+
+class ModelCoordinate(ExactModelCoordinate):
+    def __init__(self, x=0, y=0, z=0):
+        super(ModelCoordinate, self).__init__(int(x), int(y), int(z))
+
+DoublePoint3D = ExactModelCoordinate
+
+class Location(object):
+    """A position on a layer."""
+    def __init__(self, source=None):
+        """@type source: Location or Layer
+           @param source: Location to copy, or the layer of a location
+                          at the origin"""
+        if isinstance(source, Location):
+            self.layer = source.layer
+            self.x, self.y, self.z = source.x, source.y, source.z
+        else:
+            self.layer = source
+            self.x = self.y = self.z = 0.0
+
+    def __repr__(self):
+        return 'Location(%r, %r)' % (self.x, self.y)
+
+    def getLayer(self):
+        return self.layer
+
+    def setLayer(self, layer):
+        self.layer = layer
+
+    def getExactLayerCoordinates(self):
+        return ExactModelCoordinate(self.x, self.y, self.z)
+
+    def getLayerCoordinates(self):
+        return ModelCoordinate(round(self.x), round(self.y), round(self.z))
+
+    def setExactLayerCoordinates(self, coord):
+        self.x, self.y, self.z = float(coord.x), float(coord.y), \
+                                 float(coord.z)
+
+    setLayerCoordinates = setExactLayerCoordinates
+    getMapCoordinates = getExactLayerCoordinates
+    setMapCoordinates = setExactLayerCoordinates
+
+    def getLayerDistanceTo(self, location):
+        """@return: The distance to another location on the layer"""
+        return math.hypot(location.x - self.x, location.y - self.y)
+
+class Action(object):
+    def __init__(self, id):
+        self.id = id
+
+    def getId(self):
+        return self.id
+
+class InstanceActionListener(object):
+    """Base class of the objects told about finished actions."""
+    def __init__(self):
+        pass
+
+    def onInstanceActionFinished(self, instance, action):
+        pass
+
+class Instance(object):
+    """Something placed on a layer that moves and acts. Actions progress
+       only when update is called."""
+    def __init__(self, object, location, id=''):
+        """@type object: string
+           @param object: The FIFE object the instance would show
+           @type location: Location
+           @param location: Where the instance starts
+           @type id: string
+           @param id: The instance ID"""
+        self.object = object
+        self.id = id
+        self.location = Location(location)
+        self.facing = Location(location)
+        self.listeners = []
+        self.actions = {}
+        # the running action
+        self.action = None
+        self.target = None
+        self.speed = 0.0
+        self.time_left = 0.0
+        self.repeating = False
+
+    def __repr__(self):
+        return 'Instance(%r)' % self.id
+
+    def getId(self):
+        return self.id
+
+    def getObject(self):
+        return self.object
+
+    def getLocation(self):
+        return Location(self.location)
+
+    def getLocationRef(self):
+        return self.location
+
+    def setLocation(self, location):
+        self.location = Location(location)
+
+    def getFacingLocation(self):
+        return Location(self.facing)
+
+    def setFacingLocation(self, location):
+        self.facing = Location(location)
+
+    def getCurrentAction(self):
+        return self.action
+
+    def addActionListener(self, listener):
+        if listener not in self.listeners:
+            self.listeners.append(listener)
+
+    def removeActionListener(self, listener):
+        if listener in self.listeners:
+            self.listeners.remove(listener)
+
+    def _startAction(self, action_name):
+        if action_name not in self.actions:
+            self.actions[action_name] = Action(action_name)
+        self.action = self.actions[action_name]
+
+    def move(self, action_name, target, speed):
+        """Moves in a straight line to the target, then finishes the action.
+           @type action_name: string
+           @param action_name: The action shown while moving
+           @type target: Location
+           @param target: Where to go
+           @type speed: float
+           @param speed: Layer units per second
+           @return: None"""
+        self._startAction(action_name)
+        self.target = Location(target)
+        self.facing = Location(target)
+        self.speed = float(speed)
+
+    def act(self, action_name, facing, repeating=False):
+        """Runs an action in place for ACTION_TIME seconds, or until another
+           one is started if it is repeating.
+           @type action_name: string
+           @param action_name: The action
+           @type facing: Location
+           @param facing: Where the instance looks while acting
+           @type repeating: boolean
+           @param repeating: Whether the action never finishes
+           @return: None"""
+        self._startAction(action_name)
+        self.target = None
+        self.facing = Location(facing)
+        self.time_left = ACTION_TIME
+        self.repeating = repeating
+
+    def update(self, step):
+        """Advances the running action.
+           @type step: float
+           @param step: Seconds that passed
+           @return: None"""
+        if self.action is None:
+            return
+        if self.target is not None:
+            distance = self.location.getLayerDistanceTo(self.target)
+            travel = self.speed * step
+            if travel < distance:
+                fraction = travel / distance
+                self.location.x += (self.target.x - self.location.x) * fraction
+                self.location.y += (self.target.y - self.location.y) * fraction
+                return
+            self.location.x, self.location.y = self.target.x, self.target.y
+        else:
+            self.time_left -= step
+            if self.time_left > 0 or self.repeating:
+                return
+        self.finishAction()
+
+    def finishAction(self):
+        """Ends the running action and tells the listeners.
+           @return: None"""
+        action = self.action
+        self.action = None
+        self.target = None
+        for listener in list(self.listeners):
+            listener.onInstanceActionFinished(self, action)
+
+class Layer(object):
+    """The instances of one map layer."""
+    def __init__(self, id):
+        self.id = id
+        self.instances = []
+        self.instance_ids = {}
+
+    def getId(self):
+        return self.id
+
+    def createInstance(self, object, coord, id=''):
+        """@type coord: ExactModelCoordinate
+           @param coord: Position of the instance on this layer
+           @return: The new Instance"""
+        location = Location(self)
+        location.setExactLayerCoordinates(coord)
+        instance = Instance(object, location, id)
+        self.instances.append(instance)
+        if id:
+            self.instance_ids[id] = instance
+        return instance
+
+    def deleteInstance(self, instance):
+        self.instances.remove(instance)
+        if self.instance_ids.get(instance.id) is instance:
+            del self.instance_ids[instance.id]
+
+    def getInstance(self, id):
+        return self.instance_ids.get(id)
+
+    def getInstances(self):
+        return list(self.instances)
+
+    def update(self, step):
+        """Advances the actions of all instances.
+           @return: None"""
+        for instance in list(self.instances):
+            instance.update(step)
+
+def _cachedInstances(cache):
+    """Reads the layers of a compiled map.
+       @type cache: mapcache.MapCache
+       @return: Iterator over (layer ID, instance tuples) pairs, the tuples
+                as given by MapCache.instances"""
+    for attributes, first, count in cache.layers():
+        yield attributes.get('id'), cache.instances(first, count)
+
+def _xmlInstances(root):
+    """Reads the layers of a parsed map file, like _cachedInstances.
+       @type root: Element
+       @param root: The <map> element"""
+    for layer in root.findall('layer'):
+        records = []
+        for inst in mapcache.instanceElements(layer):
+            attributes = None
+            if inst.get('object_type'):
+                attributes = dict([(name, inst.get(name)) for name in
+                                   mapcache.OBJECT_ATTRIBUTES
+                                   if inst.get(name) is not None])
+            x, y = inst.get('x'), inst.get('y')
+            records.append((inst.get('object') or inst.get('obj') or
+                            inst.get('o'), None,
+                            float(x) if x else None, float(y) if y else None,
+                            float(inst.get('z') or 0.0), None, None,
+                            inst.get('id') or '', attributes))
+        yield layer.get('id'), records
+
+class HeadlessMap(object):
+    """A loaded map without graphics, in place of map.Map."""
+    def __init__(self, data):
+        """@type data: engine.Engine
+           @param data: The engine that gets the objects of the map"""
+        self.data = data
+        self.layers = {}
+        self.agent_layer = None
+        self.obj_hash = {}
+        self.pc = None
+        self.pc_instance = None
+
+    def load(self, filename):
+        """Creates the game objects of a map file. The compiled map cache
+           is used, and written if it is missing or out of date.
+           @type filename: string
+           @param filename: File of the map
+           @return: None"""
+        cache = mapcache.openMapCache(filename)
+        if cache is None:
+            root = ET.parse(filename).getroot()
+            try:
+                mapcache.compileMap(filename, root)
+                cache = mapcache.openMapCache(filename)
+            except (IOError, OSError), e:
+                print 'Could not write the map cache for ' + filename + \
+                      ': ' + str(e)
+        if cache is None:
+            self.createLayers(_xmlInstances(root))
+            return
+        try:
+            self.createLayers(_cachedInstances(cache))
+        finally:
+            cache.close()
+
+    def createLayers(self, layers):
+        """Creates the object instances of the layers and hands them to the
+           engine, a batch per layer. Positions missing in the file are
+           filled in the way the map loader does it.
+           @type layers: iterable
+           @param layers: (layer ID, instance tuples) pairs
+           @return: None"""
+        last_x, last_y = 0.0, 0.0
+        for layer_id, instances in layers:
+            layer = Layer(layer_id)
+            self.layers[layer_id] = layer
+            records = []
+            for (object_id, nspace, x, y, z, rotation, stackpos, id,
+                 attributes) in instances:
+                if x is None:
+                    x = last_x + 1
+                if y is None:
+                    y = last_y
+                last_x, last_y = x, y
+                if attributes is None:
+                    continue
+                instance = layer.createInstance(object_id,
+                                    ExactModelCoordinate(x, y, z), id)
+                inst_dict = {}
+                inst_dict["type"] = attributes.get('object_type')
+                inst_dict["id"] = id
+                inst_dict["xpos"] = x
+                inst_dict["ypos"] = y
+                inst_dict["gfx"] = object_id
+                inst_dict["is_open"] = attributes.get('is_open')
+                inst_dict["locked"] = attributes.get('locked')
+                inst_dict["name"] = attributes.get('name')
+                inst_dict["text"] = attributes.get('text')
+                inst_dict["target_map_name"] = \
+                                        attributes.get('target_map_name')
+                inst_dict["target_map"] = attributes.get('target_map')
+                inst_dict["target_pos"] = (attributes.get('target_x'),
+                                           attributes.get('target_y'))
+                records.append((inst_dict, instance))
+            if records:
+                self.data.createObjects(layer, records)
+        self.agent_layer = self.layers.get('ObjectLayer')
+
+    def reset(self):
+        """Drops the layers and objects of the map.
+           @return: None"""
+        self.layers = {}
+        self.agent_layer = None
+        self.obj_hash = {}
+        self.pc = None
+        self.pc_instance = None
+
+    def makeActive(self):
+        pass
+
+    def makeInactive(self):
+        pass
+
+    def instanceCount(self):
+        """@return: The number of instances on the map"""
+        return sum([len(layer.instances) for layer in self.layers.values()])
+
+    def addPC(self, agent):
+        """@type agent: Instance
+           @param agent: The instance of the PC
+           @return: None"""
+        self.pc_instance = agent
+
+    def addObject(self, name, obj):
+        """@type name: string
+           @param name: ID of the object
+           @type obj: Instance
+           @param obj: The instance of the object
+           @return: None"""
+        self.obj_hash[name] = obj
+
+    def streamChunks(self):
+        pass
+
+    def update(self, step):
+        """Advances the actions of all instances on the map.
+           @return: None"""
+        for layer in self.layers.values():
+            layer.update(step)
+
+class HeadlessWorld(object):
+    """A view without rendering, input or sound, in place of world.World.
+       Maps load synchronously, and the active map's instances act when
+       tick is run, usually as a tick handler of the engine's clock."""
+    def __init__(self):
+        # the engine, set by whoever creates it
+        self.data = None
+        self.maps = {}
+        self.active_map = None
+
+    def loadMap(self, map_name, filename):
+        """Loads a map and stores it under the given name.
+           @type map_name: text
+           @param map_name: The name of the map to load
+           @type filename: text
+           @param filename: File which contains the map to be loaded
+           @return: None"""
+        if not map_name in self.maps:
+            map = HeadlessMap(self.data)
+            self.maps[map_name] = map
+            self.setActiveMap(map_name)
+            map.load(filename)
+
+    startMapLoad = loadMap
+
+    def stepMapLoad(self):
+        """@return: True, maps are loaded by startMapLoad already"""
+        return True
+
+    def asyncMapLoads(self):
+        """@return: False, map changes load the map at once"""
+        return False
+
+    def prefetchMap(self, map_name, filename):
+        pass
+
+    def retainPrefetchedMaps(self, filenames):
+        pass
+
+    def setActiveMap(self, map_name):
+        """Sets the active map, the one whose instances act.
+           @type map_name: text
+           @param map_name: The name of the map
+           @return: None"""
+        self.active_map = self.maps[map_name]
+
+    def clearMaps(self):
+        """Unloads all maps.
+           @return: None"""
+        for map in self.maps.values():
+            map.reset()
+        self.maps = {}
+        self.active_map = None
+
+    def teleport(self, position):
+        """Puts the PC at a position of the active map.
+           @type position: String Tuple
+           @param position: X,Y coordinates passed from engine.changeMap
+           @return: None"""
+        location = Location(self.active_map.agent_layer)
+        location.setMapCoordinates(DoublePoint3D(float(position[0]),
+                                                 float(position[1]), 0))
+        self.data.game_state.PC.teleport(location)
+
+    def tick(self, step):
+        """Advances the actions on the active map, a tick handler.
+           @type step: float
+           @param step: Length of the tick in seconds
+           @return: None"""
+        if self.active_map is not None:
+            self.active_map.update(step)
+
+    def pump(self):
+        pass
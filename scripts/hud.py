@@ -74,6 +74,7 @@ class Hud(object):
         self.initializeHelpMenu()
         self.initializeEvents()
         self.initializeQuitDialog()
+        self.initializeLoadingWindow()
 
     def initializeHud(self):
         """Initialize and show the main HUD
@@ -201,6 +202,7 @@ class Hud(object):
         k_text += "[br] I : Toggle the inventory screen"
         k_text += "[br] F5 : Take a screenshot"
         k_text += "[br]      (saves to <parpg>/screenshots/)"
+        k_text += "[br] F6 : Quick save"
         k_text += "[br] Q : Quit the game"
         self.help_dialog.distributeInitialData({
                 "MainHelpText":main_help_text,
@@ -328,6 +330,37 @@ class Hud(object):
         self.quit_window.mapEvents(events_to_map)
 
 
+    def initializeLoadingWindow(self):
+        """Initialize the window shown while a map is loaded
+           @return: None"""
+        self.loading_window = pychan.loadXML("gui/loading.xml")
+
+    def showLoading(self, filename):
+        """Show the loading window.
+           @type filename: string
+           @param filename: The map file being loaded
+           @return: None"""
+        self.loading_window.findChild(name="loadingText").text = \
+                                        unicode("Loading " + filename)
+        self.updateLoading("reading map", 0.0)
+        self.loading_window.show()
+
+    def updateLoading(self, text, progress):
+        """Show the progress of a map load; used as the map loader
+           callback.
+           @type text: string
+           @param text: What the loader just did
+           @type progress: float
+           @param progress: Fraction of the load done, 0 to 1
+           @return: None"""
+        self.loading_window.findChild(name="loadingProgress").text = \
+                unicode("%.0f%% - %s" % (progress * 100, text))
+
+    def hideLoading(self):
+        """Hide the loading window.
+           @return: None"""
+        self.loading_window.hide()
+
     def quitGame(self):
         """Called when user requests to quit game.
            @return: None"""
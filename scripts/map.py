@@ -17,20 +17,49 @@
 
 import fife
 import time
-from local_loaders.loaders import loadMapFile
+from local_loaders.loaders import loadMapFile, MapLoad
 from scripts.common.eventlistenerbase import EventListenerBase
 
 from settings import Setting
 TDS = Setting()
 
+class MapSettings(object):
+    """The map loading settings, read once when the world is set up. A
+       settings.xml from before a setting was added gets the value of
+       settings-dist.xml for it."""
+    def __init__(self, settings):
+        """@type settings: settings.Setting
+           @param settings: The settings to read"""
+        read = settings.readSetting
+        self.stream = read("StreamMaps", default="0") == "1"
+        self.cache = read("MapCache", default="1") == "1"
+        self.import_workers = int(read("ImportWorkers", default="4") or 0)
+        self.prefetch = read("PrefetchMaps", default="1") == "1"
+        self.profile_file = read("MapLoadProfile")
+        self.chunk_size = float(read("MapChunkSize", default="0") or 0)
+        self.chunk_radius = int(read("MapChunkRadius", default="2") or 0)
+        # in seconds
+        self.chunk_load_time = \
+                float(read("MapChunkLoadTime", default="4") or 0) / 1000
+        self.async_load = read("AsyncMapLoad", default="1") == "1"
+        # in seconds
+        self.load_time = float(read("MapLoadTime", default="10") or 0) / 1000
+        self.resident_maps = max(int(read("ResidentMaps", default="3") or 1),
+                                 1)
+        self.resident_instances = \
+                int(read("ResidentInstances", default="20000") or 0)
+
 class Map(fife.MapChangeListener):
     """Map class used to flag changes in the map"""
-    def __init__(self, engine, data):
+    def __init__(self, engine, data, settings):
+        """@type settings: MapSettings
+           @param settings: How the map is loaded"""
         # init mapchange listener
         fife.MapChangeListener.__init__(self)
         self.map = None
         self.engine = engine
         self.data = data
+        self.settings = settings
         
         # init map attributes
         self.cameras = {}
@@ -44,33 +73,60 @@ class Map(fife.MapChangeListener):
         self.cam2_scrolling_right = True
         self.target_rotation = 0
         self.outline_renderer = None
+        # timing breakdown of the last load, see local_loaders.loadprofile
+        self.load_profile = None
+        # scenery chunks of the map, None if the map is not chunked
+        self.chunks = None
+        self.pc_instance = None
+        # the PC object of this map, see Engine.addPC
+        self.pc = None
+        # the map's cameras are in the view as <camera_prefix><camera id>
+        self.camera_prefix = ''
         
     def reset(self):
         """Reset the data to default settings.
            @return: None"""
-        # We have to delete the map in Fife.
+        # The cameras of other loaded maps stay in the view, only ours go
+        for cam in self.cameras.values():
+            self.view.removeCamera(cam)
+        self.cameras = {}
+        # We have to delete the map in Fife. The object definitions stay in
+        # the model, the other loaded maps use them too; World.clearMaps
+        # deletes them together with the import registry
         # TODO: We're killing the PC now, but later we will have to save the PC
         if self.map:
-            self.model.deleteObjects()
             self.model.deleteMap(self.map)
         self.transitions = []
         self.obj_hash = {}
         self.map = None
         self.agent_layer = None
-        # We have to clear the cameras in the view as well, or we can't reuse
-        # camera names like 'main'
-        self.view.clearCameras()
-        self.cameras = {}
         self.cur_cam2_x = 0
         self.initial_cam2_x = 0
         self.cam2_scrolling_right = True
         self.target_rotation = 0
         self.outline_renderer = None
+        self.load_profile = None
+        self.chunks = None
+        self.pc_instance = None
+        self.pc = None
         
     def makeActive(self):
         """Makes this map the active one.
         """
-        pass
+        for cam in self.cameras.values():
+            cam.setEnabled(True)
+
+    def makeInactive(self):
+        """Stops rendering this map, it stays loaded.
+           @return: None"""
+        for cam in self.cameras.values():
+            cam.setEnabled(False)
+
+    def instanceCount(self):
+        """@return: The number of FIFE instances on the map"""
+        if not self.map:
+            return 0
+        return sum([len(layer.getInstances()) for layer in self.map.getLayers()])
         
     def load(self, filename):
         """Load a map given the filename.
@@ -78,7 +134,48 @@ class Map(fife.MapChangeListener):
            @param filename: Name of map to load
            @return: None"""
         self.reset()
-        self.map = loadMapFile(filename, self.engine, self.data)
+        self.camera_prefix = filename + ':'
+        self.map = loadMapFile(filename, self.engine, self.data,
+                               camera_prefix=self.camera_prefix,
+                               **self.loadOptions())
+        self.setup()
+
+    def startLoad(self, filename, callback=None):
+        """Starts loading a map over the next frames. The map is built by
+           stepping the returned load, after that finishLoad sets it up.
+           @type filename: string
+           @param filename: Name of map to load
+           @type callback: function
+           @param callback: Progress callback, callback(string, float)
+           @rtype: local_loaders.loaders.MapLoad
+           @return: The running load"""
+        self.reset()
+        self.camera_prefix = filename + ':'
+        return MapLoad(filename, self.engine, self.data, callback,
+                       camera_prefix=self.camera_prefix, **self.loadOptions())
+
+    def finishLoad(self, map_load):
+        """Sets up the map built by a load begun with startLoad.
+           @type map_load: local_loaders.loaders.MapLoad
+           @param map_load: The finished load
+           @return: None"""
+        self.map = map_load.map
+        self.setup()
+
+    def loadOptions(self):
+        """@return: The loader options from the settings, as keyword
+                   arguments of loadMapFile"""
+        return {'stream': self.settings.stream,
+                'cache': self.settings.cache,
+                'import_workers': self.settings.import_workers,
+                'profile_file': self.settings.profile_file,
+                'chunk_size': self.settings.chunk_size}
+
+    def setup(self):
+        """Initializes the layers, cameras and renderers of the loaded map.
+           @return: None"""
+        self.load_profile = self.map.loadProfile
+        self.chunks = self.map.chunks
          
         # there must be a PC object on the objects layer!
         self.agent_layer = self.map.getLayer('ObjectLayer')
@@ -91,8 +188,10 @@ class Map(fife.MapChangeListener):
                 self.transitions.append(self.map.getLayer(layer.getId()))
                 
         # init the camera
+        size = len(self.camera_prefix)
         for cam in self.view.getCameras():
-            self.cameras[cam.getId()] = cam
+            if cam.getId()[:size] == self.camera_prefix:
+                self.cameras[cam.getId()[size:]] = cam
         self.view.resetRenderers()
         self.target_rotation = self.cameras['main'].getRotation()
         
@@ -107,6 +206,11 @@ class Map(fife.MapChangeListener):
                                                        strip=False)))
         rend.changeDefaultFont(text)
                 
+        # the chunks around the camera are there before the first frame
+        if self.chunks:
+            self.chunks.update(self.chunkFocus(), self.chunkRadius())
+            self.chunks.flush()
+                
     def addPC(self, agent):
         """Add the player character to the map
            @type agent: Fife.instance of PC
@@ -116,6 +220,7 @@ class Map(fife.MapChangeListener):
         # was already used, we simply recycle it. 
         if self.cameras['main'].getAttached() == None:
             self.cameras['main'].attach(agent)
+        self.pc_instance = agent
 
     def addObject(self, name, obj):
         """Add an object to this map0
@@ -128,6 +233,35 @@ class Map(fife.MapChangeListener):
         # save it for later use
         self.obj_hash[name]=obj
         
+    def chunkRadius(self):
+        """@return: The distance, in chunks, up to which chunks are loaded"""
+        return self.settings.chunk_radius
+
+    def chunkFocus(self):
+        """Returns the points the loaded chunks are centered on: the main
+           camera and the PC. They are map coordinates, the chunks of each
+           layer convert them into its own.
+           @return: List of (x, y) map coordinates"""
+        points = []
+        locations = [self.cameras['main'].getLocationRef()]
+        if self.pc_instance is not None:
+            locations.append(self.pc_instance.getLocationRef())
+        for location in locations:
+            coords = location.getMapCoordinates()
+            points.append((coords.x, coords.y))
+        return points
+
+    def streamChunks(self):
+        """Loads the chunks that came into range and releases those that
+           left it, spending at most MapChunkLoadTime milliseconds.
+           Called once per frame.
+           @return: None"""
+        if not self.chunks:
+            return
+        self.chunks.update(self.chunkFocus(), self.chunkRadius())
+        if self.chunks.pending:
+            self.chunks.step(self.settings.chunk_load_time)
+
     def toggle_renderer(self, r_name):
         """Enable or disable a renderer.
            @return: None"""
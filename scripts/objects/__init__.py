@@ -16,19 +16,55 @@
 #   along with PARPG.  If not, see <http://www.gnu.org/licenses/>.
 import containers, doors
 import actors
+import inspect
 import sys
 
 object_modules = [containers, actors, doors]
 
+# class name -> concrete game object class
+object_classes = {}
+# class -> names of the keyword arguments its constructor uses
+_keywords = {}
+
+def constructorKeywords(cls):
+    """Returns the keyword arguments a game object class uses. The mixin
+       constructors take what the composed ones pass on as **kwargs, so
+       the constructors of the bases count as well, up to the first one
+       that takes no **kwargs.
+       @type cls: class
+       @param cls: The game object class
+       @rtype: frozenset
+       @return: The argument names"""
+    names = set()
+    for klass in cls.__mro__:
+        init = klass.__dict__.get('__init__')
+        if not inspect.isfunction(init):
+            continue
+        args, varargs, varkw, defaults = inspect.getargspec(init)
+        names.update(args[1:])
+        if varkw is None:
+            break
+    return frozenset(names)
+
+def registerObject(cls, name=None):
+    """Makes a concrete game object class known to createObject.
+       @type cls: class
+       @param cls: The class
+       @type name: String
+       @param name: The object type it is created for, by default the name
+                    of the class
+       @return: None"""
+    object_classes[name or cls.__name__] = cls
+    _keywords[cls] = constructorKeywords(cls)
+
+for module in object_modules:
+    for class_name in module.__all__:
+        registerObject(getattr(module, class_name), class_name)
+
 def getAllObjects ():
     """Returns a dictionary with the names of the concrete game object classes
     mapped to the classes themselves"""
-    result = {}
-    for module in object_modules:
-        for class_name in module.__all__:
-            result[class_name] = getattr (module,class_name)
-            
-    return result
+    return dict(object_classes)
 
 def createObject(info, extra = {}):
         """Called when we need to get an actual object. 
@@ -37,6 +73,18 @@ def createObject(info, extra = {}):
            @type extra: dict
            @param extra: stores additionally required attributes, like agent layer, engine etc.
            @return: the object"""
+        return createObjects([info], extra)[0]
+
+def createObjects(infos, extra = {}):
+        """Creates a list of objects.
+           @type infos: list
+           @param infos: info dictionaries as taken by createObject
+           @type extra: dict
+           @param extra: stores additionally required attributes, shared by all objects
+           @return: the objects, in the order of infos"""
+        return [_createObject(info, extra) for info in infos]
+
+def _createObject(info, extra):
         # First, we try to get the type and ID, which every game_obj needs.
         try:
             obj_type = info.pop('type')
@@ -49,5 +97,8 @@ def createObject(info, extra = {}):
         for key, val in extra.items():
             info[key] = val
 
-        # this is for testing purposes
-        return getAllObjects()[obj_type](ID, **info)
+        # leave out what the class has no use for
+        cls = object_classes[obj_type]
+        keywords = _keywords[cls]
+        return cls(ID, **dict([(key, val) for key, val in info.items()
+                               if key in keywords]))
@@ -17,6 +17,11 @@
 
 class Action(object):
     """Base Action class, to define the structure"""
+    def prepare(self):
+        """Called when the PC starts moving towards the place where the
+           action will be executed. To be overwritten"""
+        pass
+
     def execute(self):
         """To be overwritten"""
         pass
@@ -40,6 +45,10 @@ class ChangeMapAction(Action):
         self.target_map_name = target_map_name
         self.target_map_file = target_map_file
 
+    def prepare(self):
+        """Starts fetching the target map in the background."""
+        self.engine.prefetchMap(self.target_map_name, self.target_map_file)
+
     def execute(self):
         """Executes the map change."""
         self.engine.changeMap(self.target_map_name, self.target_map_file,\
@@ -14,8 +14,11 @@
 
 #   You should have received a copy of the GNU General Public License
 #   along with PARPG.  If not, see <http://www.gnu.org/licenses/>.
-import fife
-from scripts import world
+try:
+    import fife
+except ImportError:
+    # no renderer, run on the in-memory stand-ins
+    from scripts import headless as fife
 from base import *
 
 """All actors go here. Concrete classes only."""
@@ -103,18 +106,26 @@ class PlayerCharacter (GameObject, Living, CharStats):
     """
     PC class
     """
+    is_PC = True
+    slots = ('inventory', 'state', 'behaviour')
+
     def __init__ (self, ID, agent_layer = None, **kwargs):
         GameObject.__init__( self, ID, **kwargs )
         Living.__init__( self, **kwargs )
         CharStats.__init__( self, **kwargs )
-
-        self.is_PC = True
         
         # PC _has_ an inventory, he _is not_ one
         self.inventory = None
         
         self.state = _AGENT_STATE_NONE
         self.behaviour = PCBehaviour(self, agent_layer)
+
+    def __getstate__(self):
+        """Returns the state to pickle, without the behaviour: it holds
+           FIFE objects"""
+        state = GameObject.__getstate__(self)
+        state['behaviour'] = None
+        return state
     
     def setup(self):
         """@return: None"""
@@ -157,6 +168,8 @@ class PlayerCharacter (GameObject, Living, CharStats):
            @return: None"""
         self.state = _AGENT_STATE_APPROACH
         self.behaviour.nextAction = action
+        if action is not None:
+            action.prepare()
         boxLocation = tuple([int(float(i)) for i in location])
         l = fife.Location(self.behaviour.agent.getLocation())
         l.setLayerCoordinates(fife.ModelCoordinate(*boxLocation))
@@ -229,6 +242,9 @@ class NonPlayerCharacter(GameObject, Living, Scriptable, CharStats):
     """
     NPC class
     """
+    is_NPC = True
+    slots = ('inventory', 'behaviour')
+
     def __init__(self, ID, agent_layer = None, name = 'NPC', \
                  text = 'A nonplayer character', **kwargs):
         # init game object
@@ -237,11 +253,17 @@ class NonPlayerCharacter(GameObject, Living, Scriptable, CharStats):
         Scriptable.__init__( self, **kwargs )
         CharStats.__init__( self, **kwargs )
 
-        self.is_NPC = True
         self.inventory = None
         
         self.behaviour = NPCBehaviour(self, agent_layer)
 
+    def __getstate__(self):
+        """Returns the state to pickle, without the behaviour: it holds
+           FIFE objects"""
+        state = GameObject.__getstate__(self)
+        state['behaviour'] = None
+        return state
+
     def getLocation(self):
         """ Get the NPC's position as a fife.Location object. Basically a
             wrapper.
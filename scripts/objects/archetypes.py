@@ -0,0 +1,121 @@
+#!/usr/bin/python
+
+#   This file is part of PARPG.
+
+#   PARPG is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+
+#   PARPG is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+
+#   You should have received a copy of the GNU General Public License
+#   along with PARPG.  If not, see <http://www.gnu.org/licenses/>.
+
+"""The data all objects of a kind share: gfx, name, text and desc. An
+   archetype is named after the FIFE object the instances show, so the
+   objects find theirs by their gfx. Objects only keep the values that
+   differ from their archetype (see GameObject), so a change to an
+   archetype shows on all its objects."""
+
+import os
+import sys
+
+try:
+    import xml.etree.cElementTree as ET
+except ImportError:
+    import xml.etree.ElementTree as ET
+
+# the game's data directory, two up from this package
+DATA_DIR = os.path.dirname(os.path.dirname(os.path.dirname(
+                            os.path.abspath(__file__))))
+ARCHETYPE_FILE = os.path.join(DATA_DIR, 'objects', 'archetypes.xml')
+FIELDS = ('name', 'text', 'desc', 'gfx')
+
+class Archetype(object):
+    """The shared data of one kind of object."""
+    __slots__ = ('ID',) + FIELDS
+
+    def __init__(self, ID, name=None, text=None, desc=None, gfx=None):
+        """@type ID: String
+           @param ID: Name of the archetype, the FIFE object ID
+           @type gfx: String
+           @param gfx: The graphics, by default the archetype's ID
+           @param name, text, desc: As in GameObject, None if the archetype
+                                    has no value for them"""
+        self.ID = ID
+        self.name = name
+        self.text = text
+        self.desc = desc
+        self.gfx = gfx or ID
+
+    def update(self, other):
+        """Takes over the values of another archetype, in place so the
+           objects of this one see them.
+           @return: None"""
+        for field in FIELDS:
+            setattr(self, field, getattr(other, field))
+
+    def __repr__(self):
+        return "<Archetype:%s>" % self.ID
+
+# what an object without archetype, or with an archetype that lacks a
+# value, falls back to
+GENERIC = Archetype(None, name="Generic object", text="Item description",
+                    desc="Detailed description", gfx={})
+
+class ArchetypeTable(object):
+    """All archetypes by ID. The default archetype file is loaded when the
+       first archetype is looked up. If it is missing that is reported,
+       and the objects fall back to GENERIC."""
+    def __init__(self, filename=ARCHETYPE_FILE):
+        """@type filename: String
+           @param filename: The archetype file loaded on the first lookup"""
+        self.filename = filename
+        self.archetypes = {}
+        self.loaded = False
+
+    def __contains__(self, ID):
+        return self.get(ID) is not None
+
+    def get(self, ID):
+        """@type ID: String
+           @param ID: Name of the archetype
+           @return: The archetype, or None if there is none of that name"""
+        if not self.loaded:
+            self.loaded = True
+            if os.path.exists(self.filename):
+                self.load(self.filename)
+            else:
+                sys.stderr.write("Error: Can't find archetype file: %s\n"
+                                 % self.filename)
+        return self.archetypes.get(ID)
+
+    def add(self, archetype):
+        """Adds an archetype. An archetype that already exists is updated in
+           place.
+           @type archetype: Archetype
+           @return: The archetype in the table"""
+        current = self.archetypes.get(archetype.ID)
+        if current is None:
+            self.archetypes[archetype.ID] = current = archetype
+        else:
+            current.update(archetype)
+        return current
+
+    def load(self, filename):
+        """Loads the <archetype> elements of an archetype file. Each has an
+           id attribute and optionally the fields as attributes.
+           @type filename: String
+           @param filename: The file
+           @return: None"""
+        self.loaded = True
+        root = ET.parse(filename).getroot()
+        for element in root.findall('archetype'):
+            values = dict([(field, element.get(field)) for field in FIELDS])
+            self.add(Archetype(element.get('id'), **values))
+
+archetypes = ArchetypeTable()
@@ -25,14 +25,20 @@
       them as keyword ones. Only GameObject would use positional arguments.
    2. In __init__() **ALWAYS** call the parent's __init__(**kwargs), preferably 
       *at the end* of your __init__() (makes it easier to follow)
-   3. There should always be an is_x class member set to True on __init__ 
-      (where X is the name of the class)
+   3. There should always be an is_x class member set to True
+      (where X is the name of the class). It is a class attribute, so it
+      becomes a bit of the capability mask of the composed classes (see
+      CAPABILITIES); flags that change per object are Flag attributes.
+   4. List the attributes your __init__() sets in a slots class member.
+      Don't give the class __slots__: a class can only have one base with
+      __slots__, so the composed classes get them instead.
 
    EXAMPLE:
 
    class Openable(object):
+       is_openable = True
+       slots = ('is_open',)
        def __init__ (self, is_open = True, **kwargs):
-           self.is_openable = True
            self.is_open = is_open
            super(Openable,self).__init__ (**kwargs)
         
@@ -50,21 +56,120 @@
        def __init__ (self, *args, **kwargs):
            super(TinCan,self).__init__ (*args, **kwargs)
            self.name = 'Tin Can'"""
-import fife
 from settings import Setting
 from random import randrange
+from archetypes import archetypes, FIELDS, GENERIC
+
+# The capabilities of the objects with a fixed bit each: the flags of
+# objects are pickled as a number, so only add to the end of this list.
+# Other is_x names get a bit once a class sets them.
+CAPABILITIES = ['openable', 'lockable', 'carryable', 'container', 'inventory',
+                'living', 'scriptable', 'charstats', 'wearable', 'usable',
+                'weapon', 'destructable', 'trappable', 'door', 'PC', 'NPC']
+_capability_bits = dict([(name, 1 << i)
+                         for i, name in enumerate(CAPABILITIES)])
+
+def registerCapability(name):
+    """Returns the bit of a capability, giving it one if it has none yet.
+       Only GameObjectType and Flag register capabilities, for the classes
+       and flags that have them.
+       @type name: String
+       @param name: The capability, the x of is_x
+       @rtype: integer
+       @return: The bit"""
+    bit = _capability_bits.get(name)
+    if bit is None:
+        CAPABILITIES.append(name)
+        bit = _capability_bits[name] = 1 << (len(CAPABILITIES) - 1)
+    return bit
+
+def capabilityBit(name):
+    """@type name: String
+       @param name: The capability, the x of is_x
+       @rtype: integer
+       @return: The bit of the capability, 0 if no class has it"""
+    return _capability_bits.get(name, 0)
+
+def capabilityMask(*names):
+    """@return: The bits of all the given capabilities, for
+                GameObject.hasCapabilities
+       @raise ValueError: No class has one of the capabilities"""
+    mask = 0
+    for name in names:
+        bit = capabilityBit(name)
+        if not bit:
+            raise ValueError("Unknown capability: %s" % name)
+        mask |= bit
+    return mask
+
+class Flag(object):
+    """An is_x attribute that changes per object, e.g. is_living. It is
+       kept as a bit of the object's flags, the bit of its capability."""
+    def __init__(self, name):
+        """@type name: String
+           @param name: The capability, the x of is_x"""
+        self.name = name
+        self.bit = registerCapability(name)
+
+    def __get__(self, obj, cls):
+        if obj is None:
+            return self
+        return bool(obj.flags & self.bit)
+
+    def __set__(self, obj, value):
+        if value:
+            obj.flags |= self.bit
+        else:
+            obj.flags &= ~self.bit
+
+class GameObjectType(type):
+    """Metaclass of the game objects. Every class gets the capability_mask
+       of the is_x = True class attributes it and its bases have. A class
+       without __slots__ of its own gets __slots__ for the attributes in
+       the slots members of its bases that have no slot yet."""
+    def __new__(mcs, name, bases, namespace):
+        if '__slots__' not in namespace:
+            wanted = set(namespace.get('slots', ()))
+            have = set()
+            for base in bases:
+                for klass in base.__mro__:
+                    wanted.update(klass.__dict__.get('slots', ()))
+                    have.update(klass.__dict__.get('__slots__', ()))
+            namespace['__slots__'] = tuple(sorted(wanted - have))
+        return super(GameObjectType, mcs).__new__(mcs, name, bases, namespace)
+
+    def __init__(cls, name, bases, namespace):
+        super(GameObjectType, cls).__init__(name, bases, namespace)
+        mask = 0
+        slot_names = set()
+        for klass in cls.__mro__:
+            for attr, value in klass.__dict__.items():
+                if attr.startswith('is_') and value is True:
+                    mask |= registerCapability(attr[3:])
+            slot_names.update(klass.__dict__.get('__slots__', ()))
+        cls.capability_mask = mask
+        cls.slot_names = frozenset(slot_names) - \
+                         frozenset(['__dict__', '__weakref__'])
 
 class GameObject (object):
     """A base class to be inherited by all game objects. This must be the
        first class (left to right) inherited by any game object."""
-    def __init__ (self, ID, gfx = {}, xpos = 0.0, ypos = 0.0, map_id = None, 
-                  blocking=True, name="Generic object", text="Item description",
-                  desc="Detailed description", **kwargs):
+    __metaclass__ = GameObjectType
+    # attributes set later on fall back to the __dict__
+    __slots__ = ('ID', 'archetype', '_gfx', 'spatial_index', 'dirty_set',
+                 '_x', '_y', 'map_id', 'blocking', '_name', '_text', '_desc',
+                 'flags', '__dict__')
+
+    def __init__ (self, ID, gfx = None, xpos = 0.0, ypos = 0.0, map_id = None, 
+                  blocking=True, name=None, text=None, desc=None,
+                  archetype=None, **kwargs):
         """Set the basic values that are shared by all game objects.
+           gfx, name, text and desc are None to use the archetype's.
            @type ID: String
            @param ID: Unique object identifier. Must be present.
-           @type gfx: Dictionary
-           @param gfx: Dictionary with graphics for the different contexts       
+           @type gfx: String or Dictionary
+           @param gfx: ID of the FIFE object, or dictionary with graphics for
+                       the different contexts       
            @type coords 2-item tuple
            @param coords: Initial coordinates of the object.
            @type map_id: String
@@ -77,10 +182,25 @@ class GameObject (object):
            @param text: A longer description of the item
            @type desc: String
            @param desc: A long description of the item that is displayed when it is examined
+           @type archetype: String
+           @param archetype: ID of the archetype, by default the gfx
            """
         
         self.ID = ID
+        if archetype is None and isinstance(gfx, basestring):
+            archetype = gfx
+        # the shared data of the object's kind, see archetypes.py
+        self.archetype = None
+        if archetype is not None:
+            self.archetype = archetypes.get(archetype)
         self.gfx = gfx
+        # the set Flag attributes of the object
+        self.flags = 0
+        # the SpatialHash of the map the object is on, if any
+        self.spatial_index = None
+        # the dirty set of the map the object is on, if its changes are
+        # tracked (see GameState.trackMap)
+        self.dirty_set = None
         self.X = xpos
         self.Y = ypos
         self.map_id = map_id
@@ -91,19 +211,162 @@ class GameObject (object):
         
     def trueAttr(self, attr):
         """Shortcut function to check if the current object has a member named
-           is_%attr and if that attribute evaluates to True"""
-        return hasattr(self,'is_%s' % attr) and getattr(self, 'is_%s' % attr)
+           is_%attr and if that attribute evaluates to True. Capabilities are
+           a bit test; other names, like is_open, are looked up."""
+        bit = _capability_bits.get(attr)
+        if bit is not None:
+            return bool((self.capability_mask | self.flags) & bit)
+        return getattr(self, 'is_%s' % attr, False)
+
+    def hasCapabilities(self, mask):
+        """Checks for several capabilities at once.
+           @type mask: integer
+           @param mask: Bits of the capabilities, see capabilityMask
+           @rtype: boolean
+           @return: Whether the object has all of them"""
+        return (self.capability_mask | self.flags) & mask == mask
+
+    def markDirty(self):
+        """Records that the object changed since the last full save, if its
+           changes are tracked"""
+        if self.dirty_set is not None:
+            self.dirty_set.add(self.ID)
 
     def _getCoords(self):
         """Get-er property function"""
-        return (self.X, self.Y)
+        return (self._x, self._y)
     
     def _setCoords(self, coords):
         """Set-er property function"""
-        self.X, self.Y = float(coords[0]), float (coords[1])
+        self._x, self._y = float(coords[0]), float (coords[1])
+        if self.spatial_index is not None:
+            self.spatial_index.update(self)
+        self.markDirty()
         
     coords = property (_getCoords, _setCoords, 
         doc = "Property allowing you to get and set the obejct's coordinates via tuples")
+
+    def _getX(self):
+        """Get-er property function"""
+        return self._x
+
+    def _setX(self, x):
+        """Set-er property function"""
+        self._x = x
+        if self.spatial_index is not None:
+            self.spatial_index.update(self)
+        self.markDirty()
+
+    def _getY(self):
+        """Get-er property function"""
+        return self._y
+
+    def _setY(self, y):
+        """Set-er property function"""
+        self._y = y
+        if self.spatial_index is not None:
+            self.spatial_index.update(self)
+        self.markDirty()
+
+    X = property(_getX, _setX,
+        doc = "The object's x coordinate, kept up to date in the spatial index")
+    Y = property(_getY, _setY,
+        doc = "The object's y coordinate, kept up to date in the spatial index")
+
+    def _sharedField(field):
+        """Makes the property of a field the archetype can provide. Only
+           values that differ from the archetype's are stored."""
+        slot = '_' + field
+        def get(self):
+            value = getattr(self, slot)
+            if value is None:
+                value = getattr(self.archetype or GENERIC, field)
+                if value is None:
+                    value = getattr(GENERIC, field)
+            return value
+        def set(self, value):
+            archetype = getattr(self, 'archetype', None)
+            if archetype is not None and value == getattr(archetype, field):
+                value = None
+            setattr(self, slot, value)
+        return property(get, set,
+            doc = "The object's %s, the archetype's unless it was set" % field)
+
+    gfx = _sharedField('gfx')
+    name = _sharedField('name')
+    text = _sharedField('text')
+    desc = _sharedField('desc')
+    del _sharedField
+
+    def __getstate__(self):
+        """Returns the state to pickle, the slots and the __dict__ in one
+           dictionary; the object leaves out the spatial index and the
+           dirty set, the game state sets them again"""
+        state = self.__dict__.copy()
+        for name in self.slot_names:
+            try:
+                state[name] = getattr(self, name)
+            except AttributeError:
+                pass
+        state['spatial_index'] = None
+        state['dirty_set'] = None
+        # the archetype is looked up again when the object is loaded, only
+        # the overrides are saved
+        if self.archetype is not None:
+            state['archetype'] = self.archetype.ID
+        for field in FIELDS:
+            if state.get('_' + field) is None:
+                state.pop('_' + field, None)
+        return state
+
+    def __setstate__(self, state):
+        """Restores a pickled object, including ones saved before the
+           coordinates became properties, the capabilities bits, the
+           archetypes or the indexed containers"""
+        if 'X' in state:
+            state['_x'] = state.pop('X')
+        if 'Y' in state:
+            state['_y'] = state.pop('Y')
+        state.setdefault('spatial_index', None)
+        state.setdefault('dirty_set', None)
+        state.setdefault('flags', 0)
+        if isinstance(self, Container):
+            state.setdefault('capacity', None)
+            state.setdefault('max_weight', None)
+            state.setdefault('stacking', False)
+        shared = dict([(field, state.pop(field)) for field in FIELDS
+                       if field in state])
+        archetype = state.get('archetype')
+        if archetype is None and isinstance(shared.get('gfx'), basestring):
+            archetype = shared['gfx']
+        if archetype is not None:
+            archetype = archetypes.get(archetype)
+        state['archetype'] = archetype
+        for field in FIELDS:
+            state.setdefault('_' + field, None)
+        flags = {}
+        for attr in [attr for attr in state if attr.startswith('is_')]:
+            cls_value = getattr(self.__class__, attr, None)
+            if isinstance(cls_value, Flag):
+                flags[attr] = state.pop(attr)
+            elif cls_value is True and state[attr] is True:
+                del state[attr]
+        slot_names = self.slot_names
+        properties = {}
+        for attr, value in state.items():
+            if attr in slot_names:
+                setattr(self, attr, value)
+            elif isinstance(getattr(self.__class__, attr, None), property):
+                # saved before the attribute became a property
+                properties[attr] = value
+            else:
+                self.__dict__[attr] = value
+        for attr, value in properties.items():
+            setattr(self, attr, value)
+        for attr, value in flags.items():
+            setattr(self, attr, value)
+        for field, value in shared.items():
+            setattr(self, field, value)
     
     def __repr__(self):
         """A debugging string representation of the object"""
@@ -112,16 +375,19 @@ class GameObject (object):
 class Openable(object):
     """Adds open() and .close() capabilities to game objects
     The current state is tracked by the .is_open variable"""
+    is_openable = True
+    slots = ('is_open',)
+
     def __init__(self, is_open = True, **kwargs):
         """Init operation for openable objects
         @type is_open: Boolean
         @param is_open: Keyword boolean argument sets the initial state."""
-        self.is_openable = True
         self.is_open = is_open
     
     def open(self):
         """Opens the object, and runs an 'onOpen' script, if present"""
         self.is_open = True
+        self.markDirty()
         try:
             if self.trueAttr ('scriptable'):
                 self.runScript('onOpen')
@@ -131,6 +397,7 @@ class Openable(object):
     def close(self):
         """Opens the object, and runs an 'onClose' script, if present"""
         self.is_open = False
+        self.markDirty()
         try:
             if self.trueAttr ('scriptable'):
                 self.runScript('onClose')
@@ -139,6 +406,9 @@ class Openable(object):
         
 class Lockable (Openable):
     """Allows objects to be locked"""
+    is_lockable = True
+    slots = ('locked',)
+
     def __init__ (self, locked = False, is_open=True, **kwargs):
         """Init operation for lockable objects
         @type locked: Boolean
@@ -146,7 +416,6 @@ class Lockable (Openable):
         @type is_open: Boolean
         @param is_open: Keyword boolean argument sets the initial open state. It is ignored if locked is True -- locked objects are always closed.
         """
-        self.is_lockable = True
         self.locked = locked
         if locked :
             is_open=False
@@ -155,11 +424,13 @@ class Lockable (Openable):
     def unlock (self):
         """Handles unlocking functionality"""
         self.locked = False      
+        self.markDirty()
         
     def lock (self):
         """Handles  locking functionality"""
         self.close()
         self.locked = True
+        self.markDirty()
         
     def open (self, *args, **kwargs):
         """Adds a check to see if the object is unlocked before running the
@@ -168,26 +439,201 @@ class Lockable (Openable):
             raise ValueError ("Open failed: object locked")
         super (Lockable,self).open(*args,**kwargs)
         
+def carriedWeight(obj):
+    """Returns what an object weighs together with everything it contains.
+       @type obj: GameObject
+       @param obj: A carryable or container object
+       @rtype: float
+       @return: The weight"""
+    weight = getattr(obj, 'weight', 0.0)
+    if isinstance(obj, Container):
+        weight += obj.contentsWeight()
+    return weight
+
 class Carryable (object):
     """Allows objects to be stored in containers"""
+    is_carryable = True
+    slots = ('in_container', '_weight')
+
     def __init__ (self, **kwargs):
-        self.is_carryable = True
         self.in_container = None
-        self.weight = 1.0
+        self._weight = 1.0
+
+    def _getWeight(self):
+        """Get-er property function"""
+        return self._weight
+
+    def _setWeight(self, weight):
+        """Set-er property function"""
+        delta = weight - getattr(self, '_weight', 0.0)
+        self._weight = weight
+        container = getattr(self, 'in_container', None)
+        if container is not None:
+            container._weightChanged(self, delta)
+
+    weight = property(_getWeight, _setWeight,
+        doc = "The object's own weight, kept up to date in its container")
+
+    def stackKey(self):
+        """Items with equal keys stack in containers that stack items.
+           @return: The key"""
+        return (self.__class__, getattr(self.archetype, 'ID', None),
+                self._gfx, self._name, self._text, self._desc, self._weight)
     
 class Container (object):
-    """Gives objects the capability to hold other objects"""
-    def __init__ (self, **kwargs):
-        self.is_container = True
-        self.items = []
+    """Gives objects the capability to hold other objects. Membership tests
+       and taking items out don't depend on the number of items, and the
+       weight of the contents is kept as a running total that includes
+       nested containers."""
+    is_container = True
+    slots = ('_items', '_stack_sizes', '_sequence', '_contents_weight',
+             'capacity', 'max_weight', 'stacking')
+
+    def __init__ (self, capacity = None, max_weight = None, stacking = False,
+                  **kwargs):
+        """Init operation for containers
+           @type capacity: integer
+           @param capacity: Most item slots, None for no limit
+           @type max_weight: float
+           @param max_weight: Most weight of the contents, None for no limit
+           @type stacking: boolean
+           @param stacking: Whether identical items share a slot, see
+                            Carryable.stackKey"""
+        self.capacity = capacity
+        self.max_weight = max_weight
+        self.stacking = stacking
+        self._clearItems()
+
+    def _clearItems(self):
+        # item -> (order it was placed in, stack key)
+        self._items = {}
+        # stack key -> number of items in the slot
+        self._stack_sizes = {}
+        self._sequence = 0
+        self._contents_weight = 0.0
+
+    def _getItems(self):
+        """Get-er property function"""
+        order = [(sequence, item)
+                 for item, (sequence, key) in self._items.items()]
+        order.sort()
+        return [item for sequence, item in order]
+
+    def _setItems(self, items):
+        """Set-er property function, puts the items in without scripts"""
+        self._clearItems()
+        # the weights of restored items may not be known yet
+        self._invalidateWeight()
+        for item in items:
+            self._addItem(item, item)
+
+    items = property(_getItems, _setItems,
+        doc = "List of the contained items, in the order they were placed")
+
+    def _addItem(self, item, key):
+        self._items[item] = (self._sequence, key)
+        self._sequence += 1
+        self._stack_sizes[key] = self._stack_sizes.get(key, 0) + 1
+
+    def _removeItem(self, item):
+        sequence, key = self._items.pop(item)
+        size = self._stack_sizes[key] - 1
+        if size:
+            self._stack_sizes[key] = size
+        else:
+            del self._stack_sizes[key]
+
+    def _addWeight(self, delta):
+        """Adds to the contents weight of this container and the containers
+           it is in"""
+        container = self
+        while container is not None:
+            # None while being restored or waiting to be added up again
+            if getattr(container, '_contents_weight', None) is not None:
+                container._contents_weight += delta
+            container = getattr(container, 'in_container', None)
+
+    def _weightChanged(self, item, delta):
+        """Called by a contained item whose weight changed. The weight is
+           part of the stack key, so a stacked item moves to the slot of
+           its new key, keeping its place in the item order."""
+        entry = getattr(self, '_items', {}).get(item)
+        if entry is not None and entry[1] is not item:
+            sequence, key = entry
+            self._removeItem(item)
+            key = item.stackKey()
+            self._items[item] = (sequence, key)
+            self._stack_sizes[key] = self._stack_sizes.get(key, 0) + 1
+        self._addWeight(delta)
+
+    def _invalidateWeight(self):
+        """Makes this container and the containers it is in add up their
+           contents again"""
+        container = self
+        while container is not None:
+            container._contents_weight = None
+            container = getattr(container, 'in_container', None)
+
+    def containsItem(self, item):
+        """@return: Whether the item is in this container"""
+        return item in self._items
+
+    def itemCount(self):
+        """@return: The number of items in this container"""
+        return len(self._items)
+
+    def slotCount(self):
+        """@return: The number of slots the items take up"""
+        return len(self._stack_sizes)
+
+    def stackSize(self, item):
+        """@return: The number of items in the slot of the item"""
+        return self._stack_sizes[self._items[item][1]]
+
+    def contentsWeight(self):
+        """@return: The weight of the contents, nested contents included"""
+        if self._contents_weight is None:
+            self._contents_weight = sum([carriedWeight(item)
+                                         for item in self._items])
+        return self._contents_weight
+
+    def _checkPlace(self, item, key):
+        """Raises a ValueError if the item can't be placed"""
+        if item in self._items:
+            raise ValueError ('I already contain this item: %s' % item)
+        container = self
+        while container is not None:
+            if container is item:
+                raise ValueError ('%s would contain itself' % item)
+            container = getattr(container, 'in_container', None)
+        if self.capacity is not None and key not in self._stack_sizes and \
+                len(self._stack_sizes) >= self.capacity:
+            raise ValueError ('%s is full' % self)
+        weight = carriedWeight(item)
+        container = self
+        while container is not None:
+            if container.max_weight is not None and \
+                    container.contentsWeight() + weight > container.max_weight:
+                raise ValueError ('%s is too heavy for %s' % (item, container))
+            container = getattr(container, 'in_container', None)
         
     def placeItem (self, item):
-        """Adds the provided carriable item to the inventory. 
+        """Adds the provided carriable item to the inventory. An item in
+           another container is taken out of it first.
            Runs an 'onStoreItem' script, if present"""    
         if not item.trueAttr ('carryable'):
-            raise ValueError ('% is not carriable!' % item)
+            raise ValueError ('%s is not carriable!' % item)
+        key = item
+        if self.stacking and not isinstance(item, Container):
+            key = item.stackKey()
+        self._checkPlace(item, key)
+        if item.in_container is not None:
+            item.in_container.takeItem(item)
         item.in_container = self
-        self.items.append (item)
+        self._addItem(item, key)
+        self._addWeight(carriedWeight(item))
+        item.markDirty()
+        self.markDirty()
         # Run any scripts associated with storing an item in the container
         try:
             if self.trueAttr ('scriptable'):
@@ -198,9 +644,13 @@ class Container (object):
     def takeItem (self, item):
         """Takes the listed item out of the inventory. 
            Runs an 'ontakeItem' script"""        
-        if not item in self.items:
+        if not item in self._items:
             raise ValueError ('I do not contain this item: %s' % item)
-        self.items.remove (item)
+        self._removeItem(item)
+        item.in_container = None
+        self._addWeight(-carriedWeight(item))
+        item.markDirty()
+        self.markDirty()
         # Run any scripts associated with popping an item out of the container
         try:
             if self.trueAttr ('scriptable'):
@@ -210,11 +660,22 @@ class Container (object):
         
 class Inventory (object):
     """Aggregate class for things that have multiple Containers"""
+    is_inventory = True
+    slots = ('containers',)
+
     def __init__ (self, **kwargs):
-        self.is_inventory = True
         self.containers = []
+
+    def contentsWeight(self):
+        """@return: The weight of all containers with their contents"""
+        return sum([carriedWeight(container)
+                    for container in self.containers])
     
 class Living (object):
+    # dead objects are no longer living
+    is_living = Flag('living')
+    flags = 0
+
     def __init__ (self, **kwargs):
         self.is_living = True
     def die(self):
@@ -222,12 +683,14 @@ class Living (object):
         
 class Scriptable (object):
     """Allows objects to have predefined scripts executed on certain events"""
+    is_scriptable = True
+    slots = ('scripts',)
+
     def __init__ (self, scripts = {}, **kwargs):
         """Init operation for scriptable objects
            @type scripts: Dictionary
            @param scripts: Dictionary where the event strings are keys. The 
            values are 3-item tuples (function, positional_args, keyword_args)"""
-        self.is_scriptable = True
         self.scripts = scripts 
         
     def runScript (self, event):
@@ -242,31 +705,42 @@ class Scriptable (object):
 
 class CharStats (object):
     """Provides the object with character statistics"""
+    is_charstats = True
+
     def __init__ (self, **kwargs):
-        self.is_charstats = True
+        pass
         
 class Wearable (object):
+    is_wearable = True
+
     def __init__ (self, **kwargs):
         """Allows the object to be worn somewhere on the body (e.g. pants)"""
-        self.is_wearable = True
     
 class Usable (object):
     """Allows the object to be used in some way (e.g. a Zippo lighter 
        to make a fire)"""
+    is_usable = True
+
     def __init__ (self, **kwargs):
-        self.is_usable = True
+        pass
         
 class Weapon (object):
     """Allows the object to be used as a weapon"""
+    is_weapon = True
+
     def __init__ (self, **kwargs):
-        self.is_weapon = True
+        pass
         
 class Destructable (object):
     """Allows the object to be destroyed"""
+    is_destructable = True
+
     def __init__ (self, **kwargs):
-        self.is_destructable = True
+        pass
         
 class Trappable (object):
     """Provides trap slots to the object"""
+    is_trappable = True
+
     def __init__ (self, **kwargs):
-        self.is_trappable = True
+        pass
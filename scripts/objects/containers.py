@@ -23,7 +23,5 @@ __all__ = ["WoodenCrate",]
 from composed import ImmovableContainer
 
 class WoodenCrate (ImmovableContainer):
-    def __init__ (self, ID, name = 'Wooden Crate', \
-            text = 'A battered crate', gfx = 'crate', **kwargs):
-        ImmovableContainer.__init__(self, ID = ID, name = name, gfx = gfx, \
-                text = text, **kwargs)
+    def __init__ (self, ID, gfx = 'crate', **kwargs):
+        ImmovableContainer.__init__(self, ID = ID, gfx = gfx, **kwargs)
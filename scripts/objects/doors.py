@@ -22,11 +22,10 @@ __all__ = ["ShantyDoor",]
 from composed import Door
 
 class ShantyDoor(Door):
-    def __init__ (self, ID, name = 'Shanty Door', \
-            text = 'A door', gfx = 'shanty-door', target_map_name = 'my-map', \
+    def __init__ (self, ID, gfx = 'shanty-door', target_map_name = 'my-map', \
             target_map = 'map.xml', target_pos = (0.0, 0.0), \
             **kwargs):
-        Door.__init__(self, ID = ID, name = name, text = text, gfx = gfx, \
+        Door.__init__(self, ID = ID, gfx = gfx, \
             target_map_name = target_map_name, target_map = target_map, \
             target_pos = target_pos, **kwargs)
 
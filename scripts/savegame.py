@@ -0,0 +1,447 @@
+#!/usr/bin/python
+
+#   This file is part of PARPG.
+
+#   PARPG is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+
+#   PARPG is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+
+#   You should have received a copy of the GNU General Public License
+#   along with PARPG.  If not, see <http://www.gnu.org/licenses/>.
+
+"""The save game file format. A save starts with a header holding a magic
+   string and the format version. An info block of fixed layout follows,
+   it holds what the load browser shows about the save (see SaveInfo).
+   After that come named chunks. Each chunk is a zlib compressed pickle of
+   its own, so the chunks can be written one after the other and read back
+   one at a time:
+
+       'state'        current map name and file, the ids of the saved maps
+       'pc'           the player character
+       'map:<id>'     the game objects of a map, by ID
+
+   The map chunks are only unpickled when their map is entered (see
+   GameState.restoreMap). Maps that were not entered since the last load
+   are copied into the next save as they are.
+
+   A delta save holds only the objects that changed since the last full
+   save, in 'delta:<id>' chunks, and its state names that full save as its
+   base. Loading it loads the base and applies the changes.
+
+   Saves written before this format are a single pickle of the GameState,
+   they are read as format version 0."""
+
+import cPickle
+import os
+import struct
+import time
+import zlib
+import gamestate
+
+MAGIC = 'PARPGSAV'
+FORMAT_VERSION = 1
+# magic, format version
+HEADER = struct.Struct('!8sH')
+# map name length, timestamp, play time, PC x and y, thumbnail length,
+# followed by the map name and the thumbnail
+INFO = struct.Struct('!HddddI')
+# what unpickling damaged data raises, besides the pickle errors
+UNPICKLE_ERRORS = (cPickle.UnpicklingError, EOFError, ImportError,
+                   AttributeError, IndexError, KeyError, TypeError)
+# name length, data length
+CHUNK = struct.Struct('!HI')
+MAP_PREFIX = 'map:'
+DELTA_PREFIX = 'delta:'
+
+def packChunk(data):
+    """@return: The compressed pickle of data"""
+    return zlib.compress(cPickle.dumps(data, cPickle.HIGHEST_PROTOCOL))
+
+def unpackChunk(raw):
+    """@return: The data of a chunk packed by packChunk
+       @raise ValueError: The chunk is damaged"""
+    try:
+        return cPickle.loads(zlib.decompress(raw))
+    except (zlib.error,) + UNPICKLE_ERRORS, e:
+        raise ValueError("Damaged chunk: %s" % e)
+
+class SaveInfo(object):
+    """The info block of a save."""
+    def __init__(self, map_name='', timestamp=0.0, play_time=0.0,
+                 pc_position=(0.0, 0.0), thumbnail='',
+                 version=FORMAT_VERSION):
+        """@type map_name: string
+           @param map_name: Name of the current map
+           @type timestamp: float
+           @param timestamp: When the game was saved, seconds since the epoch
+           @type play_time: float
+           @param play_time: Seconds played
+           @type pc_position: tuple
+           @param pc_position: X, Y map coordinates of the PC
+           @type thumbnail: string
+           @param thumbnail: Image data of a small screenshot, may be empty
+           @type version: integer
+           @param version: Format version of the save"""
+        self.map_name = map_name
+        self.timestamp = timestamp
+        self.play_time = play_time
+        self.pc_position = pc_position
+        self.thumbnail = thumbnail
+        self.version = version
+
+    def pack(self):
+        """@return: The info block"""
+        map_name = self.map_name
+        if isinstance(map_name, unicode):
+            map_name = map_name.encode('utf-8')
+        x, y = self.pc_position
+        return INFO.pack(len(map_name), self.timestamp, self.play_time, x, y,
+                         len(self.thumbnail)) + map_name + self.thumbnail
+
+def infoOf(game_state, thumbnail=''):
+    """@return: The SaveInfo of a save of the given game state"""
+    pc_position = (0.0, 0.0)
+    if game_state.PC is not None:
+        pc_position = (float(game_state.PC.X), float(game_state.PC.Y))
+    return SaveInfo(game_state.current_map_name or '', time.time(),
+                    game_state.play_time, pc_position, thumbnail)
+
+def _readHeader(save_file):
+    """@return: The format version of a save
+       @raise ValueError: The file does not start with a save header"""
+    header = save_file.read(HEADER.size)
+    if len(header) < HEADER.size:
+        raise ValueError("Not a save file")
+    magic, version = HEADER.unpack(header)
+    if magic != MAGIC:
+        raise ValueError("Not a save file")
+    return version
+
+def _readInfo(save_file, version, thumbnail=True):
+    """Reads the info block following the header.
+       @return: The SaveInfo"""
+    block = save_file.read(INFO.size)
+    if len(block) < INFO.size:
+        raise ValueError("Truncated save info")
+    map_name, timestamp, play_time, x, y, length = INFO.unpack(block)
+    map_name = save_file.read(map_name)
+    info = SaveInfo(map_name.decode('utf-8', 'replace'), timestamp,
+                    play_time, (x, y), version=version)
+    if thumbnail:
+        info.thumbnail = save_file.read(length)
+    else:
+        save_file.seek(length, 1)
+    return info
+
+def readInfo(save_file, thumbnail=False):
+    """Reads only the info of a save. Of pickled saves only the version is
+       known.
+       @type save_file: file
+       @param save_file: File opened for binary reading
+       @type thumbnail: boolean
+       @param thumbnail: Whether to read the thumbnail as well
+       @rtype: SaveInfo
+       @return: The info"""
+    try:
+        version = _readHeader(save_file)
+    except ValueError:
+        return SaveInfo(version=0)
+    return _readInfo(save_file, version, thumbnail)
+
+class SaveWriter(object):
+    """Writes the header and then the chunks of a save to a file."""
+    def __init__(self, save_file, info=None, version=FORMAT_VERSION):
+        """@type save_file: file
+           @param save_file: File opened for binary writing
+           @type info: SaveInfo
+           @param info: Info block of the save, None for an empty one
+           @type version: integer
+           @param version: Format version written to the header"""
+        self.file = save_file
+        self.file.write(HEADER.pack(MAGIC, version))
+        self.file.write((info or SaveInfo()).pack())
+
+    def writeChunk(self, name, data):
+        """Pickles, compresses and writes a chunk.
+           @type name: string
+           @param name: Name of the chunk
+           @param data: Picklable contents of the chunk
+           @return: None"""
+        self.writeRawChunk(name, packChunk(data))
+
+    def writeRawChunk(self, name, raw):
+        """Writes an already packed chunk.
+           @type name: string
+           @param name: Name of the chunk
+           @type raw: string
+           @param raw: Chunk data as returned by packChunk
+           @return: None"""
+        self.file.write(CHUNK.pack(len(name), len(raw)))
+        self.file.write(name)
+        self.file.write(raw)
+
+class SaveReader(object):
+    """Reads the chunks of a save. Opening a save only reads the chunk
+       names, the chunk data is read when it is asked for."""
+    def __init__(self, save_file):
+        """@type save_file: file
+           @param save_file: File opened for binary reading
+           @raise ValueError: The file does not start with a save header"""
+        self.file = save_file
+        self.version = _readHeader(self.file)
+        self.info = _readInfo(self.file, self.version)
+        # chunk name -> (offset, length) of its data
+        self.chunks = {}
+        self.order = []
+        while True:
+            chunk = self.file.read(CHUNK.size)
+            if len(chunk) < CHUNK.size:
+                break
+            name_length, length = CHUNK.unpack(chunk)
+            name = self.file.read(name_length)
+            self.chunks[name] = (self.file.tell(), length)
+            self.order.append(name)
+            self.file.seek(length, 1)
+
+    def names(self):
+        """@return: The chunk names in file order"""
+        return list(self.order)
+
+    def readRawChunk(self, name):
+        """@return: The packed data of the named chunk
+           @raise ValueError: The save has no such chunk, or it is cut
+                              short"""
+        if name not in self.chunks:
+            raise ValueError("Missing chunk: %s" % name)
+        offset, length = self.chunks[name]
+        self.file.seek(offset)
+        raw = self.file.read(length)
+        if len(raw) < length:
+            raise ValueError("Truncated chunk: %s" % name)
+        return raw
+
+    def readChunk(self, name):
+        """@return: The unpacked data of the named chunk"""
+        return unpackChunk(self.readRawChunk(name))
+
+def saveGame(save_file, game_state, thumbnail='', base=None):
+    """Writes a game state in the current format.
+       @type save_file: file
+       @param save_file: File opened for binary writing
+       @type game_state: GameState
+       @param game_state: The state to save
+       @type thumbnail: string
+       @param thumbnail: Image data for the info block, may be empty
+       @type base: tuple
+       @param base: File name, relative to the save, and save time of the
+                    full save to write a delta save against; None writes a
+                    full save
+       @rtype: SaveInfo
+       @return: The info written"""
+    info = infoOf(game_state, thumbnail)
+    writer = SaveWriter(save_file, info)
+    state = {'current_map_name': game_state.current_map_name,
+             'current_map_file': game_state.current_map_file,
+             'play_time': game_state.play_time}
+    if base is not None:
+        # only the objects changed since the base save
+        maps = [map_id for map_id, dirty_set in game_state.dirty.items()
+                if dirty_set and map_id in game_state.objects]
+        state['base'], state['base_time'] = base
+        state['maps'] = sorted(maps)
+        writer.writeChunk('state', state)
+        writer.writeChunk('pc', game_state.PC)
+        for map_id in state['maps']:
+            objects = game_state.objects[map_id]
+            writer.writeChunk(DELTA_PREFIX + map_id,
+                              dict([(obj_id, objects[obj_id]) for obj_id
+                                    in game_state.dirty[map_id]
+                                    if obj_id in objects]))
+        return info
+    maps = set(game_state.objects.keys()) | set(game_state.saved_maps.keys())
+    state['maps'] = sorted(maps)
+    writer.writeChunk('state', state)
+    writer.writeChunk('pc', game_state.PC)
+    for map_id in state['maps']:
+        if map_id in game_state.saved_maps:
+            # not touched since it was loaded
+            writer.writeRawChunk(MAP_PREFIX + map_id,
+                                 game_state.saved_maps[map_id])
+        else:
+            writer.writeChunk(MAP_PREFIX + map_id, game_state.objects[map_id])
+    return info
+
+def deltaBase(game_state, filename):
+    """Returns the base of a delta save of a game state: the last full
+       save, unless the delta would replace it.
+       @type game_state: GameState
+       @param game_state: The state to save
+       @type filename: string
+       @param filename: Name of the delta save file
+       @rtype: tuple
+       @return: The base argument of saveGame, None for a full save"""
+    if game_state.base_save is None:
+        return None
+    base_name, base_time = game_state.base_save
+    if os.path.abspath(base_name) == os.path.abspath(filename):
+        return None
+    return (os.path.relpath(base_name, os.path.dirname(filename) or '.'),
+            base_time)
+
+def writeSaveFile(filename, game_state, thumbnail='', base=None):
+    """Saves a game state to a file. The save is written to a temporary
+       file first, which then replaces the file, so the file never holds
+       a partial save.
+       @type filename: string
+       @param filename: Name of the save file
+       @type game_state: GameState
+       @param game_state: The state to save
+       @type thumbnail: string
+       @param thumbnail: Image data for the info block, may be empty
+       @type base: tuple
+       @param base: The base of a delta save, see saveGame and deltaBase
+       @rtype: SaveInfo
+       @return: The info written
+       @raise IOError: The save could not be written"""
+    temp_name = filename + '.tmp'
+    temp_file = open(temp_name, 'wb')
+    try:
+        try:
+            info = saveGame(temp_file, game_state, thumbnail, base)
+            temp_file.flush()
+            os.fsync(temp_file.fileno())
+        finally:
+            temp_file.close()
+        try:
+            os.rename(temp_name, filename)
+        except OSError:
+            # Windows does not rename over existing files
+            os.remove(filename)
+            os.rename(temp_name, filename)
+    except:
+        if os.path.exists(temp_name):
+            os.remove(temp_name)
+        raise
+    return info
+
+def loadGame(save_file, filename=None):
+    """Reads a game state. The objects of the maps stay packed until the
+       maps are restored, see GameState.restoreMap. A delta save reads its
+       base save first.
+       @type save_file: file
+       @param save_file: File opened for binary reading
+       @type filename: string
+       @param filename: Name of the save file, delta saves find their base
+                        relative to it. A full save becomes the base of the
+                        next delta saves.
+       @rtype: GameState
+       @return: The saved state
+       @raise ValueError: The save is of a newer format version, it is
+                          damaged, or the base of a delta save changed
+       @raise IOError: The base of a delta save can't be read"""
+    try:
+        reader = SaveReader(save_file)
+    except ValueError:
+        # version 0, a pickled GameState
+        save_file.seek(0)
+        try:
+            game_state = cPickle.load(save_file)
+        except UNPICKLE_ERRORS, e:
+            raise ValueError("Damaged save: %s" % e)
+        for map_id in game_state.objects.keys():
+            game_state.trackMap(map_id)
+        return game_state
+    if reader.version > FORMAT_VERSION:
+        raise ValueError("Save format version %d is not supported" %
+                         reader.version)
+    state = reader.readChunk('state')
+    if 'base' in state:
+        base_name = os.path.normpath(
+                        os.path.join(os.path.dirname(filename or ''),
+                                     state['base']))
+        base_file = open(base_name, 'rb')
+        try:
+            if readInfo(base_file).timestamp != state['base_time']:
+                raise ValueError("The base save %s was replaced" % base_name)
+            base_file.seek(0)
+            game_state = loadGame(base_file, base_name)
+        finally:
+            base_file.close()
+        for map_id in state['maps']:
+            game_state.applyChanges(map_id,
+                                    reader.readChunk(DELTA_PREFIX + map_id))
+    else:
+        game_state = gamestate.GameState()
+        for map_id in state['maps']:
+            game_state.saved_maps[map_id] = \
+                                reader.readRawChunk(MAP_PREFIX + map_id)
+        if filename is not None:
+            game_state.base_save = (filename, reader.info.timestamp)
+    game_state.current_map_name = state['current_map_name']
+    game_state.current_map_file = state['current_map_file']
+    game_state.play_time = state['play_time']
+    game_state.PC = reader.readChunk('pc')
+    return game_state
+
+class SaveIndex(object):
+    """Caches the infos of the save files, so a directory of saves is only
+       read once. A file is read again when its size or modification time
+       changed."""
+    def __init__(self):
+        # file name -> ((size, modification time), SaveInfo)
+        self.infos = {}
+
+    def getInfo(self, filename):
+        """@type filename: string
+           @param filename: Name of the save file
+           @rtype: SaveInfo
+           @return: The info of the save, None if it can't be read"""
+        try:
+            stat = os.stat(filename)
+        except OSError:
+            self.infos.pop(filename, None)
+            return None
+        key = (stat.st_size, stat.st_mtime)
+        cached = self.infos.get(filename)
+        if cached is not None and cached[0] == key:
+            return cached[1]
+        try:
+            save_file = open(filename, 'rb')
+            try:
+                info = readInfo(save_file)
+            finally:
+                save_file.close()
+        except (IOError, ValueError):
+            return None
+        self.infos[filename] = (key, info)
+        return info
+
+    def listSaves(self, path, filenames, sort_key='timestamp', reverse=True):
+        """Sorts save files by a field of their infos.
+           @type path: string
+           @param path: Directory of the saves
+           @type filenames: list
+           @param filenames: Names of the save files in path
+           @type sort_key: string
+           @param sort_key: 'timestamp', 'play_time', 'map_name' or 'name'
+           @type reverse: boolean
+           @param reverse: Sort in descending order
+           @rtype: list
+           @return: List of (file name, SaveInfo or None) tuples"""
+        saves = [(filename, self.getInfo(os.path.join(path, filename)))
+                 for filename in filenames]
+        if sort_key == 'name':
+            key = lambda save: save[0]
+        else:
+            key = lambda save: (save[1] is not None and
+                                getattr(save[1], sort_key), save[0])
+        saves.sort(key=key, reverse=reverse)
+        return saves
+
+save_index = SaveIndex()
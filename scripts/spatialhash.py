@@ -0,0 +1,125 @@
+#!/usr/bin/python
+
+#   This file is part of PARPG.
+
+#   PARPG is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+
+#   PARPG is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+
+#   You should have received a copy of the GNU General Public License
+#   along with PARPG.  If not, see <http://www.gnu.org/licenses/>.
+
+import math
+
+class SpatialHash(object):
+    """A uniform grid over the coordinates of the game objects of a map.
+       Each object is kept in the cell its X, Y position falls into, so
+       position queries only look at the cells they overlap. Objects in the
+       index tell it about coordinate changes themselves, see
+       GameObject.spatial_index."""
+    def __init__(self, cell_size=4.0):
+        """@type cell_size: float
+           @param cell_size: Edge length of a cell in map coordinates"""
+        self.cell_size = float(cell_size)
+        # cell -> set of objects
+        self.cells = {}
+        # object -> its cell
+        self.locations = {}
+
+    def __setstate__(self, state):
+        """Restores a pickled index. Pickled objects leave their index out,
+           so they are pointed at this one again."""
+        self.__dict__.update(state)
+        for obj in self.locations:
+            obj.spatial_index = self
+
+    def cellOf(self, x, y):
+        """@return: The cell containing the given position"""
+        return (int(math.floor(x / self.cell_size)),
+                int(math.floor(y / self.cell_size)))
+
+    def __len__(self):
+        return len(self.locations)
+
+    def __contains__(self, obj):
+        return obj in self.locations
+
+    def insert(self, obj):
+        """Adds an object to the index.
+           @type obj: GameObject
+           @param obj: The object
+           @return: None"""
+        if obj in self.locations:
+            self.update(obj)
+            return
+        cell = self.cellOf(obj.X, obj.Y)
+        self.cells.setdefault(cell, set()).add(obj)
+        self.locations[obj] = cell
+        obj.spatial_index = self
+
+    def remove(self, obj):
+        """Removes an object from the index.
+           @return: None"""
+        cell = self.locations.pop(obj, None)
+        if cell is None:
+            return
+        self._discard(obj, cell)
+        obj.spatial_index = None
+
+    def update(self, obj):
+        """Moves an object to the cell of its current coordinates.
+           @return: None"""
+        old_cell = self.locations.get(obj)
+        if old_cell is None:
+            return
+        cell = self.cellOf(obj.X, obj.Y)
+        if cell != old_cell:
+            self._discard(obj, old_cell)
+            self.cells.setdefault(cell, set()).add(obj)
+            self.locations[obj] = cell
+
+    def _discard(self, obj, cell):
+        objects = self.cells[cell]
+        objects.discard(obj)
+        if not objects:
+            del self.cells[cell]
+
+    def objectsInCell(self, x, y):
+        """@return: List of the objects in the cell containing (x, y)"""
+        return list(self.cells.get(self.cellOf(x, y), ()))
+
+    def objectsInRect(self, x1, y1, x2, y2):
+        """@return: List of the objects with x1 <= X <= x2 and
+                    y1 <= Y <= y2"""
+        left, top = self.cellOf(min(x1, x2), min(y1, y2))
+        right, bottom = self.cellOf(max(x1, x2), max(y1, y2))
+        x1, x2 = min(x1, x2), max(x1, x2)
+        y1, y2 = min(y1, y2), max(y1, y2)
+        if (right - left + 1) * (bottom - top + 1) > len(self.cells):
+            # fewer occupied cells than cells in the rectangle
+            candidates = [objects for (cx, cy), objects in self.cells.items()
+                          if left <= cx <= right and top <= cy <= bottom]
+        else:
+            candidates = [self.cells[(cx, cy)]
+                          for cx in xrange(left, right + 1)
+                          for cy in xrange(top, bottom + 1)
+                          if (cx, cy) in self.cells]
+        result = []
+        for objects in candidates:
+            for obj in objects:
+                if x1 <= obj.X <= x2 and y1 <= obj.Y <= y2:
+                    result.append(obj)
+        return result
+
+    def objectsInRadius(self, x, y, radius):
+        """@return: List of the objects at most radius away from (x, y)"""
+        limit = radius * radius
+        return [obj for obj in self.objectsInRect(x - radius, y - radius,
+                                                  x + radius, y + radius)
+                if (obj.X - x) ** 2 + (obj.Y - y) ** 2 <= limit]
@@ -21,13 +21,14 @@ import pychan
 from sounds import SoundEngine
 from datetime import date
 from scripts.common.eventlistenerbase import EventListenerBase
-from local_loaders.loaders import loadMapFile
+from local_loaders.loaders import loadMapFile, import_registry
+from local_loaders.prefetch import map_prefetcher
 from sounds import SoundEngine
 from settings import Setting
 from scripts import hud
 from scripts.popups import *
 from pychan.tools import callbackWithArguments as cbwa
-from map import Map
+from map import Map, MapSettings
 
 TDS = Setting()
 
@@ -61,6 +62,11 @@ class World(EventListenerBase):
         # self.map is a Map object, set to none here
         self.active_map = None
         self.maps = {}
+        # names of the loaded maps, least recently used first
+        self.map_lru = []
+        # the map load in progress, see startMapLoad
+        self.map_load = None
+        self.map_settings = MapSettings(TDS)
 
         # setup the inventory model
         # make slot 'A1' and 'A3' container daggers
@@ -110,10 +116,72 @@ class World(EventListenerBase):
             loader uses call backs that expect to find an active map. 
             This needs to be reworked.
             """
-            map = Map(self.engine, self.data)
+            map = Map(self.engine, self.data, self.map_settings)
             self.maps[map_name] = map        
             self.setActiveMap(map_name)
             map.load(filename)
+            self.evictMaps()
+    
+    def startMapLoad(self, map_name, filename):
+        """Like loadMap, but the map is loaded over the next frames by
+           stepMapLoad while a loading window shows the progress.
+           @type map_name: text
+           @param map_name: The name of the map to load 
+           @type filename: text
+           @param filename: File which contains the map to be loaded
+           @return: None
+        """
+        if not map_name in self.maps:
+            map = Map(self.engine, self.data, self.map_settings)
+            self.maps[map_name] = map        
+            self.setActiveMap(map_name)
+            self.hud.showLoading(filename)
+            self.map_load = map.startLoad(filename, self.hud.updateLoading)
+
+    def stepMapLoad(self):
+        """Continues the map load begun by startMapLoad for at most
+           MapLoadTime milliseconds.
+           @rtype: boolean
+           @return: True if no load is running anymore
+        """
+        if self.map_load is None:
+            return True
+        if not self.map_load.step(self.map_settings.load_time):
+            return False
+        self.active_map.finishLoad(self.map_load)
+        self.map_load = None
+        self.hud.hideLoading()
+        self.evictMaps()
+        return True
+
+    def asyncMapLoads(self):
+        """@return: Whether map changes load the map over several frames"""
+        return self.map_settings.async_load
+    
+    def prefetchMap(self, map_name, filename):
+        """Starts reading and parsing a map file in the background, so a
+           later loadMap of it only has to build the FIFE map. Maps that are
+           still loaded are left alone.
+           @type map_name: text
+           @param map_name: The name of the map
+           @type filename: text
+           @param filename: File which contains the map
+           @return: None
+        """
+        if map_name in self.maps:
+            return
+        if self.map_settings.prefetch:
+            map_prefetcher.prefetch(str(filename),
+                                    self.map_settings.import_workers,
+                                    self.map_settings.cache)
+
+    def retainPrefetchedMaps(self, filenames):
+        """Drops all prefetched maps except the given ones.
+           @type filenames: list
+           @param filenames: Files of the maps to keep
+           @return: None
+        """
+        map_prefetcher.retain([str(f) for f in filenames])
     
     def setActiveMap(self, map_name):
         """Sets the active map that is to be rendered.
@@ -121,8 +189,59 @@ class World(EventListenerBase):
            @param map_name: The name of the map to load 
            @return: None
         """
+        if self.active_map is not None and \
+                self.active_map is not self.maps[map_name]:
+            self.active_map.makeInactive()
         self.active_map = self.maps[map_name]
         self.active_map.makeActive()
+        if map_name in self.map_lru:
+            self.map_lru.remove(map_name)
+        self.map_lru.append(map_name)
+
+    def unloadMap(self, map_name):
+        """Deletes a loaded map; the next visit loads it again.
+           @type map_name: text
+           @param map_name: The name of the map
+           @return: None
+        """
+        map = self.maps.pop(map_name)
+        self.map_lru.remove(map_name)
+        if map is self.active_map:
+            self.active_map = None
+        map.reset()
+
+    def clearMaps(self):
+        """Unloads all maps, and with them the object definitions in the
+           FIFE model.
+           @return: None
+        """
+        for map_name in list(self.map_lru):
+            self.unloadMap(map_name)
+        # the definitions are shared by all loaded maps, so they only go
+        # once no map is left; the next map imports them again
+        self.engine.getModel().deleteObjects()
+        import_registry.clear()
+
+    def evictMaps(self):
+        """Unloads the least recently used maps while more maps or more
+           instances are loaded than the ResidentMaps and ResidentInstances
+           settings allow. The active map is never unloaded.
+           @return: None
+        """
+        max_maps = self.map_settings.resident_maps
+        max_instances = self.map_settings.resident_instances
+        counts = {}
+        for map_name in self.map_lru:
+            counts[map_name] = self.maps[map_name].instanceCount()
+        instances = sum(counts.values())
+        for map_name in list(self.map_lru):
+            if len(self.map_lru) <= max_maps and \
+                    (not max_instances or instances <= max_instances):
+                break
+            if self.maps[map_name] is self.active_map:
+                continue
+            instances -= counts[map_name]
+            self.unloadMap(map_name)
 
     def displayObjectText(self, obj, text):
         """Display on screen the text of the object over the object.
@@ -145,7 +264,7 @@ class World(EventListenerBase):
         if(key_val == key.Q):
             # we need to quit the game
             self.hud.quitGame()
-        if(key_val == key.T):
+        if(key_val == key.T and self.map_load is None):
             self.active_map.toggle_renderer('GridRenderer')
         if(key_val == key.F1):
             # display the help screen and pause the game
@@ -154,6 +273,9 @@ class World(EventListenerBase):
             # logic would say we use similar code to above and toggle
             # logic here does not work, my friend :-(
             self.cord_render.setEnabled(not self.cord_render.isEnabled())
+        if(key_val == key.F6 and self.map_load is None):
+            # F6 saves the changes since the last save to the quick save
+            self.data.quickSave()
         if(key_val == key.F7):
             # F7 saves a screenshot to fife/clients/parpg/screenshots
             t = "screenshots/screen-%s-%s.png" % \
@@ -189,6 +311,9 @@ class World(EventListenerBase):
            @param evt: The event that fife caught
            @return: None"""
         self.hud.hideContextMenu()
+        if self.map_load is not None:
+            # the map is not there yet
+            return
         scr_point = fife.ScreenPoint(evt.getX(), evt.getY())
         if(evt.getButton() == fife.MouseEvent.LEFT):
             self.data.handleMouseClick(self.getCoords(scr_point))      
@@ -236,6 +361,8 @@ class World(EventListenerBase):
            @type evt: fife.event
            @param evt: The event that fife caught
            @return: None"""
+        if self.map_load is not None:
+            return
         click = fife.ScreenPoint(evt.getX(), evt.getY())
         i=self.active_map.cameras['main'].getMatchingInstances(click, \
                                                 self.active_map.agent_layer)
@@ -243,14 +370,13 @@ class World(EventListenerBase):
         if(i != ()):
             for obj in i:
                 # check to see if this in our list at all
-                if(self.data.objectActive(obj.getId())):
+                item = self.data.objectActive(obj.getId())
+                if(item):
                     # yes, so outline 
                     self.active_map.outline_render.addOutlined(obj, 0, \
                                                                137, 255, 2)
                     # get the text
-                    item = self.data.objectActive(obj.getId())
-                    if(item is not None):
-                        self.displayObjectText(obj, item.name)
+                    self.displayObjectText(obj, item.name)
         else:
             # erase the outline
             self.active_map.outline_render.removeAllOutlines()
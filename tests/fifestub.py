@@ -0,0 +1,94 @@
+#!/usr/bin/python
+
+#   This file is part of PARPG.
+
+#   PARPG is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+
+#   PARPG is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+
+#   You should have received a copy of the GNU General Public License
+#   along with PARPG.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Lets the tests import the map loader and the maps without FIFE. If fife
+   can't be imported, scripts.headless stands in for it, together with the
+   few base classes and constants those modules need when they are
+   imported; the serializers of the FIFE extensions get a stand-in as
+   well. The tests bring their own engine, so nothing here renders or
+   builds a model."""
+
+import os
+import sys
+import types
+from scripts import headless
+
+class Listener(object):
+    """Base class of the FIFE listeners and loaders"""
+    def __init__(self, *args, **kwargs):
+        pass
+
+class FIFEException(Exception):
+    def getMessage(self):
+        return str(self)
+
+class ResourceLocation(object):
+    def __init__(self, filename):
+        self.filename = filename
+
+    def getFilename(self):
+        return self.filename
+
+class WrongFileType(Exception):
+    pass
+
+class NameClash(Exception):
+    pass
+
+def reverse_root_subfile(masterfile, subfile):
+    """Turns a path relative to masterfile into one relative to the
+       current directory, like the FIFE serializers do"""
+    path = os.path.join(os.path.dirname(os.path.abspath(masterfile)),
+                        subfile)
+    return os.path.relpath(path).replace(os.path.sep, '/')
+
+class XMLObjectLoader(Listener):
+    def __init__(self, image_pool, anim_pool, model, vfs=None):
+        self.model = model
+        self.vfs = vfs
+
+    def parse_object(self, object):
+        pass
+
+def install():
+    """Puts the stand-ins into sys.modules for the FIFE modules that can't
+       be imported. Modules imported after this get them.
+       @return: None"""
+    try:
+        import fife
+    except ImportError:
+        for name in ('ResourceLoader', 'MapChangeListener', 'IKeyListener',
+                     'ICommandListener', 'IMouseListener',
+                     'ConsoleExecuter'):
+            setattr(headless, name, type(name, (Listener,), {}))
+        headless.Exception = FIFEException
+        headless.ResourceLocation = ResourceLocation
+        headless.CELL_EDGES_ONLY = 0
+        headless.CELL_EDGES_AND_DIAGONALS = 1
+        headless.FREEFORM = 2
+        sys.modules['fife'] = headless
+    try:
+        import serializers.xmlobject
+    except ImportError:
+        serializers = types.ModuleType('serializers')
+        serializers.WrongFileType = WrongFileType
+        serializers.NameClash = NameClash
+        serializers.reverse_root_subfile = reverse_root_subfile
+        serializers.xmlobject = types.ModuleType('serializers.xmlobject')
+        serializers.xmlobject.XMLObjectLoader = XMLObjectLoader
+        sys.modules['serializers'] = serializers
+        sys.modules['serializers.xmlobject'] = serializers.xmlobject
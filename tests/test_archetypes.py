@@ -0,0 +1,109 @@
+#!/usr/bin/python
+
+#   This file is part of PARPG.
+
+#   PARPG is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+
+#   PARPG is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+
+#   You should have received a copy of the GNU General Public License
+#   along with PARPG.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import pickle
+import sys
+import tempfile
+import unittest
+from StringIO import StringIO
+from scripts.objects.archetypes import Archetype, ArchetypeTable, \
+                                       archetypes, ARCHETYPE_FILE
+from scripts.objects.base import GameObject
+
+class TestArchetypes(unittest.TestCase):
+    def setUp(self):
+        self.archetype = archetypes.add(Archetype('test-barrel',
+                                                  name='Barrel',
+                                                  text='A rusty barrel'))
+
+    def tearDown(self):
+        del archetypes.archetypes['test-barrel']
+
+    def testLoad(self):
+        """ Test that an archetype file is read and updates in place"""
+        fd, filename = tempfile.mkstemp('.xml')
+        os.write(fd, '<archetypes><archetype id="test-barrel" '
+                     'name="Oil drum"/><archetype id="rock" gfx="stone"/>'
+                     '</archetypes>')
+        os.close(fd)
+        try:
+            table = ArchetypeTable(filename)
+            self.assertEqual(table.get('rock').gfx, 'stone')
+            self.assertEqual(table.get('missing'), None)
+            archetypes.load(filename)
+        finally:
+            os.remove(filename)
+        self.assertTrue(archetypes.get('test-barrel') is self.archetype)
+        self.assertEqual(self.archetype.name, 'Oil drum')
+        self.assertEqual(self.archetype.text, None)
+        del archetypes.archetypes['rock']
+
+    def testMissingFile(self):
+        """ Test that the default file does not depend on the current
+            directory and that a missing file is reported once"""
+        self.assertTrue(os.path.isabs(ARCHETYPE_FILE))
+        self.assertTrue(os.path.exists(ARCHETYPE_FILE))
+        table = ArchetypeTable(os.path.join(tempfile.gettempdir(),
+                                            'missing-archetypes.xml'))
+        stderr = sys.stderr
+        sys.stderr = StringIO()
+        try:
+            self.assertEqual(table.get('rock'), None)
+            self.assertEqual(table.get('crate'), None)
+            report = sys.stderr.getvalue()
+        finally:
+            sys.stderr = stderr
+        self.assertEqual(report.count('missing-archetypes.xml'), 1)
+
+    def testShared(self):
+        """ Test that objects keep only what differs from the archetype"""
+        barrel = GameObject('barrel01', gfx='test-barrel', name='Barrel')
+        other = GameObject('barrel02', gfx='test-barrel', text='Full of oil')
+        self.assertEqual((barrel.name, barrel.text, barrel.gfx),
+                         ('Barrel', 'A rusty barrel', 'test-barrel'))
+        self.assertEqual(barrel._name, None)
+        self.assertEqual(other.text, 'Full of oil')
+        self.assertEqual(barrel.desc, 'Detailed description')
+        self.archetype.name = 'Oil barrel'
+        self.assertEqual((barrel.name, other.name), ('Oil barrel',) * 2)
+        self.assertEqual(other.text, 'Full of oil')
+
+    def testPickle(self):
+        """ Test that saves reference the archetype by ID"""
+        barrel = GameObject('barrel01', gfx='test-barrel', name='Old barrel')
+        state = barrel.__getstate__()
+        self.assertEqual(state['archetype'], 'test-barrel')
+        copy = pickle.loads(pickle.dumps(barrel))
+        self.assertTrue(copy.archetype is self.archetype)
+        self.assertEqual((copy.name, copy.text), ('Old barrel',
+                                                  'A rusty barrel'))
+
+    def testOldPickle(self):
+        """ Test that objects saved with all their values get an archetype"""
+        barrel = GameObject.__new__(GameObject)
+        barrel.__setstate__({'ID': 'barrel01', 'X': 0.0, 'Y': 0.0,
+                             'gfx': 'test-barrel', 'name': 'Barrel',
+                             'text': 'A dented barrel',
+                             'desc': 'Detailed description'})
+        self.assertTrue(barrel.archetype is self.archetype)
+        self.assertEqual((barrel._name, barrel._text),
+                         (None, 'A dented barrel'))
+        self.assertEqual(barrel.desc, 'Detailed description')
+
+if __name__ == '__main__':
+    unittest.main()
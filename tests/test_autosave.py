@@ -0,0 +1,145 @@
+#!/usr/bin/python
+
+#   This file is part of PARPG.
+
+#   PARPG is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+
+#   PARPG is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+
+#   You should have received a copy of the GNU General Public License
+#   along with PARPG.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from scripts import savegame
+from scripts.autosave import Autosave, snapshotState
+from scripts.gamestate import GameState
+from scripts.objects.base import GameObject, Container, Carryable
+
+class Box(GameObject, Container):
+    def __init__(self, ID, **kwargs):
+        GameObject.__init__(self, ID, **kwargs)
+        Container.__init__(self, **kwargs)
+
+class Dagger(GameObject, Carryable):
+    def __init__(self, ID, **kwargs):
+        GameObject.__init__(self, ID, **kwargs)
+        Carryable.__init__(self, **kwargs)
+
+class TestAutosave(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.state = GameState()
+        self.state.current_map_name = 'town'
+        self.state.PC = GameObject('PC')
+        self.box = Box('box', xpos=3, ypos=4)
+        self.state.addObject(self.box, 'town')
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def testSnapshot(self):
+        """ Test that an autosave does not change with the game state"""
+        self.box.placeItem(Dagger('dagger'))
+        autosave = Autosave(self.path, interval=0)
+        release = threading.Event()
+        write_save_file = savegame.writeSaveFile
+        def slowWrite(*args):
+            release.wait()
+            return write_save_file(*args)
+        savegame.writeSaveFile = slowWrite
+        try:
+            filename = autosave.save(self.state)
+            self.box.X = 10
+            self.box.takeItem(self.box.items[0])
+            release.set()
+            self.assertEqual(autosave.wait(), None)
+        finally:
+            savegame.writeSaveFile = write_save_file
+        state = savegame.loadGame(open(filename, 'rb'))
+        state.restoreMap('town')
+        box = state.objects['town']['box']
+        self.assertEqual(box.X, 3)
+        self.assertEqual([item.ID for item in box.items], ['dagger'])
+        self.assertTrue(box.items[0].in_container is box)
+
+    def testSnapshotReferences(self):
+        """ Test that the objects a snapshot refers to are copied once"""
+        dagger = Dagger('dagger')
+        self.box.placeItem(dagger)
+        self.state.PC.weapon = dagger
+        snapshot = snapshotState(self.state)
+        box = snapshot.objects['town']['box']
+        self.assertTrue(box is not self.box)
+        self.assertTrue(box.items[0] is not dagger)
+        self.assertTrue(box.items[0] is snapshot.PC.weapon)
+        self.assertTrue(box.items[0].in_container is box)
+        self.assertEqual(box.spatial_index, None)
+        self.assertTrue(self.box.spatial_index is not None)
+
+    def testReuse(self):
+        """ Test that objects that did not change keep their copy"""
+        crate = Box('crate')
+        self.state.addObject(crate, 'town')
+        self.box.placeItem(Dagger('dagger'))
+        self.state.markSaved('base.dat', 1.0)
+        reuse = {}
+        first = snapshotState(self.state, reuse)
+        second = snapshotState(self.state, reuse)
+        self.assertTrue(second.objects['town']['crate'] is
+                        first.objects['town']['crate'])
+        # the box refers to the dagger, which is not tracked
+        self.assertTrue(second.objects['town']['box'] is not
+                        first.objects['town']['box'])
+        crate.X = 7
+        third = snapshotState(self.state, reuse)
+        self.assertEqual(third.objects['town']['crate'].X, 7)
+        self.assertEqual(second.objects['town']['crate'].X, 0)
+
+    def testFailure(self):
+        """ Test that a failed autosave is reported once"""
+        autosave = Autosave(os.path.join(self.path, 'saves'), interval=0)
+        write_save_file = savegame.writeSaveFile
+        def failingWrite(*args):
+            raise RuntimeError('disk on fire')
+        savegame.writeSaveFile = failingWrite
+        try:
+            autosave.save(self.state)
+            autosave.thread.join()
+            error = autosave.poll()
+        finally:
+            savegame.writeSaveFile = write_save_file
+        self.assertTrue(isinstance(error, RuntimeError))
+        self.assertEqual(autosave.poll(), None)
+        autosave.save(self.state)
+        self.assertEqual(autosave.wait(), None)
+
+    def testSlots(self):
+        """ Test that autosaves go round the slots"""
+        autosave = Autosave(self.path, slots=2, interval=0)
+        self.assertFalse(autosave.isDue())
+        names = []
+        for i in range(3):
+            names.append(autosave.save(self.state))
+            autosave.wait()
+        self.assertEqual(names[0], names[2])
+        self.assertNotEqual(names[0], names[1])
+        self.assertEqual(sorted(os.listdir(self.path)),
+                         ['autosave0.dat', 'autosave1.dat'])
+        state = savegame.loadGame(open(names[1], 'rb'))
+        self.assertEqual(state.current_map_name, 'town')
+        # a new game continues after the newest slot
+        os.utime(names[0], (0, 0))
+        self.assertEqual(Autosave(self.path, slots=2).slot, 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,107 @@
+#!/usr/bin/python
+
+#   This file is part of PARPG.
+
+#   PARPG is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+
+#   PARPG is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+
+#   You should have received a copy of the GNU General Public License
+#   along with PARPG.  If not, see <http://www.gnu.org/licenses/>.
+
+import unittest
+from local_loaders.chunks import MapChunks
+
+class Layer(object):
+    """Stands in for a FIFE layer whose cells are scale map units wide"""
+    def __init__(self, id, scale=1.0):
+        self.id = id
+        self.scale = scale
+
+    def getId(self):
+        return self.id
+
+def locate(layer, x, y):
+    return x / layer.scale, y / layer.scale
+
+class TestMapChunks(unittest.TestCase):
+    def setUp(self):
+        self.live = set()
+        self.layer = Layer('layer')
+        self.chunks = MapChunks(10, self.create, self.delete, locate)
+        # one instance per chunk along the x axis, two in chunk (0, 0)
+        for x in (-5, 1, 2, 15, 25, 35, 45):
+            self.chunks.add(self.layer, x, 3, x)
+
+    def create(self, layer, record):
+        self.live.add((layer.getId(), record))
+        return record
+
+    def delete(self, layer, instance):
+        self.live.remove((layer.getId(), instance))
+
+    def liveRecords(self, layer_id='layer'):
+        return set([record for live_id, record in self.live
+                    if live_id == layer_id])
+
+    def testChunkKey(self):
+        """ Test that positions are floored into chunks"""
+        self.assertEqual(self.chunks.chunkKey('layer', 0, 9.9),
+                         ('layer', 0, 0))
+        self.assertEqual(self.chunks.chunkKey('layer', -0.1, 10),
+                         ('layer', -1, 1))
+        self.assertEqual(len(self.chunks), 6)
+
+    def testUpdate(self):
+        """ Test that chunks in range are loaded and far ones released"""
+        self.chunks.update([(1, 1)], 1)
+        self.assertEqual(self.chunks.pending[0], ('layer', 0, 0))
+        self.assertEqual(self.chunks.flush(), 4)
+        self.assertEqual(self.liveRecords(), set([-5, 1, 2, 15]))
+
+        # chunk (-1, 0) is two chunks away now and stays loaded
+        self.chunks.update([(15, 1)], 1)
+        self.chunks.flush()
+        self.assertEqual(self.liveRecords(), set([-5, 1, 2, 15, 25]))
+
+        self.chunks.update([(35, 1)], 1)
+        self.assertEqual(self.liveRecords(), set([15, 25]))
+        self.chunks.flush()
+        self.assertEqual(self.liveRecords(), set([15, 25, 35, 45]))
+
+    def testBudget(self):
+        """ Test that a step with a budget can stop inside a chunk"""
+        self.chunks.update([(1, 1)], 0)
+        self.assertEqual(self.chunks.step(-1), 1)
+        self.assertEqual(self.chunks.pending, [('layer', 0, 0)])
+        self.assertEqual(self.chunks.step(-1), 1)
+        self.assertEqual(self.chunks.pending, [])
+        self.assertEqual(self.liveRecords(), set([1, 2]))
+
+    def testLayers(self):
+        """ Test that every layer keeps its own chunks and measures the
+            focus in its own coordinates"""
+        wide = Layer('wide', 2.0)
+        # layer position 15 is map position 30
+        self.chunks.add(wide, 15, 3, 'wide')
+        self.chunks.add(wide, 1, 3, 'wide origin')
+        self.assertEqual(len(self.chunks), 8)
+        self.chunks.update([(35, 1)], 0)
+        self.chunks.flush()
+        self.assertEqual(self.liveRecords(), set([35]))
+        self.assertEqual(self.liveRecords('wide'), set(['wide']))
+        self.chunks.update([(1, 1)], 0)
+        self.chunks.flush()
+        # the wide chunk at map position 30 is only one chunk away
+        self.assertEqual(self.liveRecords(), set([1, 2]))
+        self.assertEqual(self.liveRecords('wide'),
+                         set(['wide', 'wide origin']))
+
+if __name__ == '__main__':
+    unittest.main()
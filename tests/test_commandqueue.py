@@ -0,0 +1,65 @@
+#!/usr/bin/python
+
+#   This file is part of PARPG.
+
+#   PARPG is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+
+#   PARPG is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+
+#   You should have received a copy of the GNU General Public License
+#   along with PARPG.  If not, see <http://www.gnu.org/licenses/>.
+
+import time
+import unittest
+from scripts.commandqueue import CommandQueue, PRIORITY_HIGH, PRIORITY_LOW
+
+class TestCommandQueue(unittest.TestCase):
+    def setUp(self):
+        self.queue = CommandQueue()
+        self.done = []
+
+    def command(self, value):
+        self.done.append(value)
+
+    def slowCommand(self, value):
+        time.sleep(0.01)
+        self.done.append(value)
+
+    def testOrder(self):
+        """ Test that commands run by priority, then in order"""
+        self.queue.submit(self.command, (1,), PRIORITY_LOW)
+        self.queue.submit(self.command, (2,))
+        self.queue.submit(self.command, (3,), PRIORITY_HIGH)
+        self.queue.submit(self.command, (4,))
+        self.assertEqual(self.queue.drain(), 4)
+        self.assertEqual(self.done, [3, 2, 4, 1])
+        self.assertEqual(self.queue.costs['command'][0], 4)
+
+    def testBudget(self):
+        """ Test that leftover commands wait for the next drain"""
+        for i in range(3):
+            self.queue.submit(self.slowCommand, (i,))
+        self.assertEqual(self.queue.drain(0.001), 1)
+        self.assertEqual(len(self.queue), 2)
+        self.assertEqual(self.queue.drain(1), 2)
+        self.assertEqual(self.done, [0, 1, 2])
+        self.assertEqual(self.queue.stats(),
+                         {'queued': 3, 'executed': 3, 'deferred': 2,
+                          'over_budget_frames': 1, 'pending': 0})
+
+    def testHeld(self):
+        """ Test that a held queue runs nothing"""
+        self.queue.submit(self.command, (1,))
+        self.queue.held = True
+        self.assertEqual(self.queue.drain(), 0)
+        self.queue.held = False
+        self.assertEqual(self.queue.drain(), 1)
+
+if __name__ == '__main__':
+    unittest.main()
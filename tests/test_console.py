@@ -18,6 +18,13 @@
 
 import unittest
 from scripts.console import Console
+from scripts.commandqueue import CommandQueue
+
+class Listener(object):
+    """Stands in for the application listener, with the engine as model"""
+    def __init__(self):
+        self.model = self
+        self.commands = CommandQueue()
 
 class test_console(unittest.TestCase):
     def setUp(self):
@@ -40,6 +47,24 @@ class test_console(unittest.TestCase):
         self.assertEqual(self.con.handlePython("python 1+1"),"2")
         self.assertEqual(self.con.handleConsoleCommand("python 1+1"),"2")
        
+    def testConsoleCommandCommands(self):
+        """ Test that the commands console command shows the counters of
+            the command queue"""
+        listener = Listener()
+        queue = listener.commands
+        queue.submit(self.tearDown)
+        queue.submit(self.tearDown, name='slow')
+        queue.submit(self.setUp)
+        queue.drain(1.0)
+        queue.addCost('slow', 0.25)
+        result = Console(listener).handleConsoleCommand("commands")
+        lines = result.splitlines()
+        self.assertEqual(lines[0], "3 run, 0 deferred, 0 frames over "
+                                   "budget, 0 pending")
+        # the costliest command first
+        self.assertTrue(lines[1].startswith("%10s: 2 runs, 250." % 'slow'))
+        self.assertEqual(len(lines), 4)
+
     def testInvalid(self):
         """Test an invalid console command """
 
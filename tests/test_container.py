@@ -15,9 +15,21 @@
 # You should have received a copy of the GNU General Public License
 # along with PARPG.  If not, see <http://www.gnu.org/licenses/>.
 
+import pickle
 import unittest
 from scripts.objects.base import GameObject, Container, Scriptable, Carryable
 
+class Bag (GameObject, Container, Carryable):
+    def __init__ (self, ID, **kwargs):
+        GameObject.__init__(self, ID, **kwargs)
+        Container.__init__(self, **kwargs)
+        Carryable.__init__(self, **kwargs)
+
+class Coin (GameObject, Carryable):
+    def __init__ (self, ID, **kwargs):
+        GameObject.__init__(self, ID, **kwargs)
+        Carryable.__init__(self, **kwargs)
+
 class  TestContainer(unittest.TestCase):
     class ScriptableContainer (GameObject, Container, Scriptable):
         def __init__ (self, ID, **kwargs):
@@ -78,6 +90,106 @@ class  TestContainer(unittest.TestCase):
         self.assertFalse(self.ranOnPlaceItem)
         self.assertTrue(self.ranOnTakeItem)
 
+class TestContainerAccounting(unittest.TestCase):
+    def setUp(self):
+        self.coins = [Coin(i, gfx='coin') for i in range(3)]
+        self.pouch = Bag('pouch', stacking=True)
+        self.backpack = Bag('backpack')
+
+    def testStacking(self):
+        """ Test that identical items share a slot"""
+        for coin in self.coins:
+            self.pouch.placeItem(coin)
+        self.assertEqual(self.pouch.itemCount(), 3)
+        self.assertEqual(self.pouch.slotCount(), 1)
+        self.assertEqual(self.pouch.stackSize(self.coins[0]), 3)
+        self.assertEqual(self.pouch.items, self.coins)
+        odd_coin = Coin('odd', gfx='coin', name='Odd coin')
+        self.pouch.placeItem(odd_coin)
+        self.assertEqual(self.pouch.slotCount(), 2)
+        self.pouch.takeItem(self.coins[1])
+        self.assertEqual(self.pouch.stackSize(self.coins[0]), 2)
+        self.assertFalse(self.pouch.containsItem(self.coins[1]))
+
+    def testWeightChange(self):
+        """ Test that an item whose weight changes leaves its stack and
+            keeps the contents weight right"""
+        for coin in self.coins:
+            self.pouch.placeItem(coin)
+        self.backpack.placeItem(self.pouch)
+        self.coins[1].weight = 2.0
+        self.assertEqual(self.pouch.slotCount(), 2)
+        self.assertEqual(self.pouch.stackSize(self.coins[0]), 2)
+        self.assertEqual(self.pouch.stackSize(self.coins[1]), 1)
+        self.assertEqual(self.pouch.items, self.coins)
+        self.assertEqual(self.pouch.contentsWeight(), 4.0)
+        self.assertEqual(self.backpack.contentsWeight(), 5.0)
+        self.coins[1].weight = 1.0
+        self.assertEqual(self.pouch.slotCount(), 1)
+        self.assertEqual(self.pouch.stackSize(self.coins[0]), 3)
+        self.pouch.takeItem(self.coins[1])
+        self.assertEqual(self.backpack.contentsWeight(), 3.0)
+
+    def testLimits(self):
+        """ Test that capacity and max_weight are enforced"""
+        self.backpack.capacity = 2
+        self.backpack.placeItem(self.coins[0])
+        self.backpack.placeItem(self.coins[1])
+        self.assertRaises(ValueError, self.backpack.placeItem, self.coins[2])
+        self.pouch.max_weight = 1.5
+        self.pouch.placeItem(self.coins[2])
+        self.assertRaises(ValueError, self.pouch.placeItem, Coin('heavy'))
+        self.assertRaises(ValueError, self.pouch.placeItem, self.coins[2])
+        self.assertRaises(ValueError, self.pouch.placeItem, self.pouch)
+
+    def testNestedWeight(self):
+        """ Test that weights add up through nested containers"""
+        self.backpack.placeItem(self.pouch)
+        for coin in self.coins:
+            self.pouch.placeItem(coin)
+        self.assertEqual(self.pouch.contentsWeight(), 3.0)
+        self.assertEqual(self.backpack.contentsWeight(), 4.0)
+        self.coins[0].weight = 2.5
+        self.assertEqual(self.backpack.contentsWeight(), 5.5)
+        self.assertRaises(ValueError, self.pouch.placeItem, self.backpack)
+        # moving an item takes it out of its old container
+        self.backpack.placeItem(self.coins[0])
+        self.assertEqual(self.pouch.contentsWeight(), 2.0)
+        self.assertEqual(self.backpack.contentsWeight(), 5.5)
+        self.backpack.takeItem(self.pouch)
+        self.assertEqual(self.backpack.contentsWeight(), 2.5)
+
+    def testPickle(self):
+        """ Test that containers keep their items and totals when saved"""
+        self.backpack.placeItem(self.pouch)
+        for coin in self.coins:
+            self.pouch.placeItem(coin)
+        backpack = pickle.loads(pickle.dumps(self.backpack))
+        pouch = backpack.items[0]
+        self.assertEqual(pouch.ID, 'pouch')
+        self.assertEqual(pouch.slotCount(), 1)
+        self.assertEqual(backpack.contentsWeight(), 4.0)
+        pouch.takeItem(pouch.items[0])
+        self.assertEqual(backpack.contentsWeight(), 3.0)
+        self.assertEqual(backpack.capacity, None)
+
+    def testOldState(self):
+        """ Test that containers saved with an item list still load"""
+        for coin in self.coins:
+            coin.in_container = self.backpack
+        state = self.backpack.__getstate__()
+        for attr in Container.slots + ('_weight',):
+            state.pop(attr, None)
+        state['items'] = self.coins
+        state['weight'] = 2.0
+        backpack = Bag.__new__(Bag)
+        backpack.__setstate__(state)
+        self.assertEqual(backpack.items, self.coins)
+        self.assertTrue(backpack.containsItem(self.coins[2]))
+        self.assertEqual(backpack.weight, 2.0)
+        self.assertEqual(backpack.contentsWeight(), 3.0)
+        self.assertEqual(backpack.capacity, None)
+
 if __name__ == '__main__':
     unittest.main()
 
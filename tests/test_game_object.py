@@ -15,8 +15,11 @@
 #   You should have received a copy of the GNU General Public License
 #   along with PARPG.  If not, see <http://www.gnu.org/licenses/>.
 
+import pickle
 import unittest
-from scripts.objects.base import GameObject
+from scripts.objects.base import GameObject, Container, Lockable, Flag, \
+                                 CAPABILITIES, capabilityBit, capabilityMask
+from scripts.objects.containers import WoodenCrate
 
 class TestGameObject(unittest.TestCase):
     def setUp(self):
@@ -46,6 +49,55 @@ class TestGameObject(unittest.TestCase):
         self.assertEqual(self.game_object.trueAttr('test2'),False)
         self.assertEqual(self.game_object.trueAttr('test3'),False)
 
+    def testCapabilities(self):
+        """ Test the capability bits of composed classes"""
+        class Crate(GameObject, Container, Lockable):
+            def __init__(self, ID, **kwargs):
+                GameObject.__init__(self, ID, **kwargs)
+                Container.__init__(self, **kwargs)
+                Lockable.__init__(self, **kwargs)
+        crate = Crate(2)
+        self.assertTrue(crate.trueAttr('container'))
+        self.assertTrue(crate.trueAttr('openable'))
+        self.assertFalse(crate.trueAttr('carryable'))
+        self.assertTrue(crate.trueAttr('open'))
+        self.assertTrue(crate.hasCapabilities(
+                                capabilityMask('container', 'lockable')))
+        self.assertFalse(crate.hasCapabilities(
+                                capabilityMask('container', 'living')))
+        self.assertFalse(self.game_object.trueAttr('container'))
+
+    def testUnknownCapabilities(self):
+        """ Test that asking for a capability does not register it"""
+        count = len(CAPABILITIES)
+        self.assertFalse(self.game_object.trueAttr('teleporter'))
+        self.assertEqual(capabilityBit('teleporter'), 0)
+        self.assertRaises(ValueError, capabilityMask, 'container',
+                          'teleporter')
+        self.assertEqual(len(CAPABILITIES), count)
+        class Teleporter(GameObject):
+            is_teleporter = True
+        self.assertEqual(len(CAPABILITIES), count + 1)
+        self.assertTrue(Teleporter(3).hasCapabilities(
+                                capabilityMask('teleporter')))
+
+    def testFlagBit(self):
+        """ Test that a flag has its bit before any class holds it"""
+        flag = Flag('glowing')
+        self.assertEqual(flag.bit, capabilityMask('glowing'))
+        self.assertEqual(Flag('glowing').bit, flag.bit)
+        self.assertNotEqual(flag.bit, capabilityBit('living'))
+
+    def testSlots(self):
+        """ Test that the attributes are kept in slots and still pickled"""
+        crate = WoodenCrate('crate01', xpos=2.0, locked=True)
+        crate.label = 'loot'
+        self.assertEqual(crate.__dict__, {'label': 'loot'})
+        copy = pickle.loads(pickle.dumps(crate, pickle.HIGHEST_PROTOCOL))
+        self.assertEqual((copy.ID, copy.X, copy.locked, copy.label),
+                         ('crate01', 2.0, True, 'loot'))
+        self.assertEqual(copy.__dict__, {'label': 'loot'})
+
     def testRepr(self):
         """ Test GameObject textual representation"""
 
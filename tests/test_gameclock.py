@@ -0,0 +1,52 @@
+#!/usr/bin/python
+
+#   This file is part of PARPG.
+
+#   PARPG is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+
+#   PARPG is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+
+#   You should have received a copy of the GNU General Public License
+#   along with PARPG.  If not, see <http://www.gnu.org/licenses/>.
+
+import unittest
+from scripts.gameclock import GameClock
+
+class TestGameClock(unittest.TestCase):
+    def setUp(self):
+        self.clock = GameClock(step=0.25, max_steps=3)
+        self.steps = []
+        self.clock.addTickHandler(self.steps.append)
+
+    def testFixedSteps(self):
+        """ Test that short frames add up to whole ticks"""
+        self.assertEqual(self.clock.advance(0.1), 0)
+        self.assertEqual(self.clock.advance(0.1), 0)
+        self.assertEqual(self.clock.advance(0.1), 1)
+        self.assertEqual(self.steps, [0.25])
+        self.assertAlmostEqual(self.clock.alpha(), 0.2)
+        self.assertEqual(self.clock.advance(0.5), 2)
+        self.assertEqual(self.clock.ticks, 3)
+        self.assertEqual(self.clock.time, 0.75)
+
+    def testCatchUpLimit(self):
+        """ Test that a slow frame runs at most max_steps ticks"""
+        self.assertEqual(self.clock.advance(2.1), 3)
+        self.assertAlmostEqual(self.clock.dropped, 1.25)
+        self.assertAlmostEqual(self.clock.accumulator, 0.1)
+        self.assertEqual(self.clock.advance(0.15), 1)
+
+    def testRemoveHandler(self):
+        """ Test that removed handlers are no longer run"""
+        self.clock.removeTickHandler(self.steps.append)
+        self.clock.advance(1)
+        self.assertEqual(self.steps, [])
+
+if __name__ == '__main__':
+    unittest.main()
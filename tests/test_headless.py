@@ -0,0 +1,226 @@
+#!/usr/bin/python
+
+#   This file is part of PARPG.
+
+#   PARPG is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+
+#   PARPG is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+
+#   You should have received a copy of the GNU General Public License
+#   along with PARPG.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import shutil
+import tempfile
+import unittest
+from scripts import headless
+
+class Listener(headless.InstanceActionListener):
+    def __init__(self):
+        headless.InstanceActionListener.__init__(self)
+        self.finished = []
+
+    def onInstanceActionFinished(self, instance, action):
+        self.finished.append(action.getId())
+
+class TestInstance(unittest.TestCase):
+    def setUp(self):
+        self.layer = headless.Layer('ObjectLayer')
+        self.instance = self.layer.createInstance('PC',
+                                    headless.ModelCoordinate(0, 0), 'PC')
+        self.listener = Listener()
+        self.instance.addActionListener(self.listener)
+
+    def testMove(self):
+        """ Test that a move walks to the target, then finishes"""
+        target = self.instance.getLocation()
+        target.setLayerCoordinates(headless.ModelCoordinate(3, 4))
+        self.instance.move('walk', target, 2)
+        self.layer.update(1)
+        self.assertEqual(self.listener.finished, [])
+        coords = self.instance.getLocation().getExactLayerCoordinates()
+        self.assertAlmostEqual(coords.x, 1.2)
+        self.assertAlmostEqual(coords.y, 1.6)
+        self.layer.update(2)
+        self.assertEqual(self.listener.finished, ['walk'])
+        coords = self.instance.getLocation().getLayerCoordinates()
+        self.assertEqual((coords.x, coords.y), (3, 4))
+
+    def testAct(self):
+        """ Test that acts last ACTION_TIME unless they repeat"""
+        self.instance.act('stand', self.instance.getFacingLocation())
+        self.layer.update(headless.ACTION_TIME / 2)
+        self.assertEqual(self.listener.finished, [])
+        self.layer.update(headless.ACTION_TIME / 2)
+        self.assertEqual(self.listener.finished, ['stand'])
+        self.instance.act('stand', self.instance.getFacingLocation(), True)
+        self.layer.update(headless.ACTION_TIME * 2)
+        self.assertEqual(self.listener.finished, ['stand'])
+
+    def testLayer(self):
+        """ Test that instances are found by ID"""
+        self.assertTrue(self.layer.getInstance('PC') is self.instance)
+        self.layer.deleteInstance(self.instance)
+        self.assertEqual(self.layer.getInstance('PC'), None)
+        self.assertEqual(self.layer.getInstances(), [])
+
+class SteppedWorld(headless.HeadlessWorld):
+    """Loads map changes over several stepMapLoad calls, like
+       world.World with AsyncMapLoad on"""
+    def __init__(self, steps):
+        headless.HeadlessWorld.__init__(self)
+        self.steps = steps
+        self.pending = None
+
+    def asyncMapLoads(self):
+        return True
+
+    def startMapLoad(self, map_name, filename):
+        self.pending = [map_name, filename, self.steps]
+
+    def stepMapLoad(self):
+        self.pending[2] -= 1
+        if self.pending[2] > 0:
+            return False
+        self.loadMap(self.pending[0], self.pending[1])
+        self.pending = None
+        return True
+
+class TestHeadlessWorld(unittest.TestCase):
+    def setUp(self):
+        from scripts.objects import actors
+        if actors.fife is not headless:
+            self.skipTest('the actors use FIFE')
+        if not os.path.exists('settings.xml'):
+            shutil.copyfile('settings-dist.xml', 'settings.xml')
+        self.world, self.engine = self.createEngine(headless.HeadlessWorld())
+
+    def createEngine(self, world):
+        """@return: The world and an engine running on it"""
+        from scripts.engine import Engine
+        engine = Engine(world)
+        world.data = engine
+        engine.clock.addTickHandler(world.tick)
+        return world, engine
+
+    def mapSummary(self, world, engine):
+        """@return: What a load puts into the engine and the world"""
+        map_name = engine.game_state.current_map_name
+        return (map_name, engine.game_state.PC.ID,
+                sorted([(obj.ID, obj.__class__.__name__, obj.X, obj.Y,
+                         obj.name) for obj
+                        in engine.game_state.objects[map_name].values()]),
+                sorted(world.active_map.obj_hash.keys()))
+
+    def testLoadMap(self):
+        """ Test that a map's objects load and its NPCs act"""
+        self.engine.loadMap('main-map', 'maps/map.xml')
+        game_state = self.engine.game_state
+        self.assertEqual(game_state.PC.ID, 'PC')
+        npcs = [obj for obj in game_state.objects['main-map'].values()
+                if obj.trueAttr('NPC')]
+        self.assertTrue(npcs)
+        agent = npcs[0].behaviour.agent
+        self.assertTrue(self.world.active_map.agent_layer.getInstance(
+                                                    npcs[0].ID) is agent)
+        self.assertTrue(agent.getCurrentAction() is not None)
+        location = agent.getLocation()
+        for i in range(300):
+            self.engine.pump(self.engine.clock.step)
+        self.assertEqual(self.engine.clock.ticks, 300)
+        self.assertNotEqual(agent.getLocation().getLayerDistanceTo(location),
+                            0)
+
+    def testBatchCreation(self):
+        """ Test that creating a layer's objects in one batch gives the same
+            map as creating them one by one"""
+        self.engine.loadMap('main-map', 'maps/map.xml')
+        world, engine = self.createEngine(headless.HeadlessWorld())
+        batches = []
+        create_objects = engine.createObjects
+        def createOneByOne(layer, records):
+            batches.append(len(records))
+            for record in records:
+                create_objects(layer, [record])
+        engine.createObjects = createOneByOne
+        engine.loadMap('main-map', 'maps/map.xml')
+        self.assertTrue([count for count in batches if count > 1])
+        self.assertEqual(self.mapSummary(world, engine),
+                         self.mapSummary(self.world, self.engine))
+
+    def testStepwiseMapChange(self):
+        """ Test that a map change loaded over several pumps holds the
+            commands and ends like one loaded at once"""
+        self.engine.loadMap('main-map', 'maps/map.xml')
+        self.engine.moveToMap('map2', 'maps/map2.xml', ('2', '3'))
+        world, engine = self.createEngine(SteppedWorld(3))
+        engine.loadMap('main-map', 'maps/map.xml')
+        engine.changeMap('map2', 'maps/map2.xml', ('2', '3'))
+        ran = []
+        engine.commands.submit(ran.append, ('later',))
+        engine.pump(0)
+        self.assertTrue(engine.map_loading)
+        self.assertTrue(engine.commands.held)
+        engine.pump(0)
+        engine.pump(0)
+        self.assertEqual(ran, [])
+        engine.pump(0)
+        self.assertFalse(engine.map_loading)
+        self.assertEqual(ran, ['later'])
+        self.assertEqual(self.mapSummary(world, engine),
+                         self.mapSummary(self.world, self.engine))
+        self.assertEqual((engine.game_state.PC.behaviour.getX(),
+                          engine.game_state.PC.behaviour.getY()), (2, 3))
+
+    def testActiveObjects(self):
+        """ Test that the active objects are those of the current map"""
+        from scripts import objects
+        self.engine.loadMap('main-map', 'maps/map.xml')
+        game_state = self.engine.game_state
+        self.assertEqual(self.engine.active_objects,
+                         game_state.objects['main-map'])
+        self.assertFalse('PC' in self.engine.active_objects)
+        crate = objects.createObject({'type': 'WoodenCrate',
+                                      'id': 'extra-crate', 'xpos': 1.0,
+                                      'ypos': 1.0, 'gfx': 'crate'})
+        layer = self.world.active_map.agent_layer
+        self.engine.addObject(layer, crate, layer.createInstance('crate',
+                              headless.ExactModelCoordinate(1.0, 1.0),
+                              'extra-crate'))
+        self.assertTrue(self.engine.objectActive('extra-crate') is crate)
+        self.engine.moveToMap('map2', 'maps/map2.xml', ('2', '3'))
+        self.assertEqual(self.engine.active_objects,
+                         game_state.objects['map2'])
+        self.assertFalse(self.engine.objectActive('extra-crate'))
+        # the main map stayed loaded
+        self.engine.moveToMap('main-map', 'maps/map.xml', ('2', '3'))
+        self.assertEqual(self.engine.active_objects,
+                         game_state.objects['main-map'])
+        self.assertTrue(self.engine.objectActive('extra-crate') is crate)
+        path = tempfile.mkdtemp()
+        try:
+            self.engine.save(path, 'active.dat')
+            self.engine.load(path, 'active.dat')
+        finally:
+            shutil.rmtree(path)
+        game_state = self.engine.game_state
+        self.assertEqual(self.engine.active_objects,
+                         game_state.objects['main-map'])
+        self.assertTrue('extra-crate' in self.engine.active_objects)
+        self.assertFalse('PC' in self.engine.active_objects)
+
+    def testTeleport(self):
+        """ Test that the PC is put on the given position"""
+        self.engine.loadMap('main-map', 'maps/map.xml')
+        self.world.teleport(('2', '3'))
+        self.assertEqual((self.engine.game_state.PC.behaviour.getX(),
+                          self.engine.game_state.PC.behaviour.getY()), (2, 3))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,85 @@
+#!/usr/bin/python
+
+#   This file is part of PARPG.
+
+#   PARPG is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+
+#   PARPG is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+
+#   You should have received a copy of the GNU General Public License
+#   along with PARPG.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import shutil
+import tempfile
+import unittest
+import fifestub
+fifestub.install()
+from local_loaders import loaders
+
+class TestImportRegistry(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.registry = loaders.ImportRegistry()
+        self.reads = []
+        digest = self.registry._digest
+        def countingDigest(path):
+            self.reads.append(path)
+            return digest(path)
+        self.registry._digest = countingDigest
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def writeFile(self, name, text):
+        path = os.path.join(self.dir, name)
+        f = open(path, 'w')
+        f.write(text)
+        f.close()
+        return path
+
+    def touch(self, path):
+        mtime = os.stat(path).st_mtime + 10
+        os.utime(path, (mtime, mtime))
+
+    def testHitsAndMisses(self):
+        """ Test that a file is hashed once per import and counted"""
+        path = self.writeFile('crate.xml', '<object id="crate"/>')
+        self.assertFalse(self.registry.isImported(path))
+        self.registry.add(path)
+        self.assertEqual(self.reads, [path])
+        self.assertTrue(self.registry.isImported(path))
+        self.assertEqual(self.reads, [path])
+        self.assertEqual((self.registry.hits, self.registry.misses), (1, 1))
+
+    def testChanges(self):
+        """ Test that only a changed file is imported again"""
+        path = self.writeFile('crate.xml', '<object id="crate"/>')
+        self.registry.isImported(path)
+        self.registry.add(path)
+        self.touch(path)
+        self.assertTrue(self.registry.isImported(path))
+        self.writeFile('crate.xml', '<object id="barrel"/>')
+        self.touch(path)
+        self.assertFalse(self.registry.isImported(path))
+        self.assertEqual((self.registry.hits, self.registry.misses), (1, 2))
+
+    def testSameContent(self):
+        """ Test that a copy under another path is not imported again"""
+        path = self.writeFile('crate.xml', '<object id="crate"/>')
+        copy = self.writeFile('copy.xml', '<object id="crate"/>')
+        self.registry.isImported(path)
+        self.registry.add(path)
+        self.assertTrue(self.registry.isImported(copy))
+        self.assertTrue(self.registry.isImported(
+                                    os.path.join(self.dir, '.', 'copy.xml')))
+        self.assertEqual((self.registry.hits, self.registry.misses), (2, 1))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -15,8 +15,14 @@
 # You should have received a copy of the GNU General Public License
 # along with PARPG.  If not, see <http://www.gnu.org/licenses/>.
 
+import pickle
 import unittest
-from scripts.objects.base import Living
+from scripts.objects.base import GameObject, Living
+
+class Creature(GameObject, Living):
+    def __init__(self, ID, **kwargs):
+        GameObject.__init__(self, ID, **kwargs)
+        Living.__init__(self, **kwargs)
 
 class  TestLiving(unittest.TestCase):
 
@@ -26,6 +32,25 @@ class  TestLiving(unittest.TestCase):
         creature.die()
         self.assertFalse(creature.is_living)
 
+    def testFlag(self):
+        """ Test that dying clears the living bit, also after pickling"""
+        creature = Creature(1)
+        self.assertTrue(creature.trueAttr('living'))
+        creature.die()
+        self.assertFalse(creature.trueAttr('living'))
+        self.assertFalse('is_living' in creature.__dict__)
+        creature.is_living = True
+        copy = pickle.loads(pickle.dumps(creature))
+        self.assertTrue(copy.trueAttr('living'))
+
+    def testOldPickle(self):
+        """ Test that is_ attributes of old pickles become bits"""
+        creature = Creature.__new__(Creature)
+        creature.__setstate__({'ID': 1, 'X': 0.0, 'Y': 0.0,
+                               'is_living': False, 'name': 'Old'})
+        self.assertFalse(creature.is_living)
+        self.assertFalse('is_living' in creature.__dict__)
+
 if __name__ == '__main__':
     unittest.main()
 
@@ -0,0 +1,57 @@
+#!/usr/bin/python
+
+#   This file is part of PARPG.
+
+#   PARPG is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+
+#   PARPG is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+
+#   You should have received a copy of the GNU General Public License
+#   along with PARPG.  If not, see <http://www.gnu.org/licenses/>.
+
+import unittest
+import fifestub
+fifestub.install()
+from scripts.map import MapSettings
+
+class Settings(object):
+    """Stands in for settings.Setting"""
+    def __init__(self, values):
+        self.values = values
+        self.reads = []
+
+    def readSetting(self, name, default=None):
+        self.reads.append(name)
+        return self.values.get(name, default)
+
+class TestMapSettings(unittest.TestCase):
+    def testValues(self):
+        """ Test that the settings are converted once"""
+        settings = Settings({'MapLoadTime': '20', 'AsyncMapLoad': '0',
+                             'ResidentMaps': '0', 'MapChunkSize': '8'})
+        map_settings = MapSettings(settings)
+        self.assertEqual(map_settings.load_time, 0.02)
+        self.assertFalse(map_settings.async_load)
+        self.assertEqual(map_settings.resident_maps, 1)
+        self.assertEqual(map_settings.chunk_size, 8.0)
+        self.assertEqual(len(settings.reads), len(set(settings.reads)))
+
+    def testDefaults(self):
+        """ Test that settings missing from an old settings.xml get the
+            defaults of settings-dist.xml"""
+        map_settings = MapSettings(Settings({}))
+        self.assertTrue(map_settings.cache)
+        self.assertEqual(map_settings.import_workers, 4)
+        self.assertEqual(map_settings.chunk_radius, 2)
+        self.assertEqual(map_settings.chunk_load_time, 0.004)
+        self.assertEqual(map_settings.resident_instances, 20000)
+        self.assertEqual(map_settings.profile_file, None)
+
+if __name__ == '__main__':
+    unittest.main()
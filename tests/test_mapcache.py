@@ -0,0 +1,159 @@
+#!/usr/bin/python
+
+#   This file is part of PARPG.
+
+#   PARPG is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+
+#   PARPG is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+
+#   You should have received a copy of the GNU General Public License
+#   along with PARPG.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import shutil
+import tempfile
+import unittest
+from StringIO import StringIO
+from local_loaders import mapcache
+
+MAP_XML = """<?xml version="1.0" encoding="ascii"?>
+<map id="test-map" format="1.0">
+  <import file="../objects/objects/crate/crate.xml"/>
+  <layer grid_type="square" id="ObjectLayer" x_scale="1" y_scale="1"
+         rotation="0.0" x_offset="0.0" y_offset="0.0" pathing="freeform">
+    <instances>
+      <i x="1.0" o="crate" z="0.0" y="-2.5" r="90" ns="PARPG"/>
+      <i o="crate" y="3.0" stackpos="2"/>
+      <i x="-3.0" o="crate" y="-4.0" id="crate01" object_type="WoodenCrate"
+         name="A dirty old crate" is_open="False"/>
+    </instances>
+  </layer>
+  <camera id="main" ref_layer_id="ObjectLayer" ref_cell_width="72"
+          ref_cell_height="38" tilt="-60.0" rotation="45.0"/>
+</map>
+"""
+
+class ArchiveVFS(object):
+    """Stands in for a FIFE VFS serving files out of an archive"""
+    def __init__(self, files):
+        self.files = files
+
+    def exists(self, filename):
+        return filename in self.files
+
+    def open(self, filename):
+        return StringIO(self.files[filename])
+
+class TestMapCache(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'map.xml')
+        self.writeMap(MAP_XML)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def writeMap(self, text):
+        f = open(self.path, 'w')
+        f.write(text)
+        f.close()
+
+    def testCompile(self):
+        """ Test that a compiled map keeps all the map's records"""
+        mapcache.compileMap(self.path)
+        cache = mapcache.openMapCache(self.path)
+        self.assertNotEqual(cache, None)
+        self.assertEqual(cache.mapAttributes(),
+                         {'id':'test-map', 'format':'1.0'})
+        self.assertEqual(list(cache.imports()),
+                         [{'file':'../objects/objects/crate/crate.xml'}])
+
+        layers = list(cache.layers())
+        self.assertEqual(len(layers), 1)
+        attributes, first, count = layers[0]
+        self.assertEqual(attributes['id'], 'ObjectLayer')
+        self.assertEqual(attributes['pathing'], 'freeform')
+        self.assertEqual((first, count), (0, 3))
+
+        instances = list(cache.instances(first, count))
+        self.assertEqual(instances[0],
+                         ('crate', 'PARPG', 1.0, -2.5, 0.0, 90, None, '', None))
+        self.assertEqual(instances[1],
+                         ('crate', None, None, 3.0, 0.0, None, 2, '', None))
+        self.assertEqual(instances[2][:8],
+                         ('crate', None, -3.0, -4.0, 0.0, None, None,
+                          'crate01'))
+        self.assertEqual(instances[2][8],
+                         {'object_type':'WoodenCrate',
+                          'name':'A dirty old crate', 'is_open':'False'})
+
+        cameras = list(cache.cameras())
+        self.assertEqual(cameras[0]['ref_cell_width'], '72')
+        self.assertEqual(cameras[0].get('viewport'), None)
+        cache.close()
+
+    def touchMap(self):
+        mtime = os.stat(self.path).st_mtime + 10
+        os.utime(self.path, (mtime, mtime))
+
+    def testStale(self):
+        """ Test that a cache is not used after the map changed"""
+        self.assertEqual(mapcache.openMapCache(self.path), None)
+        mapcache.compileMap(self.path)
+
+        # a new modification time alone does not invalidate the cache
+        self.touchMap()
+        cache = mapcache.openMapCache(self.path)
+        self.assertNotEqual(cache, None)
+        cache.close()
+
+        self.writeMap(MAP_XML.replace('test-map', 'new-map!'))
+        self.touchMap()
+        self.assertEqual(mapcache.openMapCache(self.path), None)
+
+    def testRefreshSignature(self):
+        """ Test that an unchanged map is hashed only once after a touch"""
+        mapcache.compileMap(self.path)
+        self.touchMap()
+        mapcache.openMapCache(self.path).close()
+        cache = mapcache.MapCache(mapcache.cachePath(self.path))
+        self.assertEqual(cache.mtime, os.stat(self.path).st_mtime)
+        cache.close()
+
+    def testTruncated(self):
+        """ Test that a cut short cache counts as missing"""
+        filename = mapcache.compileMap(self.path)
+        f = open(filename, 'rb')
+        data = f.read()
+        f.close()
+        for length in (10, len(data) / 2, len(data) - 1):
+            f = open(filename, 'wb')
+            f.write(data[:length])
+            f.close()
+            self.assertEqual(mapcache.openMapCache(self.path), None)
+
+    def testVFS(self):
+        """ Test that the cache of a map in an archive is read through the
+            VFS"""
+        f = open(mapcache.compileMap(self.path), 'rb')
+        data = f.read()
+        f.close()
+        path = 'archive/map.xml'
+        vfs = ArchiveVFS({path: MAP_XML,
+                          mapcache.cachePath(path): data})
+        self.assertEqual(mapcache.openMapCache(path), None)
+        cache = mapcache.openMapCache(path, vfs)
+        self.assertNotEqual(cache, None)
+        self.assertEqual(cache.mapAttributes()['id'], 'test-map')
+        cache.close()
+        vfs.files[path] = MAP_XML.replace('test-map', 'new-map!')
+        self.assertEqual(mapcache.openMapCache(path, vfs), None)
+
+if __name__ == '__main__':
+    unittest.main()
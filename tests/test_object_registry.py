@@ -0,0 +1,77 @@
+#!/usr/bin/python
+
+#   This file is part of PARPG.
+
+#   PARPG is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+
+#   PARPG is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+
+#   You should have received a copy of the GNU General Public License
+#   along with PARPG.  If not, see <http://www.gnu.org/licenses/>.
+
+import unittest
+from scripts import objects
+from scripts.objects.base import GameObject, Carryable
+from scripts.objects.containers import WoodenCrate
+
+class Stone(GameObject, Carryable):
+    def __init__(self, ID, weight=2.0, **kwargs):
+        GameObject.__init__(self, ID, **kwargs)
+        Carryable.__init__(self, **kwargs)
+        self.weight = weight
+
+class Marker(GameObject):
+    def __init__(self, ID, name='Marker'):
+        GameObject.__init__(self, ID, name=name)
+
+class Signpost(Marker):
+    def __init__(self, ID, text='', **kwargs):
+        Marker.__init__(self, ID, **kwargs)
+        self.text = text
+
+class TestObjectRegistry(unittest.TestCase):
+    def tearDown(self):
+        objects.object_classes.pop('Stone', None)
+        objects.object_classes.pop('Marker', None)
+
+    def testRegistered(self):
+        """ Test that the concrete classes are registered once"""
+        self.assertTrue(objects.getAllObjects()['WoodenCrate'] is WoodenCrate)
+        self.assertTrue(objects.getAllObjects() is not objects.object_classes)
+
+    def testKeywords(self):
+        """ Test that the keywords of the bases' constructors count"""
+        keywords = objects.constructorKeywords(WoodenCrate)
+        self.assertTrue('locked' in keywords)
+        self.assertTrue('xpos' in keywords)
+        self.assertFalse('target_map' in keywords)
+        self.assertEqual(objects.constructorKeywords(Marker),
+                         frozenset(['ID', 'name']))
+
+    def testKeywordsBase(self):
+        """ Test that the walk goes on through a constructor taking
+            **kwargs and stops after the first one that does not"""
+        self.assertEqual(objects.constructorKeywords(Signpost),
+                         frozenset(['ID', 'name', 'text']))
+
+    def testCreateObject(self):
+        """ Test that unknown attributes are left out"""
+        objects.registerObject(Stone)
+        objects.registerObject(Marker)
+        stone = objects.createObject({'type': 'Stone', 'id': 's1',
+                                      'weight': 3.0, 'xpos': 2.0,
+                                      'target_map': 'map.xml'},
+                                     {'engine': None})
+        self.assertEqual((stone.ID, stone.weight, stone.X), ('s1', 3.0, 2.0))
+        marker = objects.createObject({'type': 'Marker', 'id': 'm1',
+                                       'xpos': 1.0, 'name': 'Here'})
+        self.assertEqual(marker.name, 'Here')
+
+if __name__ == '__main__':
+    unittest.main()
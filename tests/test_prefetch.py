@@ -0,0 +1,69 @@
+#!/usr/bin/python
+
+#   This file is part of PARPG.
+
+#   PARPG is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+
+#   PARPG is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+
+#   You should have received a copy of the GNU General Public License
+#   along with PARPG.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+import fifestub
+fifestub.install()
+from local_loaders import mapcache
+# loaders first, the prefetcher imports it while staging
+from local_loaders import loaders, prefetch
+
+class TestMapPrefetcher(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'shanty.xml')
+        shutil.copyfile('maps/shanty.xml', self.path)
+        self.prefetcher = prefetch.MapPrefetcher()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def waitFor(self, path):
+        while self.prefetcher.isLoading(path):
+            threading.Event().wait(0.01)
+
+    def testMapCacheSetting(self):
+        """ Test that the map cache is only used if it is enabled"""
+        mapcache.compileMap(self.path)
+        self.prefetcher.prefetch(self.path)
+        self.waitFor(self.path)
+        self.assertNotEqual(self.prefetcher.take(self.path).root, None)
+        self.prefetcher.prefetch(self.path, cache=True)
+        self.waitFor(self.path)
+        self.assertEqual(self.prefetcher.take(self.path).root, None)
+
+    def testTakeRunning(self):
+        """ Test that taking a map that is still prefetched does not wait"""
+        release = threading.Event()
+        stage = self.prefetcher._stage
+        def slowStage(*args):
+            release.wait()
+            return stage(*args)
+        self.prefetcher._stage = slowStage
+        self.prefetcher.prefetch(self.path)
+        self.assertEqual(self.prefetcher.take(self.path), None)
+        self.assertTrue(self.prefetcher.isLoading(self.path))
+        release.set()
+        self.waitFor(self.path)
+        self.assertNotEqual(self.prefetcher.take(self.path), None)
+
+if __name__ == '__main__':
+    unittest.main()
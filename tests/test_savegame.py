@@ -0,0 +1,223 @@
+#!/usr/bin/python
+
+#   This file is part of PARPG.
+
+#   PARPG is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+
+#   PARPG is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+
+#   You should have received a copy of the GNU General Public License
+#   along with PARPG.  If not, see <http://www.gnu.org/licenses/>.
+
+import cPickle
+import os
+import shutil
+import tempfile
+import unittest
+from StringIO import StringIO
+from scripts import savegame
+from scripts.gamestate import GameState
+from scripts.objects.base import GameObject, Openable
+
+class Door(GameObject, Openable):
+    def __init__(self, ID, **kwargs):
+        GameObject.__init__(self, ID, **kwargs)
+        Openable.__init__(self, **kwargs)
+
+class TestSaveGame(unittest.TestCase):
+    def setUp(self):
+        self.state = GameState()
+        self.state.current_map_name = 'town'
+        self.state.current_map_file = 'maps/town.xml'
+        self.state.PC = GameObject('PC', xpos=1, ypos=2)
+        self.state.play_time = 90.0
+        for map_id, count in (('town', 3), ('shanty', 2)):
+            for i in range(count):
+                obj = GameObject('%s%d' % (map_id, i), xpos=i, ypos=i)
+                self.state.addObject(obj, map_id)
+
+    def saved(self):
+        save_file = StringIO()
+        savegame.saveGame(save_file, self.state)
+        save_file.seek(0)
+        return save_file
+
+    def testChunks(self):
+        """ Test that a save holds one chunk per map and reads them back"""
+        save_file = StringIO()
+        writer = savegame.SaveWriter(save_file)
+        writer.writeChunk('a', [1, 2])
+        writer.writeRawChunk('b', savegame.packChunk({'x': 3}))
+        save_file.seek(0)
+        reader = savegame.SaveReader(save_file)
+        self.assertEqual(reader.version, savegame.FORMAT_VERSION)
+        self.assertEqual(reader.names(), ['a', 'b'])
+        self.assertEqual(reader.readChunk('b'), {'x': 3})
+        self.assertEqual(reader.readChunk('a'), [1, 2])
+        reader = savegame.SaveReader(self.saved())
+        self.assertEqual(reader.names(),
+                         ['state', 'pc', 'map:shanty', 'map:town'])
+
+    def testLoadIsLazy(self):
+        """ Test that map objects are only unpacked when restored"""
+        state = savegame.loadGame(self.saved())
+        self.assertEqual(state.current_map_name, 'town')
+        self.assertEqual(state.PC.coords, (1, 2))
+        self.assertEqual(state.objects, {})
+        self.assertEqual(sorted(state.saved_maps.keys()), ['shanty', 'town'])
+        state.restoreMap('town')
+        self.assertEqual(sorted(state.objects['town'].keys()),
+                         ['town0', 'town1', 'town2'])
+        self.assertEqual(
+            len(state.getObjectsInRadius(2, 2, 0.5, 'town')), 1)
+        self.assertFalse('town' in state.saved_maps)
+
+    def testUntouchedMapsAreCopied(self):
+        """ Test that a map not entered since loading is saved as read"""
+        state = savegame.loadGame(self.saved())
+        raw = state.saved_maps['shanty']
+        state.restoreMap('town')
+        self.state = state
+        reader = savegame.SaveReader(self.saved())
+        self.assertEqual(reader.readRawChunk('map:shanty'), raw)
+        self.assertEqual(len(reader.readChunk('map:town')), 3)
+
+    def testLegacySave(self):
+        """ Test that a pickled game state still loads"""
+        save_file = StringIO(cPickle.dumps(self.state))
+        state = savegame.loadGame(save_file)
+        self.assertEqual(sorted(state.objects['shanty'].keys()),
+                         ['shanty0', 'shanty1'])
+        self.assertEqual(state.saved_maps, {})
+
+    def testNewerVersion(self):
+        """ Test that saves of a newer format are refused"""
+        save_file = StringIO()
+        savegame.SaveWriter(save_file, version=savegame.FORMAT_VERSION + 1)
+        save_file.seek(0)
+        self.assertRaises(ValueError, savegame.loadGame, save_file)
+
+    def testInfo(self):
+        """ Test that the info block is read without the chunks"""
+        save_file = StringIO()
+        savegame.saveGame(save_file, self.state, thumbnail='png')
+        save_file.seek(0)
+        info = savegame.readInfo(save_file)
+        self.assertEqual((info.map_name, info.play_time, info.pc_position),
+                         (u'town', 90.0, (1.0, 2.0)))
+        self.assertEqual((info.version, info.thumbnail),
+                         (savegame.FORMAT_VERSION, ''))
+        self.assertEqual(save_file.tell(),
+                         savegame.HEADER.size + savegame.INFO.size + 4 + 3)
+        save_file.seek(0)
+        self.assertEqual(savegame.readInfo(save_file, True).thumbnail, 'png')
+        save_file.seek(0)
+        reader = savegame.SaveReader(save_file)
+        self.assertEqual(reader.info.map_name, u'town')
+        save_file.seek(0)
+        self.assertEqual(savegame.loadGame(save_file).play_time, 90.0)
+
+    def testLongMapName(self):
+        """ Test that long map names are kept whole"""
+        self.state.current_map_name = u'a very long map name ' * 5
+        save_file = StringIO()
+        savegame.saveGame(save_file, self.state)
+        save_file.seek(0)
+        self.assertEqual(savegame.readInfo(save_file).map_name,
+                         self.state.current_map_name)
+
+    def testDamagedSave(self):
+        """ Test that a damaged save fails to load with a ValueError"""
+        data = self.saved().getvalue()
+        reader = savegame.SaveReader(self.saved())
+        offset, length = reader.chunks['pc']
+        damaged = data[:offset + 10] + 'x' * 8 + data[offset + 18:]
+        self.assertRaises(ValueError, savegame.loadGame, StringIO(damaged))
+        reader = savegame.SaveReader(StringIO(data[:offset - 20]))
+        self.assertRaises(ValueError, reader.readChunk, 'pc')
+        legacy = cPickle.dumps(self.state)
+        self.assertRaises(ValueError, savegame.loadGame,
+                          StringIO(legacy[:len(legacy) / 2]))
+
+    def testOldInfo(self):
+        """ Test the info of a pickled save"""
+        info = savegame.readInfo(StringIO(cPickle.dumps(self.state)))
+        self.assertEqual((info.version, info.map_name), (0, ''))
+
+    def testIndex(self):
+        """ Test that the save index caches and sorts the infos"""
+        path = tempfile.mkdtemp()
+        try:
+            for name, map_name in (('a.dat', 'town'), ('b.dat', 'shanty')):
+                self.state.current_map_name = map_name
+                savegame.writeSaveFile(os.path.join(path, name), self.state)
+            index = savegame.SaveIndex()
+            saves = index.listSaves(path, ['a.dat', 'b.dat'], 'map_name',
+                                    False)
+            self.assertEqual([name for name, info in saves],
+                             ['b.dat', 'a.dat'])
+            info = index.getInfo(os.path.join(path, 'a.dat'))
+            self.assertTrue(info is saves[1][1])
+            saves = index.listSaves(path, ['a.dat', 'b.dat'], 'name', True)
+            self.assertEqual([name for name, info in saves],
+                             ['b.dat', 'a.dat'])
+            self.assertEqual(index.getInfo(os.path.join(path, 'c.dat')),
+                             None)
+        finally:
+            shutil.rmtree(path)
+
+    def testDirtyTracking(self):
+        """ Test that changed objects are recorded until a full save"""
+        self.assertEqual(self.state.dirty['shanty'],
+                         set(['shanty0', 'shanty1']))
+        self.state.markSaved('full.dat', 1.0)
+        self.assertEqual(self.state.dirty['town'], set())
+        door = Door('door')
+        self.state.addObject(door, 'town')
+        self.state.objects['town']['town1'].coords = (5, 5)
+        self.state.markSaved('full.dat', 1.0)
+        door.close()
+        self.assertEqual(self.state.dirty['town'], set(['door']))
+        self.assertEqual(self.state.dirty['shanty'], set())
+
+    def testDeltaSave(self):
+        """ Test that a delta save holds only the changes"""
+        path = tempfile.mkdtemp()
+        try:
+            full_name = os.path.join(path, 'full.dat')
+            delta_name = os.path.join(path, 'delta.dat')
+            info = savegame.writeSaveFile(full_name, self.state)
+            self.state.markSaved(full_name, info.timestamp)
+            self.state.objects['town']['town2'].X = 7
+            self.state.play_time = 120.0
+            base = savegame.deltaBase(self.state, delta_name)
+            self.assertEqual(base, ('full.dat', info.timestamp))
+            self.assertEqual(savegame.deltaBase(self.state, full_name), None)
+            savegame.writeSaveFile(delta_name, self.state, base=base)
+            reader = savegame.SaveReader(open(delta_name, 'rb'))
+            self.assertEqual(reader.names(), ['state', 'pc', 'delta:town'])
+            self.assertEqual(reader.readChunk('delta:town').keys(), ['town2'])
+
+            state = savegame.loadGame(open(delta_name, 'rb'), delta_name)
+            self.assertEqual(state.play_time, 120.0)
+            self.assertEqual(state.objects['town']['town2'].X, 7)
+            self.assertEqual(len(state.objects['town']), 3)
+            self.assertEqual(state.dirty['town'], set(['town2']))
+            self.assertEqual(state.base_save, (full_name, info.timestamp))
+            self.assertTrue('shanty' in state.saved_maps)
+
+            # a new save under the name of the base breaks the delta
+            savegame.writeSaveFile(full_name, self.state)
+            self.assertRaises(ValueError, savegame.loadGame,
+                              open(delta_name, 'rb'), delta_name)
+        finally:
+            shutil.rmtree(path)
+
+if __name__ == '__main__':
+    unittest.main()
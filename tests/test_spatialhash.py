@@ -0,0 +1,71 @@
+#!/usr/bin/python
+
+#   This file is part of PARPG.
+
+#   PARPG is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+
+#   PARPG is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+
+#   You should have received a copy of the GNU General Public License
+#   along with PARPG.  If not, see <http://www.gnu.org/licenses/>.
+
+import pickle
+import unittest
+from scripts.objects.base import GameObject
+from scripts.spatialhash import SpatialHash
+
+class TestSpatialHash(unittest.TestCase):
+    def setUp(self):
+        self.index = SpatialHash(4)
+        self.near = GameObject('near', xpos=1.0, ypos=1.0)
+        self.edge = GameObject('edge', xpos=4.0, ypos=0.0)
+        self.far = GameObject('far', xpos=-10.0, ypos=20.0)
+        for obj in (self.near, self.edge, self.far):
+            self.index.insert(obj)
+
+    def ids(self, objects):
+        return sorted([obj.ID for obj in objects])
+
+    def testQueries(self):
+        """ Test the cell, rectangle and radius queries"""
+        self.assertEqual(len(self.index), 3)
+        self.assertEqual(self.ids(self.index.objectsInCell(3.9, 0)), ['near'])
+        self.assertEqual(self.ids(self.index.objectsInRect(0, 0, 4, 1)),
+                         ['edge', 'near'])
+        self.assertEqual(self.ids(self.index.objectsInRect(100, 100, -100, -100)),
+                         ['edge', 'far', 'near'])
+        self.assertEqual(self.ids(self.index.objectsInRadius(0, 0, 3)),
+                         ['near'])
+        self.assertEqual(self.ids(self.index.objectsInRadius(0, 0, 4)),
+                         ['edge', 'near'])
+
+    def testMove(self):
+        """ Test that coordinate changes move objects between cells"""
+        self.far.coords = (0.5, 0.5)
+        self.assertEqual(self.ids(self.index.objectsInCell(0, 0)),
+                         ['far', 'near'])
+        self.near.X = 9.0
+        self.assertEqual(self.ids(self.index.objectsInCell(0, 0)), ['far'])
+        self.assertEqual(self.ids(self.index.objectsInCell(8, 0)), ['near'])
+
+        self.index.remove(self.near)
+        self.assertFalse(self.near in self.index)
+        self.near.Y = 3.0
+        self.assertEqual(self.index.objectsInCell(8, 0), [])
+
+    def testPickle(self):
+        """ Test that a pickled index still follows its objects"""
+        index = pickle.loads(pickle.dumps(self.index))
+        near = index.objectsInCell(0, 0)[0]
+        near.Y = 30.0
+        self.assertEqual(self.ids(index.objectsInCell(0, 28)), ['near'])
+        self.assertEqual(self.ids(self.index.objectsInCell(0, 0)), ['near'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,307 @@
+#!/usr/bin/python
+
+#   This file is part of PARPG.
+
+#   PARPG is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+
+#   PARPG is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+
+#   You should have received a copy of the GNU General Public License
+#   along with PARPG.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import shutil
+import tempfile
+import unittest
+from StringIO import StringIO
+import fifestub
+fifestub.install()
+from local_loaders import mapcache
+# loaders first, it and xmlmap import each other
+from local_loaders import loaders, xmlmap
+
+MAPS = ('maps/map.xml', 'maps/map2.xml', 'maps/shanty.xml')
+
+CHUNKED_MAP = """<?xml version="1.0" encoding="ascii"?>
+<map id="chunked-map" format="1.0">
+  <layer grid_type="square" id="ObjectLayer">
+    <instances>
+      <i o="grass" ns="PARPG" x="0.0" y="0.0"/>
+      <i o="wall" x="1.0" y="0.0"/>
+      <i o="grass" x="20.0" y="0.0"/>
+      <i o="wall" x="21.0" y="0.0"/>
+      <i o="grass" x="22.0" y="0.0" id="named-grass"/>
+    </instances>
+  </layer>
+</map>
+"""
+
+MIXED_MAP = """<?xml version="1.0" encoding="ascii"?>
+<map id="mixed-map" format="1.0">
+  <layer grid_type="square" id="ObjectLayer">
+    <instances>
+      <i o="a" ns="PARPG" x="1.0" y="0.0"/>
+      <instance o="b" y="0.0"/>
+      <i o="c" y="0.0"/>
+      <inst o="d" y="1.0"/>
+    </instances>
+  </layer>
+</map>
+"""
+
+REPEATED_MAP = """<?xml version="1.0" encoding="ascii"?>
+<map id="repeated-map" format="1.0">
+  <layer grid_type="square" id="ObjectLayer">
+    <instances>
+      <i o="crate" ns="PARPG" x="0.0" y="0.0" r="90"/>
+      <i o="crate" x="1.0" y="0.0"/>
+      <i o="ghost" x="2.0" y="0.0"/>
+      <i o="ghost" x="3.0" y="0.0"/>
+      <instance object="crate" namespace="PARPG" x="4.0" y="0.0" rotation="180"/>
+      <instance object="crate" namespace="PARPG" x="5.0" y="0.0" rotation="270"/>
+    </instances>
+  </layer>
+</map>
+"""
+
+class StaticObject(object):
+    """Stands in for a FIFE object"""
+    def __init__(self, id):
+        self.id = id
+
+    def get2dGfxVisual(self):
+        return self
+
+    def getStaticImageAngles(self):
+        return (0,)
+
+    def getAction(self, action):
+        return None
+
+    def isBlocking(self):
+        return self.id.startswith('wall')
+
+class Model(object):
+    def __init__(self):
+        self.lookups = []
+
+    def getObject(self, id, nspace):
+        self.lookups.append((id, nspace))
+        if id == 'ghost':
+            return None
+        return StaticObject(id)
+
+class VFS(object):
+    def exists(self, path):
+        return os.path.exists(path)
+
+    def open(self, path):
+        f = open(path, 'rb')
+        try:
+            return StringIO(f.read())
+        finally:
+            f.close()
+
+class Engine(object):
+    """The parts of the FIFE engine the map loader uses"""
+    def __init__(self):
+        self.vfs = VFS()
+        self.model = Model()
+
+    def getVFS(self):
+        return self.vfs
+
+    def getModel(self):
+        return self.model
+
+    def getImagePool(self):
+        return None
+
+    def getAnimationPool(self):
+        return None
+
+class Map(object):
+    pass
+
+class Layer(str):
+    """Stands in for a FIFE layer, compares like its id"""
+    def getId(self):
+        return str(self)
+
+class Data(object):
+    def __init__(self, log):
+        self.log = log
+
+    def createObjects(self, layer, records):
+        for inst_dict, instance in records:
+            self.log.append(('object', layer, sorted(inst_dict.items()),
+                             instance))
+
+class RecordingLoader(object):
+    """Writes down what an XMLMapLoader creates, in order, instead of
+       building FIFE maps"""
+    def __init__(self, stream, cache=False, chunk_size=0):
+        self.log = []
+        self.loader = xmlmap.XMLMapLoader(Engine(), Data(self.log), None,
+                                          stream, cache,
+                                          chunk_size=chunk_size)
+        self.loader.createMap = self.createMap
+        self.loader.parseImport = self.parseImport
+        self.loader.parseLayer = self.parseLayer
+        self.loader.parseCamera = self.parseCamera
+
+    def load(self, path, whole=False):
+        """Loads a map step by step, or with loadResource if whole is set.
+           The log length after each step is kept in sizes."""
+        place_instance = xmlmap.placeInstance
+        xmlmap.placeInstance = self.placeInstance
+        self.sizes = []
+        location = xmlmap.fife.ResourceLocation(path)
+        try:
+            if whole:
+                self.loader.loadResource(location)
+            else:
+                for step in self.loader.loadSteps(location):
+                    self.sizes.append(len(self.log))
+        finally:
+            xmlmap.placeInstance = place_instance
+        return self.log
+
+    def createMap(self, map_elt):
+        self.log.append(('map', map_elt.get('id')))
+        self.loader.map = Map()
+        self.loader.map.importDirs = []
+        return self.loader.map
+
+    def parseImport(self, item, map, parsed_imports):
+        self.log.append(('import', item.get('file'), item.get('dir')))
+
+    def parseLayer(self, layer, map):
+        self.log.append(('layer', layer.get('id')))
+        return Layer(layer.get('id'))
+
+    def parseCamera(self, camera, map):
+        self.log.append(('camera', sorted(camera.items())))
+
+    def placeInstance(self, layer, object, x, y, z, rotation, stackpos, id,
+                      default_action):
+        self.log.append(('instance', layer, object.id, x, y, z, rotation,
+                         stackpos, id))
+        return id
+
+class TestXMLMapLoader(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def copyMap(self, path):
+        copy = os.path.join(self.dir, os.path.basename(path))
+        shutil.copyfile(path, copy)
+        return copy
+
+    def testModesMatch(self):
+        """ Test that stream mode builds the same maps as tree mode"""
+        for path in MAPS:
+            tree = RecordingLoader(False).load(path)
+            stream = RecordingLoader(True).load(path)
+            self.assertTrue([entry for entry in tree
+                             if entry[0] == 'instance'])
+            self.assertTrue([entry for entry in tree if entry[0] == 'camera'])
+            self.assertEqual(tree, stream)
+
+    def testMixedTags(self):
+        """ Test that instances are created in document order"""
+        path = os.path.join(self.dir, 'mixed.xml')
+        f = open(path, 'w')
+        f.write(MIXED_MAP)
+        f.close()
+        for stream in (False, True):
+            log = RecordingLoader(stream).load(path)
+            self.assertEqual([entry[2:4] for entry in log
+                              if entry[0] == 'instance'],
+                             [('a', 1.0), ('b', 2.0), ('c', 3.0), ('d', 4.0)])
+        mapcache.compileMap(path)
+        self.assertEqual(RecordingLoader(False, True).load(path), log)
+
+    def testObjectCache(self):
+        """ Test that each object is looked up once per load and that the
+            attribute aliases are resolved per attribute set"""
+        path = os.path.join(self.dir, 'repeated.xml')
+        f = open(path, 'w')
+        f.write(REPEATED_MAP)
+        f.close()
+        for stream in (False, True):
+            recorder = RecordingLoader(stream)
+            log = recorder.load(path)
+            self.assertEqual([(entry[2], entry[3], entry[6]) for entry in log
+                              if entry[0] == 'instance'],
+                             [('crate', 0.0, 90), ('crate', 1.0, 0),
+                              ('crate', 4.0, 180), ('crate', 5.0, 270)])
+            loader = recorder.loader
+            self.assertEqual(loader.model.lookups,
+                             [('crate', 'PARPG'), ('ghost', 'PARPG')])
+            self.assertEqual(loader.profile.layers[0]['skipped'], 2)
+            self.assertTrue(('object', 'namespace', 'rotation')
+                            in loader.shapes.values())
+
+    def testLoadSteps(self):
+        """ Test that a stepwise load builds the map a bit at a time and
+            ends like a load in one go, in every mode"""
+        path = self.copyMap('maps/shanty.xml')
+        for stream, cache in ((False, False), (True, False), (False, True)):
+            whole = RecordingLoader(stream, cache).load(path, True)
+            recorder = RecordingLoader(stream, cache)
+            log = recorder.load(path)
+            self.assertEqual(log, whole)
+            sizes = recorder.sizes
+            self.assertTrue(len([size for size in sizes
+                                 if 0 < size < len(log)]) > 1)
+            self.assertEqual(sizes, sorted(sizes))
+        self.assertEqual(recorder.loader.profile.mode, 'cache')
+
+    def testChunkedBlockers(self):
+        """ Test that blocking instances are not put into chunks"""
+        path = os.path.join(self.dir, 'chunked.xml')
+        f = open(path, 'w')
+        f.write(CHUNKED_MAP)
+        f.close()
+        recorder = RecordingLoader(False, chunk_size=10)
+        log = recorder.load(path)
+        self.assertEqual([entry[2:4] for entry in log
+                          if entry[0] == 'instance'],
+                         [('wall', 1.0), ('wall', 21.0), ('grass', 22.0)])
+        chunks = recorder.loader.chunks
+        self.assertEqual(sorted([(key, len(records)) for key, records
+                                 in chunks.chunks.items()]),
+                         [(('ObjectLayer', 0, 0), 1),
+                          (('ObjectLayer', 2, 0), 1)])
+
+    def testStreamCache(self):
+        """ Test that a cache compiled while streaming equals a compiled
+            file"""
+        path = self.copyMap('maps/shanty.xml')
+        tree = RecordingLoader(False).load(path)
+        loader = RecordingLoader(True, True)
+        self.assertEqual(loader.load(path), tree)
+        self.assertEqual(loader.loader.profile.mode, 'stream')
+        f = open(mapcache.cachePath(path), 'rb')
+        streamed = f.read()
+        f.close()
+        mapcache.compileMap(path)
+        f = open(mapcache.cachePath(path), 'rb')
+        self.assertEqual(f.read(), streamed)
+        f.close()
+        loader = RecordingLoader(False, True)
+        self.assertEqual(loader.load(path), tree)
+        self.assertEqual(loader.loader.profile.mode, 'cache')
+
+if __name__ == '__main__':
+    unittest.main()